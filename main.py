@@ -1,5 +1,10 @@
 import flet as ft
 
+from src.utils.StreamingUnzip import recover_interrupted_swap
+
+# 上次应用更新被中断时先回滚到更新前的文件，再加载界面模块
+recover_interrupted_swap("./")
+
 from src.ui.splash_page import splash_page
 
 
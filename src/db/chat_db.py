@@ -9,10 +9,14 @@ from datetime import datetime
 from src.db.llm_config_db import LLMConfigDB
 from src.db.path_utils import get_app_path
 
+# 被污染的回复：模型把对话角色标签也当作内容输出
+CONTAMINATION_MARKERS = ("user\n", "assistant\n", "User:", "Assistant:")
+
 
 class ChatDB:
     def __init__(self, db_path="chat.db"):
         # db_path = os.path.join(get_app_path(), db_path)
+        self.db_path = db_path
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self._init_db()
 
@@ -38,7 +42,129 @@ class ChatDB:
                       CURRENT_TIMESTAMP
                   )
                   """)
+        # 按会话读取、删除和清理消息都走这个索引，不扫描整张表
+        c.execute("CREATE INDEX IF NOT EXISTS idx_chat_chat_id_ts ON chat(chat_id, timestamp)")
+        # 每个会话的滚动摘要，覆盖到 last_message_id 为止的消息
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS chat_summary (
+                chat_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        self.conn.commit()
+        self.fts_tokenizer = self._init_fts()
+
+    # ---------- 全文索引 ----------
+    def _init_fts(self):
+        """
+        创建 chat.content 的 FTS5 外部内容索引，并用触发器保持同步
+        优先使用 trigram 分词（支持中文任意子串），不支持时退回 unicode61；
+        SQLite 未编译 FTS5 时返回 None，搜索退回 LIKE
+        :return: 使用的分词器名称或 None
+        """
+        c = self.conn.cursor()
+        c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='chat_fts'")
+        row = c.fetchone()
+        if row:
+            return "trigram" if "trigram" in row[0] else "unicode61"
+
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                c.execute(f"""
+                    CREATE VIRTUAL TABLE chat_fts USING fts5(
+                        content, content='chat', content_rowid='id', tokenize='{tokenizer}'
+                    )
+                """)
+                break
+            except sqlite3.OperationalError:
+                continue
+        else:
+            return None
+
+        c.executescript("""
+            CREATE TRIGGER IF NOT EXISTS chat_fts_ai AFTER INSERT ON chat BEGIN
+                INSERT INTO chat_fts(rowid, content) VALUES (new.id, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chat_fts_ad AFTER DELETE ON chat BEGIN
+                INSERT INTO chat_fts(chat_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chat_fts_au AFTER UPDATE OF content ON chat BEGIN
+                INSERT INTO chat_fts(chat_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO chat_fts(rowid, content) VALUES (new.id, new.content);
+            END;
+        """)
+        # 为已有的聊天记录建立索引
+        c.execute("INSERT INTO chat_fts(chat_fts) VALUES ('rebuild')")
         self.conn.commit()
+        return tokenizer
+
+    def _fts_query(self, query):
+        """把用户输入转换为 FTS5 查询：每个词作为短语匹配，多个词同时出现"""
+        terms = [t for t in query.split() if t]
+        if self.fts_tokenizer == "trigram" and any(len(t) < 3 for t in terms):
+            # trigram 无法匹配少于3个字符的词
+            return None
+        return " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+    def search(self, query, chat_id=None, limit=20):
+        """
+        在所有会话（或指定会话）中搜索消息，按 bm25 相关度排序
+        :return: [{"id", "chat_id", "role", "snippet", "timestamp"}, ...]
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+
+        c = self.conn.cursor()
+        match = self._fts_query(query) if self.fts_tokenizer else None
+        if match:
+            sql = """
+                SELECT chat.id, chat.chat_id, chat.role,
+                       snippet(chat_fts, 0, '【', '】', '…', 24), chat.timestamp
+                FROM chat_fts JOIN chat ON chat.id = chat_fts.rowid
+                WHERE chat_fts MATCH ?
+            """
+            params = [match]
+            if chat_id is not None:
+                sql += " AND chat.chat_id = ?"
+                params.append(chat_id)
+            sql += " ORDER BY bm25(chat_fts) LIMIT ?"
+            params.append(limit)
+            c.execute(sql, params)
+        else:
+            # 没有全文索引或查询词太短时按子串匹配，结果按时间倒序
+            sql = "SELECT id, chat_id, role, content, timestamp FROM chat WHERE 1=1"
+            params = []
+            for term in query.split():
+                sql += " AND instr(content, ?) > 0"
+                params.append(term)
+            if chat_id is not None:
+                sql += " AND chat_id = ?"
+                params.append(chat_id)
+            sql += " ORDER BY id DESC LIMIT ?"
+            params.append(limit)
+            c.execute(sql, params)
+
+        results = []
+        for msg_id, msg_chat_id, role, text, timestamp in c.fetchall():
+            if not match:
+                text = self._make_snippet(text, query.split()[0])
+            results.append({"id": msg_id, "chat_id": msg_chat_id, "role": role,
+                            "snippet": text, "timestamp": timestamp})
+        return results
+
+    @staticmethod
+    def _make_snippet(text, term, width=40):
+        """截取命中位置附近的文本"""
+        pos = text.find(term)
+        if pos < 0:
+            return text[:width * 2]
+        start = max(0, pos - width)
+        end = min(len(text), pos + len(term) + width)
+        return ("…" if start > 0 else "") + text[start:pos] + "【" + term + "】" + \
+            text[pos + len(term):end] + ("…" if end < len(text) else "")
 
     def save_message(self, chat_id, role, content):
         c = self.conn.cursor()
@@ -59,8 +185,69 @@ class ChatDB:
     def delete_chat(self, chat_id):
         c = self.conn.cursor()
         c.execute("DELETE FROM chat WHERE chat_id=?", (chat_id,))
+        c.execute("DELETE FROM chat_summary WHERE chat_id=?", (chat_id,))
         self.conn.commit()
 
+    # ---------- 滚动摘要 ----------
+    def get_summary(self, chat_id):
+        """
+        :return: (摘要, 覆盖到的最后一条消息id)，没有摘要时返回 (None, 0)
+        """
+        c = self.conn.cursor()
+        c.execute("SELECT summary, last_message_id FROM chat_summary WHERE chat_id=?", (chat_id,))
+        row = c.fetchone()
+        return (row[0], row[1]) if row else (None, 0)
+
+    def save_summary(self, chat_id, summary, last_message_id):
+        c = self.conn.cursor()
+        c.execute("""
+            INSERT INTO chat_summary (chat_id, summary, last_message_id) VALUES (?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                summary = excluded.summary,
+                last_message_id = excluded.last_message_id,
+                updated_at = CURRENT_TIMESTAMP
+        """, (chat_id, summary, last_message_id))
+        self.conn.commit()
+
+    def get_messages_between(self, chat_id, after_id, before_id, limit=100):
+        """获取 after_id < id < before_id 的消息，按时间顺序"""
+        c = self.conn.cursor()
+        c.execute(
+            "SELECT id, role, content, timestamp FROM chat WHERE chat_id=? AND id>? AND id<? ORDER BY id LIMIT ?",
+            (chat_id, after_id, before_id, limit)
+        )
+        return c.fetchall()
+
+    def count_messages_between(self, chat_id, after_id, before_id):
+        c = self.conn.cursor()
+        c.execute(
+            "SELECT COUNT(*) FROM chat WHERE chat_id=? AND id>? AND id<?",
+            (chat_id, after_id, before_id)
+        )
+        return c.fetchone()[0]
+
+    def delete_contaminated_messages(self, chat_id=None, markers=CONTAMINATION_MARKERS, conn=None,
+                                     all_chats=False):
+        """
+        用一条 DELETE 语句删除包含角色标签的 assistant 消息，在同一个事务中完成
+        :param chat_id: 只清理指定会话
+        :param conn: 使用的连接，后台线程中应传入独立的连接
+        :param all_chats: 清理所有会话，chat_id 为 None 时必须显式指定
+        :return: 删除的条数
+        """
+        if chat_id is None and not all_chats:
+            raise ValueError("请指定 chat_id，或显式传入 all_chats=True 清理所有会话")
+        conn = conn or self.conn
+        sql = "DELETE FROM chat WHERE role='assistant' AND ("
+        sql += " OR ".join("instr(content, ?) > 0" for _ in markers) + ")"
+        params = list(markers)
+        if chat_id is not None:
+            sql += " AND chat_id=?"
+            params.append(chat_id)
+        with conn:
+            cursor = conn.execute(sql, params)
+        return cursor.rowcount
+
     def get_all_chat_ids(self):
         """获取所有chat_id"""
         c = self.conn.cursor()
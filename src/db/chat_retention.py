@@ -0,0 +1,315 @@
+import gzip
+import json
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+
+
+class ChatRetention:
+    """
+    聊天记录的归档与保留策略
+    - 超过保留天数没有新消息的会话整体归档为 gzip 压缩的 JSON Lines 文件，并从 chat 表删除；
+      归档需要在设置中开启，再次打开已归档的会话时自动恢复
+    - chat_archive 表保留每个已归档会话的摘要（条数、时间范围、第一个问题、归档文件）
+    - 定期执行 incremental_vacuum 回收删除后的空闲页；切换到增量模式需要完整 VACUUM，
+      只在用户手动整理数据库时执行
+    所有操作使用独立连接，可以在后台线程中运行
+    """
+
+    # KV 中记录上次执行时间的键
+    LAST_ARCHIVE_KEY = "chat_retention_last_archive"
+    LAST_VACUUM_KEY = "chat_retention_last_vacuum"
+    # KV 中是否开启自动归档的键，默认关闭
+    ARCHIVE_ENABLED_KEY = "chat_retention_archive_enabled"
+
+    def __init__(self, db_path="chat.db", archive_dir="chat_archive", kv=None,
+                 max_age_days=180, archive_interval_days=1, vacuum_interval_days=7):
+        """
+        :param kv: KVUtils 实例，用于记录上次维护时间；为 None 时每次都执行
+        :param max_age_days: 会话最后一条消息超过该天数后归档
+        """
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.kv = kv
+        self.max_age_days = max_age_days
+        self.archive_interval_days = archive_interval_days
+        self.vacuum_interval_days = vacuum_interval_days
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def _init_db(self):
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS chat_archive (
+                chat_id TEXT PRIMARY KEY,
+                message_count INTEGER NOT NULL,
+                first_timestamp DATETIME,
+                last_timestamp DATETIME,
+                summary TEXT,
+                archive_file TEXT NOT NULL,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # 按会话查最后一条消息时间
+        c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='chat'")
+        if c.fetchone():
+            c.execute("CREATE INDEX IF NOT EXISTS idx_chat_chat_id_ts ON chat(chat_id, timestamp)")
+        conn.commit()
+        conn.close()
+
+    # ---------- 归档 ----------
+    def _archive_file(self, chat_id):
+        """归档文件路径；chat_id 可能是目录路径，用哈希命名"""
+        name = hashlib.md5(chat_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.archive_dir, f"{name}.jsonl.gz")
+
+    def find_stale_chats(self, max_age_days=None):
+        """最后一条消息早于保留期限的会话"""
+        days = self.max_age_days if max_age_days is None else max_age_days
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("""
+            SELECT chat_id FROM chat
+            GROUP BY chat_id
+            HAVING MAX(timestamp) < datetime('now', ?)
+        """, (f"-{int(days)} days",))
+        rows = [row[0] for row in c.fetchall()]
+        conn.close()
+        return rows
+
+    def archive_chat(self, chat_id):
+        """
+        把会话的全部消息合并到归档文件，更新摘要后删除热表中的记录
+        已有归档与新消息一起写入临时文件，落盘后原子替换，再在一个事务中更新摘要和删除，
+        中途失败不会损坏已有归档，也不会丢失消息
+        :return: 归档的消息条数
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                c = conn.cursor()
+                c.execute(
+                    "SELECT id, role, content, timestamp FROM chat WHERE chat_id=? ORDER BY id",
+                    (chat_id,)
+                )
+                rows = c.fetchall()
+                if not rows:
+                    return 0
+
+                os.makedirs(self.archive_dir, exist_ok=True)
+                archive_file = self._archive_file(chat_id)
+                # 先读出已有归档（损坏时抛出异常，不做任何修改），再与新消息一起写入临时文件
+                # 上次归档若在替换文件后、提交事务前中断，文件里会已有这些消息，按id去重
+                new_ids = {r[0] for r in rows}
+                archived = [m for m in self.iter_archived_messages(chat_id) if m["id"] not in new_ids]
+                tmp_file = f"{archive_file}.{os.getpid()}.tmp"
+                with gzip.open(tmp_file, "wt", encoding="utf-8") as f:
+                    for message in archived:
+                        f.write(json.dumps(message, ensure_ascii=False))
+                        f.write("\n")
+                    for msg_id, role, content, timestamp in rows:
+                        f.write(json.dumps({"chat_id": chat_id, "id": msg_id, "role": role,
+                                            "content": content, "timestamp": timestamp},
+                                           ensure_ascii=False))
+                        f.write("\n")
+                with open(tmp_file, "rb") as f:
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, archive_file)
+
+                first_question = next((r[2] for r in rows if r[1] == "user"), "")
+                max_id = rows[-1][0]
+                with conn:
+                    conn.execute("""
+                        INSERT INTO chat_archive
+                            (chat_id, message_count, first_timestamp, last_timestamp, summary, archive_file)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(chat_id) DO UPDATE SET
+                            message_count = message_count + excluded.message_count,
+                            last_timestamp = excluded.last_timestamp,
+                            archive_file = excluded.archive_file,
+                            archived_at = CURRENT_TIMESTAMP
+                    """, (chat_id, len(rows), rows[0][3], rows[-1][3], first_question[:200], archive_file))
+                    conn.execute("DELETE FROM chat WHERE chat_id=? AND id<=?", (chat_id, max_id))
+                return len(rows)
+            finally:
+                conn.close()
+
+    def archive_stale_chats(self, max_age_days=None):
+        """
+        归档所有过期会话
+        :return: {"chats": 会话数, "messages": 消息条数}
+        """
+        chats = 0
+        messages = 0
+        for chat_id in self.find_stale_chats(max_age_days):
+            count = self.archive_chat(chat_id)
+            if count:
+                chats += 1
+                messages += count
+        if chats:
+            print(f"已归档 {chats} 个会话，共 {messages} 条消息")
+        return {"chats": chats, "messages": messages}
+
+    def is_archived(self, chat_id):
+        """会话是否有归档记录"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT 1 FROM chat_archive WHERE chat_id=?", (chat_id,)).fetchone()
+        finally:
+            conn.close()
+        return row is not None
+
+    def get_archived_chats(self):
+        """所有已归档会话的摘要"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("SELECT * FROM chat_archive ORDER BY last_timestamp DESC").fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def iter_archived_messages(self, chat_id):
+        """逐条读取会话的归档消息"""
+        archive_file = self._archive_file(chat_id)
+        if not os.path.exists(archive_file):
+            return
+        with gzip.open(archive_file, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def restore_chat(self, chat_id):
+        """
+        把归档的会话恢复到热表（保留原消息id），并删除归档文件和摘要
+        归档文件缺失、损坏或条数与摘要记录不符时抛出 IOError，保留摘要和归档文件
+        :return: 恢复的消息条数
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT message_count FROM chat_archive WHERE chat_id=?", (chat_id,)).fetchone()
+                archive_file = self._archive_file(chat_id)
+                if not os.path.exists(archive_file):
+                    raise IOError(f"归档文件不存在: {archive_file}")
+                messages = list(self.iter_archived_messages(chat_id))
+                if row is not None and len(messages) != row[0]:
+                    raise IOError(f"归档消息条数不符: 记录 {row[0]} 条，文件中 {len(messages)} 条")
+                with conn:
+                    cursor = conn.executemany(
+                        "INSERT OR IGNORE INTO chat (id, chat_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                        ((m["id"], chat_id, m["role"], m["content"], m["timestamp"]) for m in messages)
+                    )
+                    conn.execute("DELETE FROM chat_archive WHERE chat_id=?", (chat_id,))
+                restored = cursor.rowcount
+            finally:
+                conn.close()
+            os.remove(archive_file)
+            return restored
+
+    # ---------- 空间回收 ----------
+    def vacuum(self):
+        """
+        增量回收空闲页，只在数据库已启用 incremental 模式时生效
+        不会执行完整 VACUUM，可以在启动时后台运行
+        :return: 是否执行了回收
+        """
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return False
+            conn.execute("PRAGMA incremental_vacuum")
+            return True
+        finally:
+            conn.close()
+
+    def compact(self):
+        """
+        整理数据库：切换到 incremental 模式并执行一次完整 VACUUM
+        需要重写整个数据库文件，只在用户手动整理时调用
+        :return: 整理后的数据库大小
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.isolation_level = None
+            try:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        return self.database_size()
+
+    def database_size(self):
+        """
+        数据库空间占用
+        :return: 文件大小、页数、空闲页、归档目录大小（字节）
+        """
+        conn = self._connect()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        message_count = conn.execute("SELECT COUNT(*) FROM chat").fetchone()[0]
+        conn.close()
+
+        archive_bytes = 0
+        if os.path.isdir(self.archive_dir):
+            for name in os.listdir(self.archive_dir):
+                archive_bytes += os.path.getsize(os.path.join(self.archive_dir, name))
+
+        return {
+            "file_bytes": os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,
+            "page_size": page_size,
+            "page_count": page_count,
+            "free_bytes": freelist_count * page_size,
+            "message_count": message_count,
+            "archive_bytes": archive_bytes,
+        }
+
+    # ---------- 定期维护 ----------
+    def _due(self, key, interval_days):
+        if self.kv is None:
+            return True
+        last = self.kv.get_float(key, default=0.0)
+        return time.time() - last >= interval_days * 86400
+
+    def _mark_done(self, key):
+        if self.kv is not None:
+            self.kv.put_float(key, time.time())
+
+    @property
+    def archive_enabled(self):
+        """是否开启了自动归档（需要在设置中开启）"""
+        return self.kv is not None and self.kv.get_bool(self.ARCHIVE_ENABLED_KEY, default=False)
+
+    def run_maintenance(self, force=False):
+        """
+        按计划执行归档（已开启时）和增量空间回收
+        :param force: 忽略上次执行时间
+        :return: 本次执行的内容和执行后的数据库大小
+        """
+        report = {"archived": None, "vacuumed": False}
+        if self.archive_enabled and (force or self._due(self.LAST_ARCHIVE_KEY, self.archive_interval_days)):
+            report["archived"] = self.archive_stale_chats()
+            self._mark_done(self.LAST_ARCHIVE_KEY)
+        if force or self._due(self.LAST_VACUUM_KEY, self.vacuum_interval_days):
+            report["vacuumed"] = self.vacuum()
+            self._mark_done(self.LAST_VACUUM_KEY)
+        report["size"] = self.database_size()
+        return report
+
+    def run_maintenance_async(self, callback=None):
+        """在后台线程中执行 run_maintenance"""
+        def run():
+            try:
+                report = self.run_maintenance()
+                if callback:
+                    callback(report)
+            except Exception as e:
+                print(f"聊天记录维护失败: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
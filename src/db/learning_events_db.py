@@ -0,0 +1,374 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from src.db.study_progress_db import DEFAULT_USER
+
+
+def _timestamp(dt: datetime) -> str:
+    """事件时间统一存为 "YYYY-MM-DD HH:MM:SS" 文本，不依赖 sqlite3 的 datetime 适配器"""
+    return dt.isoformat(sep=" ", timespec="seconds")
+
+
+class LearningEventsDB:
+    """
+    学习行为事件日志
+    - learning_events 只追加不修改，记录打开课程、运行代码、提问 AI、完成学习、离开课程（含停留秒数）
+    - 事件先写入内存缓冲区，攒够 flush_size 条或等待 flush_delay 秒后，在后台线程中用 executemany 一次写入，
+      记录事件的调用方（UI 线程）不会等待数据库
+    - 每次后台写入之后接着在同一线程中汇总，统计查询不在调用方线程上写入或汇总
+    - learning_rollup 按 (学习者, 章节, 小节, 日期) 汇总各项指标，每个指标一列；
+      统计查询只读汇总表，不随原始事件数量变慢，原始事件可以按天数清理
+    """
+
+    LESSON_OPEN = "lesson_open"
+    LESSON_CLOSE = "lesson_close"
+    CODE_RUN = "code_run"
+    AI_ASK = "ai_ask"
+    COMPLETE = "complete"
+    EVENT_TYPES = (LESSON_OPEN, LESSON_CLOSE, CODE_RUN, AI_ASK, COMPLETE)
+
+    # 汇总表的指标列 -> 计算表达式（基于 learning_events 的列）
+    METRICS = {
+        "opens": "SUM(event_type = 'lesson_open')",
+        "seconds": "COALESCE(SUM(CASE WHEN event_type = 'lesson_close' THEN value END), 0)",
+        "code_runs": "SUM(event_type = 'code_run')",
+        "code_ok": "SUM(event_type = 'code_run' AND value = 1)",
+        "ai_asks": "SUM(event_type = 'ai_ask')",
+        "completes": "SUM(event_type = 'complete')",
+    }
+
+    def __init__(self, db_path="learning_events.db", flush_size=200, flush_delay=2.0, user_id=None):
+        """
+        :param flush_size: 缓冲区达到该条数时立即写入
+        :param flush_delay: 第一条未写入事件之后等待的秒数
+        :param user_id: 记录事件时默认使用的学习者
+        """
+        self.db_path = db_path
+        self.user_id = user_id or DEFAULT_USER
+        self.flush_size = flush_size
+        self.flush_delay = flush_delay
+        self._lock = threading.RLock()
+        # 串行化数据库写入，保证事件按记录顺序入库
+        self._write_lock = threading.Lock()
+        # 串行化汇总和清理，与 log 使用的 _lock 分开，汇总期间记录事件不会等待
+        self._rollup_lock = threading.Lock()
+        self._buffer = []
+        self._timer = None
+        self._timer_due = 0.0
+        self._init_db()
+        atexit.register(self.flush)
+        # 汇总上次运行中写入但还未汇总的事件
+        threading.Thread(target=self.rollup, daemon=True).start()
+
+    def set_user(self, user_id):
+        """切换之后记录的事件所属的学习者"""
+        self.user_id = user_id or DEFAULT_USER
+
+    def _init_db(self):
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+
+        self._migrate_user_id(conn)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS learning_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL DEFAULT 'default',
+                ts DATETIME NOT NULL,
+                event_type TEXT NOT NULL,
+                chapter_name TEXT,
+                section_name TEXT,
+                value REAL,
+                extra TEXT
+            )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_learning_events_ts ON learning_events(ts)")
+
+        # 按学习者、小节聚集存储，同一学习者同一小节各天的记录连续存放
+        c.execute(self._rollup_table_sql("learning_rollup"))
+        c.execute("CREATE INDEX IF NOT EXISTS idx_learning_rollup_day ON learning_rollup(day)")
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS idx_learning_rollup_section
+            ON learning_rollup(chapter_name, section_name, day)
+        """)
+
+        # 已汇总到的事件 id
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS learning_rollup_state (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+
+        conn.commit()
+        conn.close()
+
+    def _rollup_table_sql(self, table):
+        metric_columns = ",\n".join(f"{name} REAL NOT NULL DEFAULT 0" for name in self.METRICS)
+        return f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                user_id TEXT NOT NULL DEFAULT 'default',
+                chapter_name TEXT NOT NULL DEFAULT '',
+                section_name TEXT NOT NULL DEFAULT '',
+                day TEXT NOT NULL,
+                {metric_columns},
+                PRIMARY KEY (user_id, chapter_name, section_name, day)
+            ) WITHOUT ROWID
+        """
+
+    def _migrate_user_id(self, conn):
+        """旧版本没有 user_id：事件表直接加列，汇总表主键变化需要重建；原有数据归到 DEFAULT_USER"""
+        event_columns = [row[1] for row in conn.execute("PRAGMA table_info(learning_events)")]
+        if event_columns and "user_id" not in event_columns:
+            conn.execute(f"ALTER TABLE learning_events ADD COLUMN user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}'")
+
+        rollup_columns = [row[1] for row in conn.execute("PRAGMA table_info(learning_rollup)")]
+        if rollup_columns and "user_id" not in rollup_columns:
+            names = ", ".join(["chapter_name", "section_name", "day", *self.METRICS])
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS learning_rollup_migrating")
+                conn.execute(self._rollup_table_sql("learning_rollup_migrating"))
+                conn.execute(f"""
+                    INSERT INTO learning_rollup_migrating (user_id, {names})
+                    SELECT ?, {names} FROM learning_rollup
+                """, (DEFAULT_USER,))
+                conn.execute("DROP TABLE learning_rollup")
+                conn.execute("ALTER TABLE learning_rollup_migrating RENAME TO learning_rollup")
+        conn.commit()
+
+    # ---------- 写入 ----------
+    def log(self, event_type, chapter_name=None, section_name=None, value=None, extra=None, user_id=None):
+        """
+        记录一个事件（先进入缓冲区）
+        :param value: lesson_close 为停留秒数，code_run 为 1（结果正确）或 0
+        :param extra: 附加信息，序列化为 JSON
+        :param user_id: 所属学习者，默认为当前学习者
+        """
+        if event_type not in self.EVENT_TYPES:
+            raise ValueError(f"未知的事件类型: {event_type}")
+        row = (
+            user_id or self.user_id,
+            _timestamp(datetime.now()),
+            event_type,
+            chapter_name,
+            section_name,
+            value,
+            json.dumps(extra, ensure_ascii=False) if extra is not None else None,
+        )
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.flush_size:
+                # 缓冲区已满：交给后台线程立即写入
+                self._schedule_flush(0)
+            elif self._timer is None:
+                self._schedule_flush(self.flush_delay)
+
+    def _schedule_flush(self, delay):
+        """在后台线程中 delay 秒后执行 flush，已经安排了更早的写入时不重复安排"""
+        with self._lock:
+            due = time.monotonic() + delay
+            if self._timer is not None:
+                if self._timer_due <= due:
+                    return
+                self._timer.cancel()
+            self._timer = threading.Timer(delay, self._flush_and_rollup)
+            self._timer.daemon = True
+            self._timer_due = due
+            self._timer.start()
+
+    def flush(self):
+        """把缓冲区中的事件一次写入数据库（在后台线程或退出时调用，写入期间不阻塞 log）"""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._buffer:
+                    return
+                rows, self._buffer = self._buffer, []
+
+            conn = sqlite3.connect(self.db_path)
+            try:
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO learning_events
+                            (user_id, ts, event_type, chapter_name, section_name, value, extra)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, rows)
+            except Exception as e:
+                # 写入失败时放回缓冲区，下次记录事件时再试
+                with self._lock:
+                    self._buffer[:0] = rows
+                print(f"写入学习事件失败: {e}")
+            finally:
+                conn.close()
+
+    def _flush_and_rollup(self):
+        """后台定时器的任务：写入缓冲区后汇总新事件"""
+        self.flush()
+        self.rollup()
+
+    # ---------- 汇总 ----------
+    def rollup(self):
+        """
+        把上次汇总之后已写入数据库的新事件累加到汇总表（不写入缓冲区）
+        :return: 本次汇总的事件条数
+        """
+        with self._rollup_lock:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                with conn:
+                    c = conn.cursor()
+                    c.execute("SELECT value FROM learning_rollup_state WHERE name = 'last_event_id'")
+                    row = c.fetchone()
+                    last_id = row[0] if row else 0
+                    c.execute("SELECT MAX(id) FROM learning_events")
+                    max_id = c.fetchone()[0]
+                    if max_id is None or max_id <= last_id:
+                        return 0
+
+                    names = ", ".join(self.METRICS)
+                    exprs = ", ".join(self.METRICS.values())
+                    updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in self.METRICS)
+                    c.execute(f"""
+                        INSERT INTO learning_rollup (user_id, chapter_name, section_name, day, {names})
+                        SELECT user_id, COALESCE(chapter_name, ''), COALESCE(section_name, ''), date(ts), {exprs}
+                        FROM learning_events
+                        WHERE id > ? AND id <= ?
+                        GROUP BY 1, 2, 3, 4
+                        ON CONFLICT(user_id, chapter_name, section_name, day) DO UPDATE SET {updates}
+                    """, (last_id, max_id))
+                    c.execute("""
+                        INSERT INTO learning_rollup_state (name, value) VALUES ('last_event_id', ?)
+                        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+                    """, (max_id,))
+                    c.execute("SELECT COUNT(*) FROM learning_events WHERE id > ? AND id <= ?", (last_id, max_id))
+                    return c.fetchone()[0]
+            finally:
+                conn.close()
+
+    def purge_events(self, keep_days=90):
+        """
+        删除早于 keep_days 天且已经汇总过的原始事件，汇总表不受影响
+        :return: 删除的条数
+        """
+        self.flush()
+        self.rollup()
+        cutoff = _timestamp(datetime.now() - timedelta(days=keep_days))
+        with self._rollup_lock:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                with conn:
+                    cursor = conn.execute("""
+                        DELETE FROM learning_events
+                        WHERE ts < ?
+                          AND id <= (SELECT value FROM learning_rollup_state WHERE name = 'last_event_id')
+                    """, (cutoff,))
+                return cursor.rowcount
+            finally:
+                conn.close()
+
+    # ---------- 查询 ----------
+    def _columns(self, sql, params, keys):
+        """执行查询，按列返回 {列名: [值, ...]}（汇总由后台写入线程完成，这里只读）"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(sql, params).fetchall()
+        conn.close()
+        columns = {key: [] for key in keys}
+        for row in rows:
+            for key, value in zip(keys, row):
+                columns[key].append(value)
+        return columns
+
+    @staticmethod
+    def _user_filter(user_id, conditions, params):
+        """user_id 为 None 时统计所有学习者"""
+        if user_id is not None:
+            conditions.insert(0, "user_id = ?")
+            params.insert(0, user_id)
+
+    def get_section_series(self, chapter_name, section_name, days=None, user_id=None):
+        """
+        某个小节每天的指标
+        :param days: 只取最近多少天，None 表示全部
+        :param user_id: 只统计该学习者，None 表示所有学习者合计
+        :return: {"day": [...], "opens": [...], "seconds": [...], ...}，各列表按日期对齐
+        """
+        since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d") if days else ""
+        conditions = ["chapter_name = ?", "section_name = ?", "day >= ?"]
+        params = [chapter_name or "", section_name or "", since]
+        self._user_filter(user_id, conditions, params)
+        keys = ["day", *self.METRICS]
+        sums = ", ".join(f"SUM({name})" for name in self.METRICS)
+        return self._columns(f"""
+            SELECT day, {sums}
+            FROM learning_rollup
+            WHERE {" AND ".join(conditions)}
+            GROUP BY day
+            ORDER BY day
+        """, params, keys)
+
+    def get_daily_totals(self, days=30, user_id=None):
+        """
+        最近 days 天所有课程合计的每日指标
+        :param user_id: 只统计该学习者，None 表示所有学习者合计
+        :return: {"day": [...], "opens": [...], ...}
+        """
+        since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        conditions = ["day >= ?"]
+        params = [since]
+        self._user_filter(user_id, conditions, params)
+        keys = ["day", *self.METRICS]
+        sums = ", ".join(f"SUM({name})" for name in self.METRICS)
+        return self._columns(f"""
+            SELECT day, {sums}
+            FROM learning_rollup
+            WHERE {" AND ".join(conditions)}
+            GROUP BY day
+            ORDER BY day
+        """, params, keys)
+
+    def get_section_totals(self, chapter_name=None, user_id=None):
+        """
+        每个小节的累计指标，可按章节、学习者过滤
+        :return: {"chapter_name": [...], "section_name": [...], "opens": [...], ...}
+        """
+        conditions = []
+        params = []
+        if chapter_name is not None:
+            conditions.append("chapter_name = ?")
+            params.append(chapter_name)
+        self._user_filter(user_id, conditions, params)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        keys = ["chapter_name", "section_name", *self.METRICS]
+        sums = ", ".join(f"SUM({name})" for name in self.METRICS)
+        return self._columns(f"""
+            SELECT chapter_name, section_name, {sums}
+            FROM learning_rollup
+            {where}
+            GROUP BY chapter_name, section_name
+            ORDER BY chapter_name, section_name
+        """, params, keys)
+
+    def get_user_totals(self, days=None):
+        """
+        每个学习者的累计指标
+        :param days: 只取最近多少天，None 表示全部
+        :return: {"user_id": [...], "opens": [...], ...}
+        """
+        since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d") if days else ""
+        keys = ["user_id", *self.METRICS]
+        sums = ", ".join(f"SUM({name})" for name in self.METRICS)
+        return self._columns(f"""
+            SELECT user_id, {sums}
+            FROM learning_rollup
+            WHERE day >= ?
+            GROUP BY user_id
+            ORDER BY user_id
+        """, (since,), keys)
+
+learning_events = LearningEventsDB()
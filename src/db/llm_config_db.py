@@ -1,14 +1,77 @@
 import sqlite3
 import os
+import threading
 
 from src.db.path_utils import get_app_path
 
+_MISSING = object()
+
 
 class LLMConfigDB:
+    # 以下状态按数据库路径在进程内共享，同一路径的所有实例看到一致的缓存和订阅者
+    _lock = threading.RLock()
+    _initialized_paths = set()
+    _instances = {}
+    _current_cache = {}
+    _listeners = {}
+    _versions = {}
+
     def __init__(self, db_path="llm_config.db"):
         # self.db_path = os.path.join(get_app_path(), db_path)
         self.db_path =  db_path
-        self._init_db()
+        self._key = os.path.abspath(db_path)
+        with LLMConfigDB._lock:
+            # 建表只在进程内第一次打开该路径时执行
+            if self._key not in LLMConfigDB._initialized_paths:
+                self._init_db()
+                LLMConfigDB._initialized_paths.add(self._key)
+
+    @classmethod
+    def shared(cls, db_path="llm_config.db"):
+        """获取该路径的共享实例"""
+        key = os.path.abspath(db_path)
+        with cls._lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = cls._instances[key] = cls(db_path)
+            return instance
+
+    # ---------- 变更通知 ----------
+    def subscribe(self, listener):
+        """
+        订阅当前配置的变更，配置确实发生变化时以新配置（可能为None）调用 listener
+        :return: 取消订阅的函数
+        """
+        with LLMConfigDB._lock:
+            LLMConfigDB._listeners.setdefault(self._key, []).append(listener)
+
+        def unsubscribe():
+            with LLMConfigDB._lock:
+                listeners = LLMConfigDB._listeners.get(self._key, [])
+                if listener in listeners:
+                    listeners.remove(listener)
+        return unsubscribe
+
+    def version(self):
+        """配置表的写入次数，可用来判断基于全部配置构建的缓存是否过期"""
+        with LLMConfigDB._lock:
+            return LLMConfigDB._versions.get(self._key, 0)
+
+    def _reload_current(self):
+        """写入后重新读取当前配置，和缓存不同时通知订阅者"""
+        with LLMConfigDB._lock:
+            LLMConfigDB._versions[self._key] = LLMConfigDB._versions.get(self._key, 0) + 1
+            old = LLMConfigDB._current_cache.get(self._key, _MISSING)
+            new = self._query_current_config()
+            LLMConfigDB._current_cache[self._key] = new
+            listeners = list(LLMConfigDB._listeners.get(self._key, []))
+        if old is _MISSING or old == new:
+            return
+        for listener in listeners:
+            try:
+                listener(dict(new) if new else None)
+            except Exception as e:
+                print(f"LLM配置变更通知失败: {e}")
 
     def _init_db(self):
         conn = sqlite3.connect(self.db_path)
@@ -46,6 +109,14 @@ class LLMConfigDB:
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
 
+        # 当前配置属于同一 provider 时，保存后仍指向新配置
+        c.execute("""
+            SELECT 1 FROM llm_current
+            JOIN llm_config ON llm_current.config_id = llm_config.id
+            WHERE llm_current.id=1 AND llm_config.provider=?
+        """, (provider,))
+        was_current = c.fetchone() is not None
+
         # 先删除已有相同 provider 的配置
         c.execute("DELETE FROM llm_config WHERE provider = ?", (provider,))
 
@@ -56,8 +127,11 @@ class LLMConfigDB:
                   """, (provider, model, base_url, api_key, addr))
 
         config_id = c.lastrowid
+        if was_current:
+            c.execute("UPDATE llm_current SET config_id=? WHERE id=1", (config_id,))
         conn.commit()
         conn.close()
+        self._reload_current()
         return config_id
 
     # 获取所有配置
@@ -79,9 +153,17 @@ class LLMConfigDB:
         c.execute("UPDATE llm_current SET config_id=? WHERE id=1", (config_id,))
         conn.commit()
         conn.close()
+        self._reload_current()
 
-    # 获取当前配置
+    # 获取当前配置（读取内存缓存，写入方法会同步更新）
     def get_current_config(self):
+        with LLMConfigDB._lock:
+            config = LLMConfigDB._current_cache.get(self._key, _MISSING)
+            if config is _MISSING:
+                config = LLMConfigDB._current_cache[self._key] = self._query_current_config()
+        return dict(config) if config else None
+
+    def _query_current_config(self):
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
         c.execute("""
@@ -131,4 +213,5 @@ class LLMConfigDB:
         # 删除配置
         c.execute("DELETE FROM llm_config WHERE id=?", (config_id,))
         conn.commit()
-        conn.close()
\ No newline at end of file
+        conn.close()
+        self._reload_current()
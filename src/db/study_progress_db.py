@@ -1,34 +1,220 @@
 import sqlite3
 import os
+import threading
+import weakref
 from datetime import datetime
 
+# 未设置学习者时使用的用户，升级前的进度都归到该用户
+DEFAULT_USER = "default"
+
 
 class StudyProgressDB:
-    def __init__(self, db_path="study_progress.db"):
+    # 变更订阅者按数据库路径在进程内共享，同一路径的所有实例写入时都会通知
+    # 订阅者以弱引用保存，界面组件销毁后自动失效，无需手动取消订阅
+    _lock = threading.Lock()
+    _listeners = {}
+
+    def __init__(self, db_path="study_progress.db", user_id=None):
+        """
+        :param user_id: 当前学习者，读写进度都限定在该用户下
+        """
         # self.db_path = os.path.join(get_app_path(), db_path)
         self.db_path = db_path
+        self._key = os.path.abspath(db_path)
+        self.user_id = user_id or DEFAULT_USER
         self._init_db()
 
+    def set_user(self, user_id):
+        """切换当前学习者；所有查询都按 user_id 走索引，切换时不需要重新加载数据"""
+        self.user_id = user_id or DEFAULT_USER
+
+    # ---------- 变更通知 ----------
+    def subscribe(self, listener):
+        """
+        订阅学习进度的变更，每个小节的状态变化时以事件字典调用 listener：
+        {"user_id", "chapter_name", "section_name", "is_completed", "was_completed", "completed_timestamp"}
+        :return: 取消订阅的函数
+        """
+        if hasattr(listener, "__self__") and hasattr(listener, "__func__"):
+            ref = weakref.WeakMethod(listener)
+        else:
+            ref = weakref.ref(listener)
+        with StudyProgressDB._lock:
+            StudyProgressDB._listeners.setdefault(self._key, []).append(ref)
+
+        def unsubscribe():
+            with StudyProgressDB._lock:
+                refs = StudyProgressDB._listeners.get(self._key, [])
+                if ref in refs:
+                    refs.remove(ref)
+        return unsubscribe
+
+    def _emit(self, events):
+        with StudyProgressDB._lock:
+            refs = StudyProgressDB._listeners.get(self._key, [])
+            # 顺便清理已经失效的订阅者
+            refs[:] = [ref for ref in refs if ref() is not None]
+            listeners = [ref() for ref in refs]
+        for event in events:
+            for listener in listeners:
+                if listener is None:
+                    continue
+                try:
+                    listener(event)
+                except Exception as e:
+                    print(f"学习进度变更通知失败: {e}")
+
+    def _event(self, chapter_name, section_name, is_completed, was_completed, completed_timestamp=None,
+               user_id=None):
+        return {
+            "user_id": user_id or self.user_id,
+            "chapter_name": chapter_name,
+            "section_name": section_name,
+            "is_completed": is_completed,
+            "was_completed": was_completed,
+            "completed_timestamp": completed_timestamp,
+        }
+
     def _init_db(self):
         """初始化数据库表结构"""
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
 
-        # 学习进度表
+        self._migrate_user_id(conn)
+
+        # 学习进度表，按学习者区分
         c.execute("""
             CREATE TABLE IF NOT EXISTS study_progress (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL DEFAULT 'default',
                 chapter_name TEXT NOT NULL,
                 section_name TEXT NOT NULL,
                 study_status INTEGER DEFAULT 0,
                 completed_timestamp DATETIME,
-                UNIQUE(chapter_name, section_name)
+                UNIQUE(user_id, chapter_name, section_name)
             )
         """)
 
+        # 覆盖索引：章节完成数、完成时间分布只读索引，不回表
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS idx_study_progress_user_chapter_status
+            ON study_progress(user_id, chapter_name, study_status)
+        """)
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS idx_study_progress_user_status_time
+            ON study_progress(user_id, study_status, completed_timestamp)
+        """)
+
+        # 按学习者和章节汇总的物化统计表，由触发器随进度表同步更新
+        c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='study_progress_summary'")
+        summary_exists = c.fetchone() is not None
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS study_progress_summary (
+                user_id TEXT NOT NULL,
+                chapter_name TEXT NOT NULL,
+                total_sections INTEGER NOT NULL DEFAULT 0,
+                completed_sections INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, chapter_name)
+            ) WITHOUT ROWID
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS study_progress_summary_ai AFTER INSERT ON study_progress BEGIN
+                INSERT INTO study_progress_summary (user_id, chapter_name, total_sections, completed_sections)
+                VALUES (new.user_id, new.chapter_name, 1, new.study_status = 1)
+                ON CONFLICT(user_id, chapter_name) DO UPDATE SET
+                    total_sections = total_sections + 1,
+                    completed_sections = completed_sections + (new.study_status = 1);
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS study_progress_summary_ad AFTER DELETE ON study_progress BEGIN
+                UPDATE study_progress_summary SET
+                    total_sections = total_sections - 1,
+                    completed_sections = completed_sections - (old.study_status = 1)
+                WHERE user_id = old.user_id AND chapter_name = old.chapter_name;
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS study_progress_summary_au
+            AFTER UPDATE OF user_id, chapter_name, study_status ON study_progress BEGIN
+                UPDATE study_progress_summary SET
+                    total_sections = total_sections - 1,
+                    completed_sections = completed_sections - (old.study_status = 1)
+                WHERE user_id = old.user_id AND chapter_name = old.chapter_name;
+                INSERT INTO study_progress_summary (user_id, chapter_name, total_sections, completed_sections)
+                VALUES (new.user_id, new.chapter_name, 1, new.study_status = 1)
+                ON CONFLICT(user_id, chapter_name) DO UPDATE SET
+                    total_sections = total_sections + 1,
+                    completed_sections = completed_sections + (new.study_status = 1);
+            END
+        """)
+        if not summary_exists:
+            # 旧数据库第一次升级，按已有进度生成汇总
+            self._rebuild_summary(c)
+
         conn.commit()
         conn.close()
 
+    @staticmethod
+    def _migrate_user_id(conn):
+        """
+        旧版进度表没有 user_id，唯一约束是 (chapter_name, section_name)：
+        SQLite 不能修改约束，在一个事务中重建表，原有进度归到 DEFAULT_USER；
+        旧的汇总表和触发器一并删除，之后按新结构重新创建
+        """
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(study_progress)")]
+        if not columns or "user_id" in columns:
+            return
+
+        conn.isolation_level = None
+        try:
+            conn.execute("BEGIN")
+            for trigger in ("study_progress_summary_ai", "study_progress_summary_ad", "study_progress_summary_au"):
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.execute("DROP TABLE IF EXISTS study_progress_summary")
+            conn.execute("""
+                CREATE TABLE study_progress_migrating (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL DEFAULT 'default',
+                    chapter_name TEXT NOT NULL,
+                    section_name TEXT NOT NULL,
+                    study_status INTEGER DEFAULT 0,
+                    completed_timestamp DATETIME,
+                    UNIQUE(user_id, chapter_name, section_name)
+                )
+            """)
+            conn.execute("""
+                INSERT INTO study_progress_migrating
+                    (id, user_id, chapter_name, section_name, study_status, completed_timestamp)
+                SELECT id, ?, chapter_name, section_name, study_status, completed_timestamp
+                FROM study_progress
+            """, (DEFAULT_USER,))
+            conn.execute("DROP TABLE study_progress")
+            conn.execute("ALTER TABLE study_progress_migrating RENAME TO study_progress")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.isolation_level = ""
+
+    @staticmethod
+    def _rebuild_summary(c):
+        c.execute("DELETE FROM study_progress_summary")
+        c.execute("""
+            INSERT INTO study_progress_summary (user_id, chapter_name, total_sections, completed_sections)
+            SELECT user_id, chapter_name, COUNT(*), SUM(study_status = 1)
+            FROM study_progress
+            GROUP BY user_id, chapter_name
+        """)
+
+    def rebuild_summary(self):
+        """按进度表重新生成汇总统计（手动修改过数据库时使用）"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            self._rebuild_summary(conn.cursor())
+        conn.close()
+
     def is_section_completed(self, chapter_name, section_name):
         """
         判断一个小节有没有学习完成
@@ -41,8 +227,8 @@ class StudyProgressDB:
         
         c.execute("""
             SELECT study_status FROM study_progress 
-            WHERE chapter_name = ? AND section_name = ?
-        """, (chapter_name, section_name))
+            WHERE user_id = ? AND chapter_name = ? AND section_name = ?
+        """, (self.user_id, chapter_name, section_name))
         
         row = c.fetchone()
         conn.close()
@@ -59,43 +245,63 @@ class StudyProgressDB:
         c = conn.cursor()
         
         c.execute("""
-            SELECT COUNT(*) FROM study_progress 
-            WHERE chapter_name = ? AND study_status = 1
-        """, (chapter_name,))
+            SELECT completed_sections FROM study_progress_summary
+            WHERE user_id = ? AND chapter_name = ?
+        """, (self.user_id, chapter_name))
         
-        count = c.fetchone()[0]
+        row = c.fetchone()
         conn.close()
         
-        return count
+        return row[0] if row else 0
 
     def set_section_status(self, chapter_name, section_name, is_completed=True):
         """
-        存取一个小节的学习完成状态
+        存取一个小节的学习完成状态，并通知订阅者
         :param chapter_name: 章节名
         :param section_name: 小节名
         :param is_completed: 是否完成
         """
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
-        
+
+        c.execute("""
+            SELECT study_status FROM study_progress
+            WHERE user_id = ? AND chapter_name = ? AND section_name = ?
+        """, (self.user_id, chapter_name, section_name))
+        row = c.fetchone()
+        was_completed = row is not None and row[0] == 1
+
         if is_completed:
             # 设置为完成状态，记录完成时间
+            completed_timestamp = datetime.now()
             c.execute("""
-                INSERT OR REPLACE INTO study_progress 
-                (chapter_name, section_name, study_status, completed_timestamp) 
-                VALUES (?, ?, 1, ?)
-            """, (chapter_name, section_name, datetime.now()))
+                INSERT INTO study_progress 
+                (user_id, chapter_name, section_name, study_status, completed_timestamp) 
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT(user_id, chapter_name, section_name) DO UPDATE SET
+                    study_status = excluded.study_status,
+                    completed_timestamp = excluded.completed_timestamp
+            """, (self.user_id, chapter_name, section_name, completed_timestamp))
         else:
             # 设置为未完成状态，清除完成时间
+            completed_timestamp = None
             c.execute("""
-                INSERT OR REPLACE INTO study_progress 
-                (chapter_name, section_name, study_status, completed_timestamp) 
-                VALUES (?, ?, 0, NULL)
-            """, (chapter_name, section_name))
+                INSERT INTO study_progress 
+                (user_id, chapter_name, section_name, study_status, completed_timestamp) 
+                VALUES (?, ?, ?, 0, NULL)
+                ON CONFLICT(user_id, chapter_name, section_name) DO UPDATE SET
+                    study_status = excluded.study_status,
+                    completed_timestamp = excluded.completed_timestamp
+            """, (self.user_id, chapter_name, section_name))
         
         conn.commit()
         conn.close()
 
+        self._emit([self._event(
+            chapter_name, section_name, bool(is_completed), was_completed,
+            str(completed_timestamp) if completed_timestamp else None
+        )])
+
     def get_section_status(self, chapter_name, section_name):
         """
         获取小节的学习状态
@@ -108,8 +314,8 @@ class StudyProgressDB:
         
         c.execute("""
             SELECT study_status, completed_timestamp FROM study_progress 
-            WHERE chapter_name = ? AND section_name = ?
-        """, (chapter_name, section_name))
+            WHERE user_id = ? AND chapter_name = ? AND section_name = ?
+        """, (self.user_id, chapter_name, section_name))
         
         row = c.fetchone()
         conn.close()
@@ -128,7 +334,7 @@ class StudyProgressDB:
 
     def get_all_progress(self):
         """
-        获取所有学习进度
+        获取当前学习者的所有学习进度
         :return: list of progress records
         """
         conn = sqlite3.connect(self.db_path)
@@ -137,8 +343,9 @@ class StudyProgressDB:
         c.execute("""
             SELECT id, chapter_name, section_name, study_status, completed_timestamp 
             FROM study_progress 
+            WHERE user_id = ?
             ORDER BY chapter_name, section_name
-        """)
+        """, (self.user_id,))
         
         rows = c.fetchall()
         conn.close()
@@ -167,9 +374,9 @@ class StudyProgressDB:
         c.execute("""
             SELECT id, section_name, study_status, completed_timestamp 
             FROM study_progress 
-            WHERE chapter_name = ? 
+            WHERE user_id = ? AND chapter_name = ? 
             ORDER BY section_name
-        """, (chapter_name,))
+        """, (self.user_id, chapter_name))
         
         rows = c.fetchall()
         conn.close()
@@ -194,14 +401,23 @@ class StudyProgressDB:
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
         
+        c.execute("""
+            SELECT study_status FROM study_progress
+            WHERE user_id = ? AND chapter_name = ? AND section_name = ?
+        """, (self.user_id, chapter_name, section_name))
+        row = c.fetchone()
+
         c.execute("""
             DELETE FROM study_progress 
-            WHERE chapter_name = ? AND section_name = ?
-        """, (chapter_name, section_name))
+            WHERE user_id = ? AND chapter_name = ? AND section_name = ?
+        """, (self.user_id, chapter_name, section_name))
         
         conn.commit()
         conn.close()
 
+        if row is not None:
+            self._emit([self._event(chapter_name, section_name, False, row[0] == 1)])
+
     def reset_chapter_progress(self, chapter_name):
         """
         重置指定章节的所有进度
@@ -210,48 +426,148 @@ class StudyProgressDB:
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
         
+        c.execute("""
+            SELECT section_name FROM study_progress
+            WHERE user_id = ? AND chapter_name = ? AND study_status = 1
+        """, (self.user_id, chapter_name))
+        sections = [row[0] for row in c.fetchall()]
+
         c.execute("""
             UPDATE study_progress 
             SET study_status = 0, completed_timestamp = NULL 
-            WHERE chapter_name = ?
-        """, (chapter_name,))
+            WHERE user_id = ? AND chapter_name = ?
+        """, (self.user_id, chapter_name))
         
         conn.commit()
         conn.close()
 
+        self._emit([self._event(chapter_name, section, False, True) for section in sections])
+
+    @staticmethod
+    def _totals(chapters):
+        total_sections = sum(ch["total_sections"] for ch in chapters)
+        completed_sections = sum(ch["completed_sections"] for ch in chapters)
+        return {
+            "total_sections": total_sections,
+            "completed_sections": completed_sections,
+            "total_chapters": len(chapters),
+            "completed_chapters": sum(1 for ch in chapters if ch["is_completed"]),
+            "completion_rate": (completed_sections / total_sections * 100) if total_sections > 0 else 0
+        }
+
+    def _query_chapter_statistics(self, c):
+        """读取汇总表中当前学习者每个章节的统计"""
+        c.execute("""
+            SELECT chapter_name, total_sections, completed_sections
+            FROM study_progress_summary
+            WHERE user_id = ? AND total_sections > 0
+            ORDER BY chapter_name
+        """, (self.user_id,))
+        return [
+            {
+                "chapter_name": row[0],
+                "total_sections": row[1],
+                "completed_sections": row[2],
+                "completion_rate": row[2] / row[1] * 100,
+                "is_completed": row[1] == row[2]
+            }
+            for row in c.fetchall()
+        ]
+
+    # 完成时间分布的分组方式 -> strftime 格式
+    HISTOGRAM_BUCKETS = {
+        "day": "%Y-%m-%d",
+        "month": "%Y-%m",
+        "hour": "%H",
+        "weekday": "%w",
+    }
+
+    def _query_completion_histogram(self, c, bucket):
+        fmt = self.HISTOGRAM_BUCKETS.get(bucket)
+        if fmt is None:
+            raise ValueError(f"不支持的分组方式: {bucket}")
+        # 只读 (user_id, study_status, completed_timestamp) 覆盖索引
+        c.execute("""
+            SELECT strftime(?, completed_timestamp) AS bucket, COUNT(*)
+            FROM study_progress
+            WHERE user_id = ? AND study_status = 1 AND completed_timestamp IS NOT NULL
+            GROUP BY bucket
+            ORDER BY bucket
+        """, (fmt, self.user_id))
+        return [{"bucket": row[0], "count": row[1]} for row in c.fetchall() if row[0] is not None]
+
     def get_total_statistics(self):
         """
-        获取总体学习统计
+        获取总体学习统计（读取按章节的汇总表，一次查询）
         :return: dict with statistics
         """
         conn = sqlite3.connect(self.db_path)
+        chapters = self._query_chapter_statistics(conn.cursor())
+        conn.close()
+        return self._totals(chapters)
+
+    def get_chapter_statistics(self):
+        """
+        获取每个章节的完成情况
+        :return: list of {chapter_name, total_sections, completed_sections, completion_rate, is_completed}
+        """
+        conn = sqlite3.connect(self.db_path)
+        chapters = self._query_chapter_statistics(conn.cursor())
+        conn.close()
+        return chapters
+
+    def get_completion_histogram(self, bucket="day"):
+        """
+        获取完成时间分布
+        :param bucket: day / month / hour / weekday（0 为周日）
+        :return: list of {bucket, count}，按 bucket 排序
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return self._query_completion_histogram(conn.cursor(), bucket)
+        finally:
+            conn.close()
+
+    def get_statistics(self, bucket="day"):
+        """
+        在一个连接中获取总体统计、章节统计和完成时间分布，供统计面板使用
+        :return: dict: totals, chapters, histogram
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            c = conn.cursor()
+            chapters = self._query_chapter_statistics(c)
+            histogram = self._query_completion_histogram(c, bucket)
+        finally:
+            conn.close()
+        return {
+            "totals": self._totals(chapters),
+            "chapters": chapters,
+            "histogram": histogram,
+        }
+
+    def compute_statistics(self):
+        """
+        不依赖汇总表，直接扫描进度表计算总体统计（一次查询）
+        可用于核对汇总表是否与进度表一致
+        """
+        conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
-        
-        # 总小节数
-        c.execute("SELECT COUNT(*) FROM study_progress")
-        total_sections = c.fetchone()[0]
-        
-        # 已完成小节数
-        c.execute("SELECT COUNT(*) FROM study_progress WHERE study_status = 1")
-        completed_sections = c.fetchone()[0]
-        
-        # 总章节数
-        c.execute("SELECT COUNT(DISTINCT chapter_name) FROM study_progress")
-        total_chapters = c.fetchone()[0]
-        
-        # 已完成章节数（所有小节都完成的章节）
         c.execute("""
-            SELECT COUNT(*) FROM (
-                SELECT chapter_name 
-                FROM study_progress 
-                GROUP BY chapter_name 
-                HAVING COUNT(*) = SUM(study_status)
+            WITH chapters AS (
+                SELECT chapter_name, COUNT(*) AS total, SUM(study_status = 1) AS completed
+                FROM study_progress
+                WHERE user_id = ?
+                GROUP BY chapter_name
             )
-        """)
-        completed_chapters = c.fetchone()[0]
-        
+            SELECT COALESCE(SUM(total), 0),
+                   COALESCE(SUM(completed), 0),
+                   COUNT(*),
+                   COALESCE(SUM(total = completed), 0)
+            FROM chapters
+        """, (self.user_id,))
+        total_sections, completed_sections, total_chapters, completed_chapters = c.fetchone()
         conn.close()
-        
         return {
             "total_sections": total_sections,
             "completed_sections": completed_sections,
@@ -259,3 +575,124 @@ class StudyProgressDB:
             "completed_chapters": completed_chapters,
             "completion_rate": (completed_sections / total_sections * 100) if total_sections > 0 else 0
         }
+
+    # ---------- 多学习者 ----------
+    def get_users(self):
+        """
+        所有有进度记录的学习者
+        :return: list of {user_id, total_sections, completed_sections}
+        """
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        c.execute("""
+            SELECT user_id, SUM(total_sections), SUM(completed_sections)
+            FROM study_progress_summary
+            GROUP BY user_id
+            HAVING SUM(total_sections) > 0
+            ORDER BY user_id
+        """)
+        rows = c.fetchall()
+        conn.close()
+        return [
+            {"user_id": row[0], "total_sections": row[1], "completed_sections": row[2]}
+            for row in rows
+        ]
+
+    def export_progress(self, user_ids=None):
+        """
+        导出学习进度，用于整班备份或迁移
+        :param user_ids: 只导出这些学习者，None 表示全部
+        :return: list of {user_id, chapter_name, section_name, study_status, completed_timestamp}
+        """
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        sql = """
+            SELECT user_id, chapter_name, section_name, study_status, completed_timestamp
+            FROM study_progress
+        """
+        params = ()
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            sql += f" WHERE user_id IN ({', '.join('?' * len(user_ids))})"
+            params = tuple(user_ids)
+        c.execute(sql + " ORDER BY user_id, chapter_name, section_name", params)
+        rows = c.fetchall()
+        conn.close()
+        return [
+            {
+                "user_id": row[0],
+                "chapter_name": row[1],
+                "section_name": row[2],
+                "study_status": row[3],
+                "completed_timestamp": row[4],
+            }
+            for row in rows
+        ]
+
+    def import_progress(self, records, replace_users=False):
+        """
+        批量导入学习进度（一个事务，executemany 写入），已有记录按 (学习者, 章节, 小节) 覆盖
+        :param records: export_progress 格式的字典，可以是任意可迭代对象；
+                        缺少 user_id 时归到当前学习者，study_status 也可以用 is_completed 表示
+        :param replace_users: 先清空导入数据中涉及的学习者的全部进度
+        :return: 导入的记录数
+        """
+        rows = []
+        for record in records:
+            status = record.get("study_status")
+            if status is None:
+                status = 1 if record.get("is_completed") else 0
+            status = 1 if str(status) in ("1", "True", "true") else 0
+            rows.append((
+                record.get("user_id") or self.user_id,
+                record["chapter_name"],
+                record["section_name"],
+                status,
+                (record.get("completed_timestamp") or None) if status else None,
+            ))
+        if not rows:
+            return 0
+
+        # 当前学习者的变化需要通知界面，先记下导入前的状态
+        before = {
+            (r["chapter_name"], r["section_name"]): r["is_completed"]
+            for r in self.get_all_progress()
+        }
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                if replace_users:
+                    conn.executemany(
+                        "DELETE FROM study_progress WHERE user_id = ?",
+                        [(user_id,) for user_id in {row[0] for row in rows}]
+                    )
+                conn.executemany("""
+                    INSERT INTO study_progress
+                        (user_id, chapter_name, section_name, study_status, completed_timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id, chapter_name, section_name) DO UPDATE SET
+                        study_status = excluded.study_status,
+                        completed_timestamp = excluded.completed_timestamp
+                """, rows)
+        finally:
+            conn.close()
+
+        events = []
+        imported = set()
+        for user_id, chapter_name, section_name, status, completed_timestamp in rows:
+            if user_id != self.user_id:
+                continue
+            key = (chapter_name, section_name)
+            imported.add(key)
+            events.append(self._event(chapter_name, section_name, status == 1,
+                                      before.get(key, False), completed_timestamp))
+            # 同一小节在导入数据中出现多次时，以上一条为准计算变化
+            before[key] = status == 1
+        if replace_users and self.user_id in {row[0] for row in rows}:
+            # 被清空且没有重新导入的小节
+            for (chapter_name, section_name), was_completed in before.items():
+                if (chapter_name, section_name) not in imported:
+                    events.append(self._event(chapter_name, section_name, False, was_completed))
+        self._emit(events)
+        return len(rows)
@@ -4,4 +4,12 @@ from src.utils.KVUtils import KVUtils
 APP_NAME = 'Aithon'
 kvUtils = KVUtils()
 ai_handler = AIRequestHandlerWithHistory()
-STUDY_DIR="assets/study"
\ No newline at end of file
+# KV 中保存是否允许故障转移到其他 LLM 配置的键，默认不转移
+LLM_FALLBACK_KEY = "llm_fallback"
+ai_handler.router.fallback = kvUtils.get_bool(LLM_FALLBACK_KEY, default=False)
+# KV 中保存生成对话摘要所用模型的键，未设置时与当前配置相同
+SUMMARY_MODEL_KEY = "summary_model"
+ai_handler.summary_model = kvUtils.get_str(SUMMARY_MODEL_KEY) or None
+STUDY_DIR="assets/study"
+# KV 中保存当前学习者的键
+CURRENT_USER_KEY = "current_user_id"
\ No newline at end of file
@@ -5,10 +5,10 @@ from typing import Optional
 from flet.core.list_tile import ListTile
 from datetime import datetime
 
-from src.str.APP_CONFIG import STUDY_DIR
+from src.str.APP_CONFIG import STUDY_DIR, CURRENT_USER_KEY, kvUtils
 from src.ui.study.study_pagel import study_page
 from src.utils.CN2AN_Utils import extract_number
-from src.db.study_progress_db import StudyProgressDB
+from src.db.study_progress_db import StudyProgressDB, DEFAULT_USER
 
 
 def natural_key(text: str):
@@ -37,6 +37,7 @@ def format_completion_time(timestamp_str: str) -> str:
 class HomeContent(ft.Column):
     """
     首页内容组件，支持加载本地课件目录，按自然顺序排序（支持中文数字）
+    订阅学习进度的变更，只更新发生变化的小节和所在章节的计数，不重建整棵目录
     """
 
     def __init__(self, on_back=None):
@@ -44,25 +45,70 @@ class HomeContent(ft.Column):
         self.on_back = on_back
         self._is_mounted = False
         self.load_dir = STUDY_DIR  # 课件目录
-        self.db = StudyProgressDB("study_progress.db")  # 初始化学习进度数据库
+        # 初始化学习进度数据库（当前学习者）
+        self.db = StudyProgressDB("study_progress.db",
+                                  user_id=kvUtils.get_str(CURRENT_USER_KEY, default=DEFAULT_USER))
+        # (章节, 小节) -> 小节列表项
+        self._section_tiles = {}
+        # (章节, 小节) -> 列表项当前显示的完成状态，章节计数按它的变化增减
+        self._section_completed = {}
+        # 章节 -> {"panel", "subtitle", "completed", "total"}
+        self._chapters = {}
         self._build_ui()
+        self.db.subscribe(self._on_progress_changed)
+
+    @staticmethod
+    def _chapter_icon(completed_count, total_sections):
+        """章节状态图标"""
+        if completed_count == total_sections and total_sections > 0:
+            return ft.Icon(ft.Icons.CHECK_CIRCLE, size=28, color=ft.Colors.GREEN)
+        elif completed_count > 0:
+            return ft.Icon(ft.Icons.PLAY_CIRCLE_FILL, size=28, color=ft.Colors.ORANGE)
+        return ft.Icon(ft.Icons.BOOK, size=28, color=ft.Colors.BLUE)
+
+    @staticmethod
+    def _section_icon(is_completed):
+        """小节状态图标"""
+        if is_completed:
+            return ft.Icon(ft.Icons.CHECK_CIRCLE, size=22, color=ft.Colors.GREEN)
+        return ft.Icon(ft.Icons.ARTICLE, size=22, color=ft.Colors.GREY)
+
+    @staticmethod
+    def _section_subtitle(is_completed, completed_time):
+        """小节副标题（显示完成时间）"""
+        if is_completed and completed_time:
+            time_str = format_completion_time(completed_time)
+            return ft.Text(f"已完成 - {time_str}", size=11, color=ft.Colors.GREEN)
+        return ft.Text("未完成", size=11, color=ft.Colors.GREY)
+
+    def _load_progress(self):
+        """一次查询读取当前学习者的全部进度，不再逐个小节查询"""
+        return {(record["chapter_name"], record["section_name"]): record
+                for record in self.db.get_all_progress()}
 
     def _build_ui(self):
         """构建UI，加载章节"""
         self.controls = []
+        self._section_tiles = {}
+        self._section_completed = {}
+        self._chapters = {}
 
         if not os.path.exists(self.load_dir):
             self.controls.append(ft.Text("课件目录不存在", color=ft.Colors.RED))
             return
 
+        progress = self._load_progress()
+
         # 遍历章节
         for chapter in sorted(os.listdir(self.load_dir), key=natural_key):
             chapter_path = os.path.join(self.load_dir, chapter)
             if os.path.isdir(chapter_path):
-                # 获取章节完成统计
-                completed_count = self.db.get_chapter_completed_count(chapter)
-                total_sections = len([s for s in os.listdir(chapter_path) 
-                                    if os.path.isdir(os.path.join(chapter_path, s))])
+                sections = [s for s in sorted(os.listdir(chapter_path), key=natural_key)
+                            if os.path.isdir(os.path.join(chapter_path, s))]
+                # 获取章节完成统计（只统计目录中存在的小节）
+                completed_count = sum(1 for s in sections
+                                      if progress.get((chapter, s)) and progress[(chapter, s)]["is_completed"])
+                total_sections = len(sections)
                 
                 # 构建章节标题和副标题
                 chapter_title = ft.Text(chapter, weight=ft.FontWeight.BOLD, size=16)
@@ -72,58 +118,41 @@ class HomeContent(ft.Column):
                     color=ft.Colors.GREY
                 )
                 
-                # 章节状态图标
-                if completed_count == total_sections and total_sections > 0:
-                    chapter_icon = ft.Icon(ft.Icons.CHECK_CIRCLE, size=28, color=ft.Colors.GREEN)
-                elif completed_count > 0:
-                    chapter_icon = ft.Icon(ft.Icons.PLAY_CIRCLE_FILL, size=28, color=ft.Colors.ORANGE)
-                else:
-                    chapter_icon = ft.Icon(ft.Icons.BOOK, size=28, color=ft.Colors.BLUE)
-                
                 # 折叠面板
                 chapter_panel = ft.ExpansionTile(
-                    leading=chapter_icon,
+                    leading=self._chapter_icon(completed_count, total_sections),
                     title=chapter_title,
                     subtitle=chapter_subtitle,
                     controls=[],
                     maintain_state=True,  # 保持状态
                     tile_padding=ft.padding.only(left=16, right=16),  # 设置内边距
                 )
+                self._chapters[chapter] = {
+                    "panel": chapter_panel,
+                    "subtitle": chapter_subtitle,
+                    "completed": completed_count,
+                    "total": total_sections,
+                }
 
                 # 遍历小节
-                for section in sorted(os.listdir(chapter_path), key=natural_key):
+                for section in sections:
                     section_path = os.path.join(chapter_path, section)
-                    if os.path.isdir(section_path):
-                        # 获取小节学习状态
-                        section_status = self.db.get_section_status(chapter, section)
-                        is_completed = section_status["is_completed"]
-                        completed_time = section_status["completed_timestamp"]
-                        
-                        # 小节状态图标
-                        if is_completed:
-                            section_icon = ft.Icon(ft.Icons.CHECK_CIRCLE, size=22, color=ft.Colors.GREEN)
-                        else:
-                            section_icon = ft.Icon(ft.Icons.ARTICLE, size=22, color=ft.Colors.GREY)
-                        
-                        # 小节标题
-                        section_title = ft.Text(section, size=14, weight=ft.FontWeight.W_500)
-                        
-                        # 小节副标题（显示完成时间）
-                        if is_completed and completed_time:
-                            time_str = format_completion_time(completed_time)
-                            section_subtitle = ft.Text(f"已完成 - {time_str}", size=11, color=ft.Colors.GREEN)
-                        else:
-                            section_subtitle = ft.Text("未完成", size=11, color=ft.Colors.GREY)
-                        
-                        # 创建小节列表项
-                        section_tile = ListTile(
-                            leading=section_icon,
-                            title=section_title,
-                            subtitle=section_subtitle,
-                            on_click=lambda e, sp=section_path: study_page(sp, self.page, on_back=self.on_back)
-                        )
-                        
-                        chapter_panel.controls.append(section_tile)
+                    # 获取小节学习状态
+                    record = progress.get((chapter, section))
+                    is_completed = bool(record and record["is_completed"])
+                    completed_time = record["completed_timestamp"] if record else None
+
+                    # 创建小节列表项
+                    section_tile = ListTile(
+                        leading=self._section_icon(is_completed),
+                        title=ft.Text(section, size=14, weight=ft.FontWeight.W_500),
+                        subtitle=self._section_subtitle(is_completed, completed_time),
+                        on_click=lambda e, sp=section_path: study_page(sp, self.page, on_back=self.on_back)
+                    )
+
+                    chapter_panel.controls.append(section_tile)
+                    self._section_tiles[(chapter, section)] = section_tile
+                    self._section_completed[(chapter, section)] = is_completed
 
                 self.controls.append(chapter_panel)
 
@@ -133,6 +162,66 @@ class HomeContent(ft.Column):
         self.scroll = ft.ScrollMode.AUTO  # 启用自动滚动
         self.padding = ft.padding.only(left=16, top=16, right=16, bottom=16)  # 添加容器内边距
 
+    def _on_progress_changed(self, event):
+        """学习进度变更：只替换对应小节的图标和副标题，以及章节的计数和图标"""
+        if event.get("user_id", self.db.user_id) != self.db.user_id:
+            return
+        chapter = event["chapter_name"]
+        key = (chapter, event["section_name"])
+        section_tile = self._section_tiles.get(key)
+        chapter_info = self._chapters.get(chapter)
+        if section_tile is None:
+            return
+        is_completed = bool(event["is_completed"])
+        section_tile.leading = self._section_icon(is_completed)
+        section_tile.subtitle = self._section_subtitle(is_completed, event["completed_timestamp"])
+        changed = [section_tile]
+
+        # 以列表项当前显示的状态为准，重复的完成事件不会让计数漂移
+        was_completed = self._section_completed.get(key, False)
+        self._section_completed[key] = is_completed
+        if chapter_info is not None and is_completed != was_completed:
+            chapter_info["completed"] += 1 if is_completed else -1
+            completed_count = chapter_info["completed"]
+            chapter_info["subtitle"].value = f"已完成 {completed_count}/{chapter_info['total']} 个小节"
+            chapter_info["panel"].leading = self._chapter_icon(completed_count, chapter_info["total"])
+            changed.append(chapter_info["panel"])
+
+        if not self.page:
+            return
+        try:
+            for control in changed:
+                control.update()
+        except Exception as e:
+            # 组件已不在页面上，下次显示时会带上最新状态
+            print(f"更新学习进度显示失败: {e}")
+
+    def set_user(self, user_id):
+        """切换学习者：只读取该学习者的进度，更新已有的列表项，不重建目录"""
+        if (user_id or DEFAULT_USER) == self.db.user_id:
+            return
+        self.db.set_user(user_id)
+        progress = self._load_progress()
+        completed_counts = {}
+
+        for (chapter, section), section_tile in self._section_tiles.items():
+            record = progress.get((chapter, section))
+            is_completed = bool(record and record["is_completed"])
+            section_tile.leading = self._section_icon(is_completed)
+            section_tile.subtitle = self._section_subtitle(
+                is_completed, record["completed_timestamp"] if record else None)
+            self._section_completed[(chapter, section)] = is_completed
+            completed_counts[chapter] = completed_counts.get(chapter, 0) + is_completed
+
+        for chapter, chapter_info in self._chapters.items():
+            completed_count = completed_counts.get(chapter, 0)
+            chapter_info["completed"] = completed_count
+            chapter_info["subtitle"].value = f"已完成 {completed_count}/{chapter_info['total']} 个小节"
+            chapter_info["panel"].leading = self._chapter_icon(completed_count, chapter_info["total"])
+
+        if self.page:
+            self.update()
+
     def refresh_ui(self):
         """刷新UI，重新加载学习进度"""
         self._build_ui()
@@ -5,9 +5,14 @@ import sys
 import os
 import webbrowser
 
-from src.str.APP_CONFIG import kvUtils
+from src.str.APP_CONFIG import kvUtils, ai_handler, CURRENT_USER_KEY, LLM_FALLBACK_KEY
+from src.db.chat_retention import ChatRetention
+from src.db.learning_events_db import learning_events
+from src.db.study_progress_db import StudyProgressDB, DEFAULT_USER
 from src.ui.llm.llm_settings import llm_setting_page
-from src.utils.SystemInfo import get_system_info, format_system_info
+from src.utils.PythonEnvManager import python_env_manager
+from src.utils.SystemInfo import get_system_info, format_system_info, prefetch_system_info, \
+    is_system_info_ready
 
 
 class SettingItem(ft.Control):
@@ -42,6 +47,9 @@ class SettingContent(ft.Column):
         self.p = page
         self.on_back = on_back
         self._build_ui()
+        # 后台预热环境探测缓存，打开系统信息时无需等待子进程
+        python_env_manager.get_environment_info_async()
+        prefetch_system_info()
 
     def _build_ui(self):
         self.controls = [
@@ -52,6 +60,15 @@ class SettingContent(ft.Column):
                 subtitle=ft.Text("配置DeepSeek、Ollama的LLM服务", size=12, color=ft.Colors.GREY),
                 on_click=lambda e: llm_setting_page(self.p, on_back=self.on_back),
             ),
+            # 故障转移：当前模型不可用时是否改用其他已保存的配置（可能是云端接口）
+            ft.ListTile(
+                leading=ft.Icon(ft.Icons.SWAP_HORIZ, size=30),
+                title=ft.Text("模型故障转移", weight=ft.FontWeight.BOLD),
+                subtitle=ft.Text("当前模型无响应时改用其他已保存的配置，对话可能被发送到云端", size=12,
+                                 color=ft.Colors.GREY),
+                trailing=ft.Switch(value=kvUtils.get_bool(LLM_FALLBACK_KEY, default=False),
+                                   on_change=self._on_fallback_changed),
+            ),
             # 聊天记录历史条数设置
             ft.ListTile(
                 leading=ft.Icon(ft.Icons.HISTORY, size=30),
@@ -59,6 +76,29 @@ class SettingContent(ft.Column):
                 subtitle=ft.Text("聊天会加载几条历史记录，当作记忆？", size=12, color=ft.Colors.GREY),
                 on_click=self._open_history_setting,
             ),
+            # 聊天记录归档：长期未使用的会话移出数据库，再次打开时自动恢复
+            ft.ListTile(
+                leading=ft.Icon(ft.Icons.ARCHIVE, size=30),
+                title=ft.Text("自动归档旧聊天", weight=ft.FontWeight.BOLD),
+                subtitle=ft.Text("半年未使用的会话压缩保存到 chat_archive 目录，再次打开时自动恢复", size=12,
+                                 color=ft.Colors.GREY),
+                trailing=ft.Switch(value=kvUtils.get_bool(ChatRetention.ARCHIVE_ENABLED_KEY, default=False),
+                                   on_change=self._on_archive_changed),
+            ),
+            # 整理聊天数据库（完整 VACUUM，只在用户手动触发时执行）
+            ft.ListTile(
+                leading=ft.Icon(ft.Icons.CLEANING_SERVICES, size=30),
+                title=ft.Text("整理聊天数据库", weight=ft.FontWeight.BOLD),
+                subtitle=ft.Text("回收已删除记录占用的空间，之后启动时自动增量回收", size=12, color=ft.Colors.GREY),
+                on_click=self._compact_chat_db,
+            ),
+            # 当前学习者（多人共用一台电脑时分别记录进度）
+            ft.ListTile(
+                leading=ft.Icon(ft.Icons.PERSON, size=30),
+                title=ft.Text("当前学习者", weight=ft.FontWeight.BOLD),
+                subtitle=ft.Text("多人共用时切换学习者，分别记录学习进度", size=12, color=ft.Colors.GREY),
+                on_click=self._open_user_setting,
+            ),
             # 捐款支持
             ft.ListTile(
                 leading=ft.Icon(ft.Icons.FAVORITE, size=30, color=ft.Colors.RED),
@@ -92,6 +132,30 @@ class SettingContent(ft.Column):
         self.horizontal_alignment = ft.CrossAxisAlignment.CENTER
         self.spacing = 20
 
+    def _on_fallback_changed(self, e):
+        enabled = bool(e.control.value)
+        kvUtils.put_bool(LLM_FALLBACK_KEY, enabled)
+        ai_handler.router.fallback = enabled
+
+    def _on_archive_changed(self, e):
+        kvUtils.put_bool(ChatRetention.ARCHIVE_ENABLED_KEY, bool(e.control.value))
+
+    def _compact_chat_db(self, e):
+        def show(text):
+            self.p.snack_bar = ft.SnackBar(ft.Text(text))
+            self.p.snack_bar.open = True
+            self.p.update()
+
+        def run():
+            try:
+                size = ChatRetention(kv=kvUtils).compact()
+                show(f"整理完成，数据库大小 {size['file_bytes'] / 1024 / 1024:.1f} MB")
+            except Exception as ex:
+                show(f"整理数据库失败: {ex}")
+
+        show("正在整理聊天数据库...")
+        threading.Thread(target=run, daemon=True).start()
+
     def _open_history_setting(self, e):
         max_load_history = kvUtils.get_int("max_load_history", default=20)
 
@@ -118,6 +182,39 @@ class SettingContent(ft.Column):
         self.p.open(dlg_modal)
         self.p.update()
 
+    def _open_user_setting(self, e):
+        current_user = kvUtils.get_str(CURRENT_USER_KEY, default=DEFAULT_USER)
+        users = [u["user_id"] for u in StudyProgressDB("study_progress.db").get_users()]
+
+        def on_submit(e):
+            user_id = (tf.value or "").strip()
+            if not user_id:
+                tf.error_text = "请输入学习者名称"
+                dlg_modal.update()
+                return
+            kvUtils.put_str(CURRENT_USER_KEY, user_id)
+            learning_events.set_user(user_id)
+            # 首页目录只更新各小节的状态，不重建
+            home_content = getattr(self.p, "home_content", None)
+            if home_content is not None:
+                home_content.set_user(user_id)
+            self.p.close(dlg_modal)
+
+        tf = ft.TextField(value=current_user, label="学习者", hint_text="输入名称或学号", width=200)
+        content = ft.Column([tf], tight=True)
+        if users:
+            content.controls.append(ft.Text("已有学习者：" + "、".join(users), size=12, color=ft.Colors.GREY))
+        dlg_modal = ft.AlertDialog(
+            title=ft.Text("切换学习者"),
+            content=content,
+            actions=[ft.TextButton("确认", on_click=on_submit),
+                     ft.TextButton("取消", on_click=lambda e: self.p.close(dlg_modal))],
+            modal=True,
+        )
+        self.p.dialog = dlg_modal
+        self.p.open(dlg_modal)
+        self.p.update()
+
     def _open_donation_dialog(self, e):
         """打开捐款支持对话框"""
         # 创建捐款信息内容
@@ -234,21 +331,37 @@ class SettingContent(ft.Column):
 
     def _open_system_info_dialog(self, e):
         """打开系统信息对话框"""
-        # 创建加载状态组件
-        loading_text = ft.Text("正在检测系统信息...", size=14, color=ft.Colors.BLUE)
-        loading_progress = ft.ProgressBar(width=400, visible=True)
-        loading_container = ft.Container(
-            content=ft.Column([
-                loading_text,
-                loading_progress
-            ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
-            padding=20
-        )
+        def info_content(formatted_info):
+            return ft.Container(
+                content=ft.Column([
+                    ft.Text("系统信息", size=16, weight=ft.FontWeight.BOLD),
+                    ft.Divider(),
+                    ft.Text(formatted_info, size=12, selectable=True)
+                ], scroll=ft.ScrollMode.AUTO),
+                padding=20,
+                width=500,
+                height=400
+            )
+
+        # 已有检测结果（可能已过期，过期项会在后台刷新）时直接显示
+        if is_system_info_ready():
+            content = info_content(format_system_info(get_system_info(wait=False)))
+        else:
+            # 创建加载状态组件
+            loading_text = ft.Text("正在检测系统信息...", size=14, color=ft.Colors.BLUE)
+            loading_progress = ft.ProgressBar(width=400, visible=True)
+            content = ft.Container(
+                content=ft.Column([
+                    loading_text,
+                    loading_progress
+                ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
+                padding=20
+            )
 
         # 创建对话框
         dialog = ft.AlertDialog(
             title=ft.Text("系统信息"),
-            content=loading_container,
+            content=content,
             actions=[
                 ft.TextButton("关闭", on_click=lambda e: self.p.close(dialog))
             ]
@@ -258,6 +371,9 @@ class SettingContent(ft.Column):
         self.p.open(dialog)
         self.p.update()
 
+        if is_system_info_ready():
+            return
+
         # 在后台线程中获取系统信息
         def get_info():
             try:
@@ -266,16 +382,7 @@ class SettingContent(ft.Column):
                 
                 # 更新UI
                 def update_ui():
-                    dialog.content = ft.Container(
-                        content=ft.Column([
-                            ft.Text("系统信息", size=16, weight=ft.FontWeight.BOLD),
-                            ft.Divider(),
-                            ft.Text(formatted_info, size=12, selectable=True)
-                        ], scroll=ft.ScrollMode.AUTO),
-                        padding=20,
-                        width=500,
-                        height=400
-                    )
+                    dialog.content = info_content(formatted_info)
                     self.p.update()
 
                 # 在主线程中更新UI
@@ -1,10 +1,10 @@
 import flet as ft
 from src.db.llm_config_db import LLMConfigDB
-from src.str.APP_CONFIG import ai_handler
 
 
 def llm_setting_page(page: ft.Page, on_back=None):
-    db = LLMConfigDB()
+    # 共享实例：保存或切换配置后，已订阅的请求处理器会自动刷新
+    db = LLMConfigDB.shared()
     # 进入本页面时，暂存并移除底部导航栏
     previous_navigation_bar = getattr(page, "navigation_bar", None)
     if previous_navigation_bar is not None:
@@ -140,7 +140,6 @@ def llm_setting_page(page: ft.Page, on_back=None):
         page.snack_bar = ft.SnackBar(ft.Text(f"保存为新配置（id={new_id}）"))
         page.snack_bar.open = True
         page.update()
-        ai_handler.refresh_config()
 
     # 模型切换
     def on_model_change(e):
@@ -53,7 +53,11 @@ def main_page(page: ft.Page, selected_index: int = 0):
         ]
     )
 
-    home_content = HomeContent(on_back=lambda a, selected_index=0: main_page(page, selected_index=selected_index))
+    # 首页目录在整个会话中复用，学习进度变化时由它自己局部更新，返回首页时不再重建
+    home_content = getattr(page, "home_content", None)
+    if home_content is None:
+        home_content = HomeContent(on_back=lambda a, selected_index=0: main_page(page, selected_index=selected_index))
+        page.home_content = home_content
     settings_content = SettingContent(
         page,
         on_back=lambda a, selected_index=0: main_page(page, selected_index=selected_index)
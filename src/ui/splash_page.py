@@ -4,7 +4,8 @@ import time
 import flet as ft
 from flet.core.types import FontWeight
 
-from src.str.APP_CONFIG import APP_NAME
+from src.db.chat_retention import ChatRetention
+from src.str.APP_CONFIG import APP_NAME, kvUtils
 from src.ui.main_page import main_page
 
 
@@ -32,4 +33,6 @@ def splash_page(page: ft.Page):
         page.clean()
         main_page(page)
         page.update()
-    threading.Thread(target=go_to_main, daemon=True).start()
\ No newline at end of file
+    threading.Thread(target=go_to_main, daemon=True).start()
+    # 后台按计划归档过期聊天记录（需在设置中开启）并增量回收数据库空间
+    ChatRetention(kv=kvUtils).run_maintenance_async()
\ No newline at end of file
@@ -1,12 +1,16 @@
 import os
+import time
 import pyperclip
 
 import flet as ft
-import yaml
 
 from src.ui.view.CodeRunner import CodeRunner
 from src.ui.view.chat_view import ChatPullToRefresh
-from src.db.study_progress_db import StudyProgressDB
+from src.db.study_progress_db import StudyProgressDB, DEFAULT_USER
+from src.db.learning_events_db import LearningEventsDB, learning_events
+from src.str.APP_CONFIG import ai_handler, kvUtils, CURRENT_USER_KEY
+from src.utils.LessonCache import lesson_cache
+from src.utils.LessonPrefetcher import lesson_prefetcher
 
 
 def study_page(study_dir, page: ft.Page, on_back=None):
@@ -18,7 +22,9 @@ def study_page(study_dir, page: ft.Page, on_back=None):
     chat_id = study_dir
 
     # 初始化学习进度数据库
-    db = StudyProgressDB("study_progress.db")
+    user_id = kvUtils.get_str(CURRENT_USER_KEY, default=DEFAULT_USER)
+    db = StudyProgressDB("study_progress.db", user_id=user_id)
+    learning_events.set_user(user_id)
 
     # 提取章节和小节名称
     # 假设路径结构为: assets/study/第001章-开始/第001节-写在前面
@@ -40,8 +46,12 @@ def study_page(study_dir, page: ft.Page, on_back=None):
             if "章" in parent_name:
                 chapter_name = parent_name
 
-    with open(config_path, encoding='utf-8') as f:
-        config = yaml.load(f, Loader=yaml.SafeLoader)
+    # 记录打开课程，离开时记录停留时长
+    opened_at = time.monotonic()
+    lesson_state = {"closed": False}
+    learning_events.log(LearningEventsDB.LESSON_OPEN, chapter_name, section_name)
+
+    config = lesson_cache.get_config(config_path)
     isShowCode = config["code"]
     codeReturn = config["codeReturn"]
     codeExample = config["codeExample"]
@@ -49,8 +59,7 @@ def study_page(study_dir, page: ft.Page, on_back=None):
 
     if codeExample:
         code_path = os.path.join(study_dir, "code.py")
-        with open(code_path, "r", encoding="utf-8") as f:
-            codeBody = f.read()
+        codeBody = lesson_cache.get_text(code_path)
         print("codeBody:", codeBody)
 
     previous_navigation_bar = getattr(page, "navigation_bar", None)
@@ -102,6 +111,11 @@ def study_page(study_dir, page: ft.Page, on_back=None):
             print(f"清理页面时出错: {ex}")
 
     def back_click(e):
+        if not lesson_state["closed"]:
+            lesson_state["closed"] = True
+            learning_events.log(LearningEventsDB.LESSON_CLOSE, chapter_name, section_name,
+                                value=round(time.monotonic() - opened_at, 1))
+
         # 先进行彻底清理
         cleanup_page()
 
@@ -147,15 +161,32 @@ def study_page(study_dir, page: ft.Page, on_back=None):
     # 清理旧内容
     page.clean()
 
-    # 读取 study.md 内容
-    if os.path.exists(study_md):
-        with open(study_md, "r", encoding="utf-8") as f:
-            md_content = f.read()
+    # 读取 study.md 的拆分结果（按内容哈希缓存）
+    lesson = lesson_cache.get(study_md)
+    if lesson:
+        md_sections = [section["markdown"] for section in lesson["sections"]]
     else:
-        md_content = "# 没有找到 study.md 文件"
+        md_sections = ["# 没有找到 study.md 文件"]
+
+    def make_markdown(md_text):
+        # 位于 ListView 中的 Column 里，高度不受限，不能设置 expand
+        return ft.Markdown(
+            md_text,
+            selectable=True,
+            extension_set=ft.MarkdownExtensionSet.GITHUB_WEB,
+            code_theme=ft.MarkdownCodeTheme.GOOGLE_CODE,
+            on_tap_link=lambda e: page.launch_url(e.data),
+        )
+
+    # 先只渲染第一节，其余小节在页面显示后逐步追加
+    md_column = ft.Column([make_markdown(md_sections[0])], spacing=0)
 
     if isShowCode:
-        code_runner = CodeRunner(page, codeReturn)
+        code_runner = CodeRunner(
+            page, codeReturn,
+            on_run=lambda ok: learning_events.log(LearningEventsDB.CODE_RUN, chapter_name, section_name,
+                                                  value=1 if ok else 0)
+        )
         code_alert = ft.Markdown(
             """
             # 请在此处输入代码
@@ -173,7 +204,12 @@ def study_page(study_dir, page: ft.Page, on_back=None):
         code_alert = None
 
     # 右边聊天区
-    chat_view = ChatPullToRefresh(chat_id=chat_id)
+    chat_view = ChatPullToRefresh(
+        chat_id=chat_id,
+        on_ask=lambda text: learning_events.log(LearningEventsDB.AI_ASK, chapter_name, section_name)
+    )
+    # 后台预热本地模型和本节的对话前缀，缩短第一次提问的等待
+    ai_handler.warm_up(chat_id, n=chat_view.history_limit)
     chat_content = ft.Container(
         content=chat_view,
         alignment=ft.alignment.center,
@@ -292,6 +328,8 @@ def study_page(study_dir, page: ft.Page, on_back=None):
             page.update()
             return
 
+        learning_events.log(LearningEventsDB.COMPLETE, chapter_name, section_name)
+
         # 关闭确认对话框
         if hasattr(page, 'dialog') and page.dialog:
             page.close(page.dialog)
@@ -310,7 +348,6 @@ def study_page(study_dir, page: ft.Page, on_back=None):
 
         # 延迟1秒后退出页面
         def exit_page():
-            import time
             time.sleep(1)
             # 检查页面是否已经被手动关闭
             if hasattr(page, 'dialog') and not page.dialog:
@@ -553,14 +590,7 @@ def study_page(study_dir, page: ft.Page, on_back=None):
             controls=[
                 # 学习内容区域
                 ft.Container(
-                    content=ft.Markdown(
-                        md_content,
-                        selectable=True,
-                        extension_set=ft.MarkdownExtensionSet.GITHUB_WEB,
-                        code_theme=ft.MarkdownCodeTheme.GOOGLE_CODE,
-                        on_tap_link=lambda e: page.launch_url(e.data),
-                        expand=True,
-                    ),
+                    content=md_column,
                     padding=ft.padding.all(20),
                     bgcolor=ft.Colors.WHITE,
                     border_radius=12,
@@ -709,3 +739,21 @@ def study_page(study_dir, page: ft.Page, on_back=None):
 
     page.add(layout)
     page.update()
+
+    def render_remaining_sections():
+        """分批追加剩余小节，每批更新一次页面，批次之间让出时间给界面渲染和用户操作"""
+        batch = 2
+        for start in range(1, len(md_sections), batch):
+            time.sleep(0.05)
+            if md_column.page is None:
+                # 页面已经关闭
+                return
+            for md_text in md_sections[start:start + batch]:
+                md_column.controls.append(make_markdown(md_text))
+            md_column.update()
+
+    if len(md_sections) > 1:
+        page.run_thread(render_remaining_sections)
+
+    # 后台预取前后相邻的小节
+    lesson_prefetcher.prefetch_around(study_dir, history_limit=chat_view.history_limit)
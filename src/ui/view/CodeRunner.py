@@ -4,10 +4,14 @@ import flet as ft
 
 
 class CodeRunner(ft.Column):
-    def __init__(self, page: ft.Page, codeReturn):
+    def __init__(self, page: ft.Page, codeReturn, on_run=None):
+        """
+        :param on_run: 每次运行后调用，参数为结果是否正确
+        """
         super().__init__()
         self.page = page
         self.codeReturn = codeReturn
+        self.on_run = on_run
         self.code_input = ft.TextField(
             label="请输入 Python 代码",
             multiline=True,
@@ -32,6 +36,7 @@ class CodeRunner(ft.Column):
 
         local_vars = {}
         result = None
+        isOk = ""
         try:
             exec(code, {}, local_vars)
             last_line = code.strip().splitlines()[-1] if code.strip() else ""
@@ -39,7 +44,6 @@ class CodeRunner(ft.Column):
                 result = eval(last_line, {}, local_vars)
             except:
                 result = None
-            isOk = ""
             output = sys.stdout.getvalue()
             errors = sys.stderr.getvalue()
             output_text = ""
@@ -64,6 +68,12 @@ class CodeRunner(ft.Column):
         finally:
             sys.stdout, sys.stderr = old_stdout, old_stderr
 
+        if self.on_run:
+            try:
+                self.on_run(isOk == "结果正确")
+            except Exception as ex:
+                print(f"运行回调失败: {ex}")
+
         self.page.update()
 
     def set_default_code(self, code):
@@ -11,9 +11,13 @@ from src.ui.view.RitchView import RichContent
 
 
 class ChatPullToRefresh(PullToRefreshList):
-    def __init__(self, chat_id=None, **kwargs):
+    def __init__(self, chat_id=None, on_ask=None, **kwargs):
+        """
+        :param on_ask: 每次向 AI 提问时以问题文本调用
+        """
         super().__init__(**kwargs)
         self.chat_id = chat_id
+        self.on_ask = on_ask
         self.history_offset_id = None
 
         max_load_history = kvUtils.get_int("max_load_history", default=20)
@@ -112,7 +116,20 @@ class ChatPullToRefresh(PullToRefreshList):
         def error_callback(err):
             self.add_message(f"错误: {err}", is_user=False)
 
-        ai_handler.send_message(self.chat_id, user_text, callback, error_callback, n=self.history_limit)
+        def failover_callback(label):
+            # 请求被转发到其他 provider 时明确告知用户
+            if self.page:
+                self.page.snack_bar = ft.SnackBar(ft.Text(f"当前模型无响应，已切换到 {label}"))
+                self.page.snack_bar.open = True
+                self.page.update()
+
+        ai_handler.send_message(self.chat_id, user_text, callback, error_callback, n=self.history_limit,
+                                failover_callback=failover_callback)
+        if self.on_ask:
+            try:
+                self.on_ask(user_text)
+            except Exception as ex:
+                print(f"提问回调失败: {ex}")
 
     # ------------------ 历史消息 ------------------
     def load_recent_history_after_mount(self):
@@ -1,20 +1,52 @@
 import json
+import sqlite3
+import threading
+import time
 import requests
 from openai import OpenAI
 
 from src.db.chat_db import ChatDB
+from src.db.chat_retention import ChatRetention
 from src.db.llm_config_db import LLMConfigDB
+from src.utils.LLMRouter import LLMRouter
+from src.utils.StreamDecoder import SSEDecoder, NDJSONDecoder
+
+_MISSING = object()
 
 
 class AIRequestHandlerWithHistory:
     def __init__(self):
         self.handler = AIRequestHandler.from_current_config()
+        # 开启故障转移后，当前配置失败或超时时切换到其他已配置的 provider（默认关闭）
+        self.router = LLMRouter(self.handler, AIRequestHandler.from_config)
         self.db = ChatDB()
         self._cancelled = False
+        # 每个会话历史窗口的起始消息id，见 _history_window
+        self._window_anchors = {}
+        # 正在生成摘要的会话，同一会话同时只运行一个摘要任务
+        self._summarizing = set()
+        self._summary_lock = threading.Lock()
+        # 进行中的对话请求数和最后一次请求结束的时间，摘要只在空闲时生成
+        self._active_requests = 0
+        self._last_request_end = time.monotonic()
+        # 生成摘要使用的模型，None 表示与当前配置相同
+        self.summary_model = None
+        # 预取的聊天记录第一页 {(chat_id, limit): records}，读取一次后失效
+        self._history_prefetch = {}
+        # 每次丢弃预取结果时递增，预取期间发生过丢弃则不保存结果
+        self._history_generation = 0
+        self._prefetch_lock = threading.Lock()
+        # 归档管理，首次打开空会话时才创建
+        self._retention = None
+        # 配置变更时自动刷新，无需在请求路径上重新读取数据库
+        LLMConfigDB.shared().subscribe(self._on_config_changed)
 
     def refresh_config(self):
         self.handler.refresh_config()
 
+    def _on_config_changed(self, config):
+        self.handler.refresh_config(config)
+
     def cancel_current_request(self):
         """取消当前正在进行的请求"""
         self._cancelled = True
@@ -32,38 +64,209 @@ class AIRequestHandlerWithHistory:
         """
         组装前 n 条历史 + 当前输入，返回 messages 格式
         """
-        history = self.db.get_recent_chat(chat_id, limit=n)
+        messages = self._history_messages(chat_id, n)
+        messages.append({"role": "user", "content": new_prompt})
+        return messages
+
+    def _history_messages(self, chat_id, n):
+        """历史窗口转换为 messages，窗口之前的对话以摘要的形式放在最前面"""
+        history = self._history_window(chat_id, n)
         messages = []
+        if history:
+            summary, last_id = self.db.get_summary(chat_id)
+            if summary and last_id < history[0][0]:
+                messages.append({"role": "system", "content": f"以下是本次对话较早内容的摘要：\n{summary}"})
         for record in history:
             msg_id, role, content, *_ = record
             if role == "user":
                 messages.append({"role": "user", "content": content})
             elif role == "assistant":
                 messages.append({"role": "assistant", "content": content})
-
-        messages.append({"role": "user", "content": new_prompt})
         return messages
 
+    def _history_window(self, chat_id, n):
+        """
+        取最近的历史记录，窗口起点固定在某条消息上，窗口在 n 到 1.5n 条之间增长，
+        超过 1.5n 条时才整体前移到最近的 n 条，发送给模型的历史始终不少于 n 条（历史足够时）
+        这样多轮对话中发送给模型的前缀大部分时候保持不变，Ollama 等服务可以复用已计算的前缀缓存，
+        而逐条滑动的窗口每轮都会改变前缀，导致整段上下文重新计算
+        """
+        max_window = n + max(1, n // 2)
+        history = self.db.get_recent_chat(chat_id, limit=max_window)
+        if not history:
+            self._window_anchors.pop(chat_id, None)
+            return history
+
+        anchor = self._window_anchors.get(chat_id)
+        if anchor is not None and (len(history) < max_window or history[0][0] <= anchor):
+            window = [record for record in history if record[0] >= anchor]
+            if len(window) >= min(n, len(history)):
+                return window
+
+        window = history[-n:]
+        self._window_anchors[chat_id] = window[0][0]
+        return window
+
+    def warm_up(self, chat_id=None, n=20):
+        """
+        在后台预热模型（打开学习页面时调用），用户提问时无需等待模型加载和历史前缀计算
+        """
+        if not self.handler.valid or self.handler.provider != "ollama":
+            return
+
+        def run():
+            messages = self._history_messages(chat_id, n) if chat_id is not None else []
+            self.handler.warm_up(messages)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    # ---------------- 滚动摘要 ----------------
+    # 窗口之前累计多少条未摘要的消息后更新摘要
+    SUMMARY_THRESHOLD = 6
+    # 单次摘要最多处理的消息条数
+    SUMMARY_BATCH = 40
+    # 最后一次对话请求结束后空闲多少秒才开始生成摘要
+    SUMMARY_IDLE_SECONDS = 15
+
+    def _begin_request(self):
+        with self._summary_lock:
+            self._active_requests += 1
+
+    def _end_request(self):
+        with self._summary_lock:
+            self._active_requests -= 1
+            self._last_request_end = time.monotonic()
+
+    def _chat_active(self):
+        """是否有对话请求正在进行"""
+        return self._active_requests > 0
+
+    def _wait_until_idle(self):
+        """等待没有对话请求且空闲超过 SUMMARY_IDLE_SECONDS"""
+        while True:
+            idle = time.monotonic() - self._last_request_end
+            if not self._chat_active() and idle >= self.SUMMARY_IDLE_SECONDS:
+                return
+            time.sleep(self.SUMMARY_IDLE_SECONDS if self._chat_active() else self.SUMMARY_IDLE_SECONDS - idle)
+
+    def _summary_handler(self):
+        """
+        生成摘要使用的独立请求处理器
+        固定使用当前配置的 provider，不经过路由器，不会把对话转发到其他 provider；
+        配置了 summary_model 时改用该模型（本地 ollama 建议用小模型），不占用对话模型的缓存
+        """
+        config = LLMConfigDB.shared().get_current_config()
+        if not config:
+            return None
+        if self.summary_model:
+            config = dict(config, model=self.summary_model)
+        handler = AIRequestHandler.from_config(config)
+        return handler if handler.valid else None
+
+    def _schedule_summary(self, chat_id):
+        """
+        历史窗口之前的未摘要消息达到阈值时，在后台把它们并入该会话的摘要
+        摘要只覆盖已经滑出窗口的消息，窗口内的原文仍然完整发送；
+        等到对话空闲后才开始，有新的提问时立即放弃
+        """
+        window_start = self._window_anchors.get(chat_id)
+        if window_start is None:
+            return
+        _, last_id = self.db.get_summary(chat_id)
+        if self.db.count_messages_between(chat_id, last_id, window_start) < self.SUMMARY_THRESHOLD:
+            return
+
+        with self._summary_lock:
+            if chat_id in self._summarizing:
+                return
+            self._summarizing.add(chat_id)
+
+        def run():
+            # 后台线程使用独立连接
+            db = None
+            try:
+                self._wait_until_idle()
+                db = ChatDB(self.db.db_path)
+                self._update_summary(db, chat_id, window_start)
+            except Exception as e:
+                print(f"更新对话摘要失败: {e}")
+            finally:
+                if db is not None:
+                    db.conn.close()
+                with self._summary_lock:
+                    self._summarizing.discard(chat_id)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _update_summary(self, db, chat_id, window_start):
+        handler = self._summary_handler()
+        if handler is None:
+            return
+        summary, last_id = db.get_summary(chat_id)
+        while True:
+            records = db.get_messages_between(chat_id, last_id, window_start, limit=self.SUMMARY_BATCH)
+            if len(records) < (self.SUMMARY_THRESHOLD if summary else 1):
+                return
+
+            dialogue = "\n".join(
+                f"{'学生' if role == 'user' else '助教'}: {content}"
+                for _, role, content, *_ in records if role in ("user", "assistant")
+            )
+            prompt = (
+                "请把下面的编程辅导对话整理成简洁的摘要，保留学生的问题、已经讲解过的概念、"
+                "代码中的关键结论和尚未解决的问题，不超过300字，直接输出摘要内容。\n\n"
+            )
+            if summary:
+                prompt += f"已有摘要：\n{summary}\n\n新增对话：\n{dialogue}"
+            else:
+                prompt += f"对话：\n{dialogue}"
+
+            # 用户开始新的提问时立即放弃，下次回复后重新安排
+            parts = []
+            errors = []
+            handler.stream_response_with_history(
+                [{"role": "user", "content": prompt}], parts.append, errors.append,
+                cancel_check=self._chat_active
+            )
+            if self._chat_active():
+                return
+            result = "".join(parts).strip()
+            if errors or not result:
+                print(f"生成对话摘要失败: {errors[-1] if errors else '空回复'}")
+                return
+            summary = result
+            last_id = records[-1][0]
+            db.save_summary(chat_id, summary, last_id)
+
     # ---------------- 单次请求 ----------------
     def get_single_response(self, chat_id, prompt, n=20):
-        if not self.handler.valid:
+        if not self.router.valid:
             return None, "当前没有配置 LLM，请先到设置页面添加或选择配置。"
 
         # 先保存用户消息
         self.db.save_message(chat_id, "user", prompt)
+        self._drop_history_prefetch(chat_id)
         
         # 构建消息（包含历史记录作为记忆）
         messages = self.build_prompt_with_history(chat_id, prompt, n)
-        
-        resp = self.handler.get_response_with_history(messages)
+
+        self._begin_request()
+        try:
+            resp = self.router.get_response_with_history(messages)
+        finally:
+            self._end_request()
         
         # 保存AI响应
         self.db.save_message(chat_id, "assistant", resp)
+        self._schedule_summary(chat_id)
         return chat_id, resp
 
     # ---------------- 流式请求 ----------------
-    def send_message(self, chat_id, prompt, callback=None, error_callback=None, n=20):
-        if not self.handler.valid:
+    def send_message(self, chat_id, prompt, callback=None, error_callback=None, n=20, failover_callback=None):
+        """
+        :param failover_callback: 请求被转发到其他 provider 时以其名称调用，用于提示用户
+        """
+        if not self.router.valid:
             if callback:
                 callback("当前没有配置 LLM，请先到设置页面添加或选择配置。")
             return None
@@ -73,6 +276,7 @@ class AIRequestHandlerWithHistory:
 
         # 先保存用户消息
         self.db.save_message(chat_id, "user", prompt)
+        self._drop_history_prefetch(chat_id)
         
         full_response = ""
 
@@ -93,16 +297,22 @@ class AIRequestHandlerWithHistory:
         # 构建消息（包含历史记录作为记忆）
         messages = self.build_prompt_with_history(chat_id, prompt, n)
 
-        self.handler.stream_response_with_history(
-            messages,
-            callback=inner_callback,
-            error_callback=inner_error_callback,
-            cancel_check=self.is_cancelled
-        )
+        self._begin_request()
+        try:
+            self.router.stream_response_with_history(
+                messages,
+                callback=inner_callback,
+                error_callback=inner_error_callback,
+                cancel_check=self.is_cancelled,
+                failover_callback=failover_callback
+            )
+        finally:
+            self._end_request()
 
         # 如果没有被取消，保存AI响应
         if not self.is_cancelled():
             self.db.save_message(chat_id, "assistant", full_response)
+            self._schedule_summary(chat_id)
         return chat_id
 
     # ---------------- 历史记录 ----------------
@@ -111,26 +321,37 @@ class AIRequestHandlerWithHistory:
 
     def delete_chat_history(self, chat_id):
         self.db.delete_chat(chat_id)
+        self._drop_history_prefetch(chat_id)
     
-    def clean_contaminated_messages(self, chat_id):
-        """清理被污染的消息（包含user/assistant标签的消息）"""
-        history = self.db.get_chat(chat_id)
-        cleaned_count = 0
-        
-        for record in history:
-            msg_id, role, content, timestamp = record
-            # 检查是否包含污染标签
-            if role == "assistant" and ("user\n" in content or "assistant\n" in content or "User:" in content or "Assistant:" in content):
-                # 删除这条被污染的消息
-                c = self.db.conn.cursor()
-                c.execute("DELETE FROM chat WHERE id=?", (msg_id,))
-                self.db.conn.commit()
-                cleaned_count += 1
-                print(f"清理被污染的消息: {content[:50]}...")
-        
-        if cleaned_count > 0:
-            print(f"已清理 {cleaned_count} 条被污染的消息")
-        return cleaned_count
+    def clean_contaminated_messages(self, chat_id=None, all_chats=False, background=False, callback=None):
+        """
+        清理被污染的消息（包含user/assistant标签的消息）
+        :param chat_id: 只清理指定会话
+        :param all_chats: 清理所有会话，必须显式指定，不能只省略 chat_id
+        :param background: 在后台线程中执行，完成后以清理条数调用 callback
+        :return: 前台执行时返回清理条数
+        """
+        if chat_id is None and not all_chats:
+            raise ValueError("请指定 chat_id，或显式传入 all_chats=True 清理所有会话")
+
+        def run():
+            conn = sqlite3.connect(self.db.db_path) if background else None
+            try:
+                cleaned_count = self.db.delete_contaminated_messages(chat_id, all_chats=all_chats, conn=conn)
+                self._drop_history_prefetch(chat_id)
+            finally:
+                if conn is not None:
+                    conn.close()
+            if cleaned_count > 0:
+                print(f"已清理 {cleaned_count} 条被污染的消息")
+            if callback:
+                callback(cleaned_count)
+            return cleaned_count
+
+        if background:
+            threading.Thread(target=run, daemon=True).start()
+            return None
+        return run()
     
     def force_clean_all_assistant_messages(self, chat_id):
         """强制清理所有assistant消息（用于严重污染的情况）"""
@@ -142,7 +363,59 @@ class AIRequestHandlerWithHistory:
         return deleted_count
 
     def get_recent_history(self, chat_id, last_id=None, limit=20):
-        return self.db.get_recent_chat(chat_id, last_id=last_id, limit=limit)
+        if last_id is not None:
+            return self.db.get_recent_chat(chat_id, last_id=last_id, limit=limit)
+        with self._prefetch_lock:
+            records = self._history_prefetch.pop((chat_id, limit), None)
+        # 预取之后会话又有新消息（如其他连接写入）时不再使用
+        if records is not None and self.get_last_message_id(chat_id) != (records[-1][0] if records else None):
+            records = None
+        if records is None:
+            records = self.db.get_recent_chat(chat_id, limit=limit)
+        # 热表中没有记录时检查归档，已归档的会话在打开时恢复
+        if not records and self._restore_archived_chat(chat_id):
+            records = self.db.get_recent_chat(chat_id, limit=limit)
+        return records
+
+    def _restore_archived_chat(self, chat_id):
+        """会话已被归档时恢复到热表，返回是否恢复了消息"""
+        if self._retention is None:
+            self._retention = ChatRetention(db_path=self.db.db_path)
+        if not self._retention.is_archived(chat_id):
+            return False
+        try:
+            restored = self._retention.restore_chat(chat_id)
+        except (OSError, EOFError, ValueError) as e:
+            # 归档保持原样，不删除摘要
+            print(f"恢复归档的会话失败 {chat_id}: {e}")
+            return False
+        print(f"已恢复归档的会话 {chat_id}，共 {restored} 条消息")
+        return restored > 0
+
+    def prefetch_history(self, chat_id, limit=20):
+        """
+        预先读取会话的最新一页记录（在后台线程中调用，使用独立连接）
+        :param chat_id: 必须与打开会话时使用的 chat_id 完全一致
+        """
+        generation = self._history_generation
+        db = ChatDB(self.db.db_path)
+        try:
+            records = db.get_recent_chat(chat_id, limit=limit)
+        finally:
+            db.conn.close()
+        with self._prefetch_lock:
+            if self._history_generation == generation:
+                self._history_prefetch[(chat_id, limit)] = records
+
+    def _drop_history_prefetch(self, chat_id=None):
+        """丢弃会话的预取结果，chat_id 为 None 时丢弃全部；正在进行的预取也会作废"""
+        with self._prefetch_lock:
+            self._history_generation += 1
+            if chat_id is None:
+                self._history_prefetch.clear()
+                return
+            for key in [k for k in self._history_prefetch if k[0] == chat_id]:
+                self._history_prefetch.pop(key, None)
 
     def get_last_message_id(self, chat_id):
         history = self.db.get_recent_chat(chat_id, limit=1)
@@ -152,12 +425,19 @@ class AIRequestHandlerWithHistory:
 
 
 class AIRequestHandler:
-    def __init__(self, provider=None, model=None, base_url=None, api_key=None, valid=True):
+    # 请求超时（连接, 读取）秒数，避免服务无响应时无限等待
+    DEFAULT_TIMEOUT = (10, 120)
+    # Ollama 在最后一次请求后保持模型加载的时长，期间前缀缓存也会保留
+    OLLAMA_KEEP_ALIVE = "30m"
+
+    def __init__(self, provider=None, model=None, base_url=None, api_key=None, valid=True,
+                 timeout=DEFAULT_TIMEOUT):
         self.provider = provider
         self.model = model or "deepseek-r1:14b"
         self.base_url = base_url.rstrip("/") if base_url else None
         self.api_key = api_key
         self.valid = valid
+        self.timeout = timeout
         self.is_local_model = provider == "本地"
 
         self._init_client()
@@ -168,7 +448,7 @@ class AIRequestHandler:
             return
 
         if self.provider.lower() == "openai":
-            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout[1])
         elif self.provider.lower() == "deepseek":
             self.deepseek_url = "https://api.deepseek.com/v1/chat/completions"
             self.client = None
@@ -182,8 +462,10 @@ class AIRequestHandler:
 
     @classmethod
     def from_current_config(cls):
-        db = LLMConfigDB()
-        config = db.get_current_config()
+        return cls.from_config(LLMConfigDB.shared().get_current_config())
+
+    @classmethod
+    def from_config(cls, config):
         if not config:
             return cls(valid=False)
         provider = config.get("provider")
@@ -223,9 +505,13 @@ class AIRequestHandler:
             # 未知的provider，返回无效配置
             return cls(valid=False)
 
-    def refresh_config(self):
-        db = LLMConfigDB()
-        config = db.get_current_config()
+    def refresh_config(self, config=_MISSING):
+        """
+        重新加载配置
+        :param config: 变更通知中携带的新配置，不传时读取共享配置缓存
+        """
+        if config is _MISSING:
+            config = LLMConfigDB.shared().get_current_config()
         if not config:
             self.valid = False
             self.provider = None
@@ -250,6 +536,24 @@ class AIRequestHandler:
             self.base_url = None
         self._init_client()
 
+    # ---------------- 预热 ----------------
+    def warm_up(self, messages=None):
+        """
+        让 Ollama 提前加载模型；传入历史消息时同时预先计算这段前缀，
+        之后以相同前缀开头的请求只需处理新增的消息
+        """
+        if not self.valid or self.provider != "ollama":
+            return
+        try:
+            url = f"{self.base_url}/api/chat"
+            payload = {"model": self.model, "messages": messages or [], "stream": False,
+                       "keep_alive": self.OLLAMA_KEEP_ALIVE}
+            if messages:
+                payload["options"] = {"num_predict": 1}
+            requests.post(url, json=payload, timeout=self.timeout).raise_for_status()
+        except Exception as e:
+            print(f"预热Ollama模型失败: {e}")
+
     # ---------------- 单次响应（带历史） ----------------
     def get_response_with_history(self, messages):
         try:
@@ -269,8 +573,9 @@ class AIRequestHandler:
             
             elif self.provider == "ollama":
                 url = f"{self.base_url}/api/chat"
-                payload = {"model": self.model, "messages": messages, "stream": False}
-                resp = requests.post(url, json=payload)
+                payload = {"model": self.model, "messages": messages, "stream": False,
+                           "keep_alive": self.OLLAMA_KEEP_ALIVE}
+                resp = requests.post(url, json=payload, timeout=self.timeout)
                 resp.raise_for_status()
                 return resp.json().get("message", {}).get("content", "")
 
@@ -284,7 +589,7 @@ class AIRequestHandler:
             elif self.provider == "deepseek":
                 headers = {"Authorization": f"Bearer {self.api_key}"}
                 payload = {"model": self.model, "messages": messages, "stream": False}
-                resp = requests.post(self.deepseek_url, headers=headers, json=payload)
+                resp = requests.post(self.deepseek_url, headers=headers, json=payload, timeout=self.timeout)
                 resp.raise_for_status()
                 data = resp.json()
                 return data["choices"][0]["message"]["content"]
@@ -314,18 +619,17 @@ class AIRequestHandler:
                 
             elif self.provider == "ollama":
                 url = f"{self.base_url}/api/chat"
-                payload = {"model": self.model, "messages": messages, "stream": True}
-                with requests.post(url, json=payload, stream=True) as resp:
+                payload = {"model": self.model, "messages": messages, "stream": True,
+                           "keep_alive": self.OLLAMA_KEEP_ALIVE}
+                with requests.post(url, json=payload, stream=True, timeout=self.timeout) as resp:
                     resp.raise_for_status()
-                    for line in resp.iter_lines():
+                    for chunk in NDJSONDecoder(resp):
                         # 检查是否需要取消
                         if cancel_check and cancel_check():
                             break
-                        if line:
-                            chunk = json.loads(line.decode("utf-8"))
-                            text = chunk.get("message", {}).get("content", "")
-                            if text:
-                                callback(text)
+                        text = chunk.get("message", {}).get("content", "")
+                        if text:
+                            callback(text)
 
             elif self.provider == "openai":
                 stream = self.client.chat.completions.create(
@@ -344,20 +648,19 @@ class AIRequestHandler:
             elif self.provider == "deepseek":
                 headers = {"Authorization": f"Bearer {self.api_key}"}
                 payload = {"model": self.model, "messages": messages, "stream": True}
-                with requests.post(self.deepseek_url, headers=headers, json=payload, stream=True) as resp:
+                with requests.post(self.deepseek_url, headers=headers, json=payload, stream=True,
+                                   timeout=self.timeout) as resp:
                     resp.raise_for_status()
-                    for line in resp.iter_lines():
+                    for event in SSEDecoder(resp):
                         # 检查是否需要取消
                         if cancel_check and cancel_check():
                             break
-                        if line and line.startswith(b"data: "):
-                            data = line[len(b"data: "):].decode("utf-8")
-                            if data == "[DONE]":
-                                break
-                            chunk = json.loads(data)
-                            delta = chunk["choices"][0]["delta"].get("content", "")
-                            if delta:
-                                callback(delta)
+                        if event.data == "[DONE]":
+                            break
+                        chunk = json.loads(event.data)
+                        delta = chunk["choices"][0]["delta"].get("content", "")
+                        if delta:
+                            callback(delta)
 
 
         except Exception as e:
@@ -0,0 +1,177 @@
+"""
+内容寻址的分块存储
+分块以MD5命名保存在 <root>/<前两位>/<哈希> 下，相同内容只保存一份，
+在不同文件、不同版本之间自动去重
+也用作整文件的对象存储，支持 reflink 方式零拷贝入库
+硬链接会让存储中的对象与源文件共用同一份数据，只能显式指定，且仅适用于只读目录
+"""
+
+import os
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Iterable, Optional
+
+# Linux FICLONE ioctl，用于在 btrfs/xfs 等文件系统上创建 reflink
+_FICLONE = 0x40049409
+
+
+def reflink_file(source: str, target: str):
+    """创建写时复制的 reflink，文件系统不支持时抛出 OSError"""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("当前平台不支持 reflink")
+    try:
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+        raise
+
+
+def link_or_copy(source: str, target: str, link_mode: str = "auto") -> str:
+    """
+    把 source 放到 target，优先使用零拷贝方式
+    :param link_mode: auto 依次尝试 reflink、复制；也可指定 reflink / hardlink / copy
+                      hardlink 不会自动回退，仅用于源与目标都不会被原地修改的只读目录
+    :return: 实际使用的方式
+    """
+    if link_mode not in ("auto", "reflink", "hardlink", "copy"):
+        raise ValueError(f"未知的链接方式: {link_mode}")
+    if link_mode in ("auto", "reflink"):
+        try:
+            reflink_file(source, target)
+            return "reflink"
+        except OSError:
+            if link_mode == "reflink":
+                raise
+    if link_mode == "hardlink":
+        os.link(source, target)
+        return "hardlink"
+    shutil.copy2(source, target)
+    return "copy"
+
+
+class ChunkStore:
+    """分块存储"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, chunk_hash: str) -> Path:
+        """分块在存储中的路径"""
+        return self.root / chunk_hash[:2] / chunk_hash
+
+    @staticmethod
+    def relative_url(chunk_hash: str) -> str:
+        """分块相对于存储根目录的URL路径，发布到服务器后客户端按此下载"""
+        return f"{chunk_hash[:2]}/{chunk_hash}"
+
+    def has(self, chunk_hash: str) -> bool:
+        return self.path_for(chunk_hash).exists()
+
+    def missing(self, chunk_hashes: Iterable[str]) -> set:
+        """返回存储中缺少的分块哈希"""
+        return {h for h in chunk_hashes if not self.has(h)}
+
+    def put(self, data: bytes, chunk_hash: Optional[str] = None) -> str:
+        """
+        保存分块，已存在则跳过
+        :return: 分块哈希
+        """
+        if chunk_hash is None:
+            chunk_hash = hashlib.md5(data).hexdigest()
+        target = self.path_for(chunk_hash)
+        if target.exists():
+            return chunk_hash
+
+        target.parent.mkdir(exist_ok=True)
+        tmp_file = target.with_name(f"{chunk_hash}.{os.getpid()}.tmp")
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, target)
+        return chunk_hash
+
+    def put_file(self, source: str, file_hash: str, link_mode: str = "auto") -> str:
+        """
+        以整文件为对象入库，已存在则跳过
+        注意：hardlink 方式与源文件共享数据，源文件被原地修改会直接损坏已入库的对象
+        :return: 入库方式 exists / reflink / hardlink / copy
+        """
+        target = self.path_for(file_hash)
+        if target.exists():
+            return "exists"
+
+        target.parent.mkdir(exist_ok=True)
+        tmp_file = target.with_name(f"{file_hash}.{os.getpid()}.tmp")
+        if tmp_file.exists():
+            tmp_file.unlink()
+        method = link_or_copy(str(source), str(tmp_file), link_mode)
+        os.replace(tmp_file, target)
+        return method
+
+    def get(self, chunk_hash: str, verify: bool = False) -> Optional[bytes]:
+        """读取分块，不存在或校验失败时返回None"""
+        target = self.path_for(chunk_hash)
+        try:
+            with open(target, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            # 更新修改时间，prune 时按最近使用排序
+            os.utime(target)
+        except OSError:
+            pass
+        if verify and hashlib.md5(data).hexdigest() != chunk_hash:
+            print(f"分块校验失败，已丢弃: {chunk_hash}")
+            try:
+                target.unlink()
+            except OSError:
+                pass
+            return None
+        return data
+
+    def prune(self, max_bytes: int) -> int:
+        """
+        存储总大小超过 max_bytes 时，按最近使用时间删除最旧的分块
+        :return: 删除的分块数
+        """
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def size(self) -> int:
+        """存储占用的总字节数"""
+        total = 0
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
@@ -0,0 +1,210 @@
+"""
+内容定义分块 (Content-Defined Chunking)
+使用 Gear 滚动哈希寻找分块边界，插入或删除少量字节只会影响附近的分块，
+其余分块的哈希保持不变，增量更新只需传输真正变化的部分
+更新构建工具和客户端更新器共用本模块，保证两端切分结果一致
+
+安装了 numpy 时按块向量化计算滚动哈希，切分结果与逐字节计算完全相同，模型等大文件同样按内容分块；
+没有 numpy 时逐字节计算较慢，构建工具对超过 PURE_PYTHON_MAX_FILE_SIZE 的文件改用固定大小分块
+"""
+
+import hashlib
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 默认分块参数：最小 512KB，平均 2MB，最大 8MB
+DEFAULT_MIN_SIZE = 512 * 1024
+DEFAULT_AVG_SIZE = 2 * 1024 * 1024
+DEFAULT_MAX_SIZE = 8 * 1024 * 1024
+
+# 没有 numpy 时，超过该大小的文件不做内容定义分块，改用固定大小分块
+PURE_PYTHON_MAX_FILE_SIZE = 64 * 1024 * 1024
+
+# 默认的内容定义分块文件大小上限，None 表示不限
+DEFAULT_MAX_FILE_SIZE = None if np is not None else PURE_PYTHON_MAX_FILE_SIZE
+
+# 每次从文件读取的大小，必须不小于最大分块
+READ_SIZE = 16 * 1024 * 1024
+
+_HASH_BITS = 32
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+# 向量化计算时每次处理的字节数
+_SCAN_BLOCK = 1024 * 1024
+
+
+def _build_gear_table() -> List[int]:
+    """生成固定的 Gear 表，两端必须完全一致，因此由MD5推导而不是随机生成"""
+    table = []
+    for i in range(256):
+        digest = hashlib.md5(f"aithon-gear-{i}".encode("utf-8")).digest()
+        table.append(int.from_bytes(digest[:4], "little"))
+    return table
+
+
+GEAR = _build_gear_table()
+_GEAR_NP = np.array(GEAR, dtype=np.uint32) if np is not None else None
+
+
+def _high_bits_mask(bits: int) -> int:
+    """取哈希高位作为判断位，高位受窗口内更多字节影响"""
+    bits = max(1, min(bits, _HASH_BITS))
+    return ((1 << bits) - 1) << (_HASH_BITS - bits)
+
+
+def chunk_params(min_size: int = DEFAULT_MIN_SIZE, avg_size: int = DEFAULT_AVG_SIZE,
+                 max_size: int = DEFAULT_MAX_SIZE,
+                 max_file_size: Optional[int] = DEFAULT_MAX_FILE_SIZE) -> Dict[str, Optional[int]]:
+    """
+    校验并返回分块参数字典（写入 update.json，客户端按同样参数切分）
+    :param max_file_size: 超过该大小的文件使用固定大小分块，None 表示不限
+    """
+    if not (0 < min_size <= avg_size <= max_size):
+        raise ValueError(f"分块参数不合法: min={min_size}, avg={avg_size}, max={max_size}")
+    if max_size > READ_SIZE:
+        raise ValueError(f"最大分块不能超过 {READ_SIZE} 字节")
+    return {"min": min_size, "avg": avg_size, "max": max_size, "max_file": max_file_size}
+
+
+def use_cdc(file_size: int, params: Dict[str, Optional[int]]) -> bool:
+    """文件是否按内容定义分块"""
+    max_file = params.get("max_file")
+    return max_file is None or file_size <= max_file
+
+
+def _window_hashes(data: bytes, lo: int, hi: int):
+    """
+    向量化计算 data[lo:hi] 每个位置的 Gear 哈希
+    32 位哈希每步左移一位，第 k 个之前的字节贡献 GEAR[b] << k，超过 32 个字节后移出，
+    因此哈希只取决于最近 32 个字节，可以用倍增法一次算出所有位置；要求 lo >= 31
+    """
+    a = lo - (_HASH_BITS - 1)
+    h = _GEAR_NP[np.frombuffer(data, dtype=np.uint8, count=hi - a, offset=a)]
+    step = 1
+    while step < _HASH_BITS:
+        shifted = h.copy()
+        shifted[step:] += h[:-step] << np.uint32(step)
+        h = shifted
+        step *= 2
+    return h[lo - a:]
+
+
+def find_cut_point(data: bytes, start: int, end: int, min_size: int, avg_size: int,
+                   max_size: int) -> int:
+    """
+    在 data[start:end] 中寻找下一个分块边界（FastCDC 归一化分块）
+    平均长度之前使用更严格的掩码，之后使用更宽松的掩码，使分块长度集中在平均值附近
+    :return: 分块结束位置（不含）
+    """
+    length = end - start
+    if length <= min_size:
+        return end
+    if length > max_size:
+        length = max_size
+
+    avg_bits = max(1, avg_size.bit_length() - 1)
+    mask_strict = _high_bits_mask(avg_bits + 2)
+    mask_loose = _high_bits_mask(avg_bits - 2)
+
+    gear = GEAR
+    h = 0
+    i = start + min_size
+    normal_end = start + min(avg_size, length)
+    hard_end = start + length
+
+    if np is not None and hard_end - i > _HASH_BITS:
+        # 前 31 个字节窗口未满，逐字节计算；之后的哈希与滑动窗口哈希相同，按块向量化查找
+        warm_end = i + _HASH_BITS - 1
+        while i < warm_end:
+            mask = mask_strict if i < normal_end else mask_loose
+            h = ((h << 1) + gear[data[i]]) & _HASH_MASK
+            i += 1
+            if not (h & mask):
+                return i
+        for mask, region_end in ((mask_strict, normal_end), (mask_loose, hard_end)):
+            while i < region_end:
+                block_end = min(i + _SCAN_BLOCK, region_end)
+                hits = np.flatnonzero((_window_hashes(data, i, block_end) & np.uint32(mask)) == 0)
+                if hits.size:
+                    return i + int(hits[0]) + 1
+                i = block_end
+        return hard_end
+
+    while i < normal_end:
+        h = ((h << 1) + gear[data[i]]) & _HASH_MASK
+        i += 1
+        if not (h & mask_strict):
+            return i
+
+    while i < hard_end:
+        h = ((h << 1) + gear[data[i]]) & _HASH_MASK
+        i += 1
+        if not (h & mask_loose):
+            return i
+
+    return hard_end
+
+
+def iter_chunks(stream: BinaryIO, min_size: int = DEFAULT_MIN_SIZE,
+                avg_size: int = DEFAULT_AVG_SIZE,
+                max_size: int = DEFAULT_MAX_SIZE) -> Iterator[Tuple[int, bytes]]:
+    """
+    按内容切分二进制流
+    :return: 迭代 (偏移量, 分块数据)
+    """
+    buf = b""
+    pos = 0
+    offset = 0
+    eof = False
+
+    while True:
+        if not eof and len(buf) - pos < max_size:
+            data = stream.read(READ_SIZE)
+            if data:
+                buf = buf[pos:] + data
+                pos = 0
+            else:
+                eof = True
+            continue
+
+        if pos >= len(buf):
+            break
+
+        cut = find_cut_point(buf, pos, len(buf), min_size, avg_size, max_size)
+        chunk = buf[pos:cut]
+        yield offset, chunk
+        offset += len(chunk)
+        pos = cut
+
+
+def hash_file_cdc(file_path: str, min_size: int = DEFAULT_MIN_SIZE,
+                  avg_size: int = DEFAULT_AVG_SIZE,
+                  max_size: int = DEFAULT_MAX_SIZE) -> Tuple[str, List[List]]:
+    """
+    一次读取计算整体MD5和内容定义分块
+    放在模块级别，便于在进程池中调用
+    :return: (文件哈希, [[分块哈希, 分块长度], ...])
+    """
+    file_md5 = hashlib.md5()
+    chunks = []
+    with open(file_path, "rb") as f:
+        for _, chunk in iter_chunks(f, min_size, avg_size, max_size):
+            file_md5.update(chunk)
+            chunks.append([hashlib.md5(chunk).hexdigest(), len(chunk)])
+    return file_md5.hexdigest(), chunks
+
+
+def index_local_chunks(file_path: str, params: Dict[str, int]) -> Dict[str, Tuple[int, int]]:
+    """
+    按同样参数切分本地旧文件，返回 {分块哈希: (偏移量, 长度)}
+    客户端用它找出本地已有、无需下载的分块
+    """
+    index = {}
+    with open(file_path, "rb") as f:
+        for offset, chunk in iter_chunks(f, params["min"], params["avg"], params["max"]):
+            index.setdefault(hashlib.md5(chunk).hexdigest(), (offset, len(chunk)))
+    return index
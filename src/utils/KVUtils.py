@@ -1,11 +1,63 @@
 import os
 import json
+import atexit
+import threading
 from typing import Any
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class _FileLock:
+    """基于锁文件的跨进程互斥锁，防止多个进程同时写入"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+
 class KVUtils:
-    def __init__(self, path: str = "kv_store.json"):
+    def __init__(self, path: str = "kv_store.json", flush_delay: float = 0.2):
+        """
+        :param path: 存储文件路径
+        :param flush_delay: 写入合并的等待秒数，期间的多次修改只落盘一次
+        """
         self.path = path
+        self.flush_delay = flush_delay
+        self._lock = threading.RLock()
+        # 串行化本进程的写盘，_lock 只保护内存中的数据和待写入集合
+        self._write_lock = threading.Lock()
+        self._file_lock = _FileLock(path + ".lock")
         self._data = self._load()
+        # 尚未落盘的修改
+        self._dirty = set()
+        self._removed = set()
+        self._cleared = False
+        self._timer = None
+        atexit.register(self.flush)
 
     def _load(self) -> dict:
         if os.path.exists(self.path):
@@ -17,15 +69,78 @@ class KVUtils:
         return {}
 
     def _save(self):
-        with open(self.path, "w", encoding="utf-8") as f:
-            json.dump(self._data, f, ensure_ascii=False, indent=4)
+        """标记有修改，延迟 flush_delay 秒后统一写入"""
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """
+        立即把修改写入磁盘
+        先读取磁盘上的最新内容，只合并本进程修改过的键，避免覆盖其他进程的写入；
+        写入临时文件后原子替换，中途崩溃也不会留下半截文件。
+        只在取出待写入的修改时持有 _lock，等待文件锁和写盘期间 put/remove 不会被阻塞
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not (self._dirty or self._removed or self._cleared):
+                    return
+                dirty = {key: self._data[key] for key in self._dirty}
+                removed = set(self._removed)
+                cleared = self._cleared
+                self._dirty.clear()
+                self._removed.clear()
+                self._cleared = False
+
+            try:
+                with self._file_lock:
+                    merged = {} if cleared else self._load()
+                    for key in removed:
+                        merged.pop(key, None)
+                    merged.update(dirty)
+
+                    tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(merged, f, ensure_ascii=False, indent=4)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.path)
+            except Exception as e:
+                # 写入失败：放回待写入集合，写入期间又有新修改的键以新的修改为准
+                with self._lock:
+                    for key in dirty:
+                        if key in self._data and key not in self._removed:
+                            self._dirty.add(key)
+                    for key in removed:
+                        if key not in self._data:
+                            self._removed.add(key)
+                    self._cleared = self._cleared or cleared
+                print(f"保存KV存储失败: {e}")
+                return
+
+            with self._lock:
+                # 采用磁盘上的最新内容（含其他进程的修改），再叠加写入期间本进程的新修改
+                if self._cleared:
+                    merged = {}
+                for key in self._removed:
+                    merged.pop(key, None)
+                for key in self._dirty:
+                    merged[key] = self._data[key]
+                self._data = merged
 
     # ---------- 基础方法 ----------
     def put(self, key: str, value: Any):
         """存储任意值（自动推断类型）"""
         if isinstance(value, (int, float, bool, str)):
-            self._data[key] = value
-            self._save()
+            with self._lock:
+                self._data[key] = value
+                self._dirty.add(key)
+                self._removed.discard(key)
+                self._save()
         else:
             raise TypeError(f"Unsupported type: {type(value)}")
 
@@ -67,10 +182,17 @@ class KVUtils:
 
     # ---------- 工具方法 ----------
     def remove(self, key: str):
-        if key in self._data:
-            del self._data[key]
-            self._save()
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+                self._dirty.discard(key)
+                self._removed.add(key)
+                self._save()
 
     def clear(self):
-        self._data.clear()
-        self._save()
+        with self._lock:
+            self._data.clear()
+            self._dirty.clear()
+            self._removed.clear()
+            self._cleared = True
+            self._save()
@@ -0,0 +1,254 @@
+"""
+多个 LLM 配置之间的请求路由
+当前配置优先；开启故障转移后，在收到第一个 token 之前出错或超时，自动切换到下一个已配置的 provider。
+故障转移默认关闭，避免本地模型的对话在用户不知情时被发送到云端；每次切换都会通知调用方。
+可选的对冲请求：主请求超过 hedge_after 秒仍没有输出时，同时向下一个 provider 发起请求，
+谁先开始输出就用谁，其余请求取消。
+一旦某个请求开始输出就不再切换，避免把两个模型的回答拼在一起。
+"""
+
+import time
+import queue
+import threading
+from typing import Callable, Dict, List, Optional
+
+from src.db.llm_config_db import LLMConfigDB
+
+# 每个尝试向路由器汇报的事件类型
+_TOKEN = "token"
+_ERROR = "error"
+_DONE = "done"
+
+# 各 provider 等待第一个 token 的秒数，None 表示不限时
+# 本地 ollama 首次请求需要先加载模型，不能按云端接口的标准判定超时
+FIRST_TOKEN_TIMEOUTS = {
+    "ollama": None,
+}
+
+
+class _Attempt:
+    """一次向某个 provider 发起的请求"""
+
+    def __init__(self, index: int, handler, started_at: float):
+        self.index = index
+        self.handler = handler
+        self.started_at = started_at
+        self.cancelled = threading.Event()
+        self.failed = False
+
+    @property
+    def label(self) -> str:
+        return f"{self.handler.provider}/{self.handler.model}"
+
+
+class LLMRouter:
+    """按顺序在多个请求处理器之间故障转移"""
+
+    def __init__(self, primary, build_handler: Callable, db: Optional[LLMConfigDB] = None,
+                 fallback: bool = False, first_token_timeout: Optional[float] = 30,
+                 first_token_timeouts: Optional[Dict[str, Optional[float]]] = None,
+                 hedge_after: Optional[float] = None):
+        """
+        :param primary: 当前配置的请求处理器（由调用方负责刷新）
+        :param build_handler: 根据配置字典创建请求处理器的函数
+        :param fallback: 是否在失败时切换到其他已配置的 provider，默认关闭
+        :param first_token_timeout: 等待第一个 token 的秒数，超时视为失败，None 表示不限时
+        :param first_token_timeouts: 按 provider 覆盖 first_token_timeout，默认见 FIRST_TOKEN_TIMEOUTS
+        :param hedge_after: 超过该秒数仍无输出时发起对冲请求，None 表示不对冲
+        """
+        self.primary = primary
+        self.build_handler = build_handler
+        self.db = db or LLMConfigDB.shared()
+        self.fallback = fallback
+        self.first_token_timeout = first_token_timeout
+        self.first_token_timeouts = dict(FIRST_TOKEN_TIMEOUTS)
+        self.first_token_timeouts.update(first_token_timeouts or {})
+        self.hedge_after = hedge_after
+        self._fallbacks = []
+        self._fallbacks_version = None
+        self._lock = threading.Lock()
+
+    @property
+    def valid(self) -> bool:
+        return self.primary.valid or bool(self.fallback and self._fallback_handlers())
+
+    def _fallback_handlers(self) -> List:
+        """其他 provider 的处理器，每个 provider 取最新一条配置；配置表变化后重建"""
+        with self._lock:
+            version = self.db.version()
+            if self._fallbacks_version != version:
+                current = self.db.get_current_config()
+                current_id = current["id"] if current else None
+                handlers = []
+                seen = set()
+                for config in sorted(self.db.get_all_configs(), key=lambda c: c["id"], reverse=True):
+                    if config["id"] == current_id or config["provider"] in seen:
+                        continue
+                    seen.add(config["provider"])
+                    handler = self.build_handler(config)
+                    if handler.valid:
+                        handlers.append(handler)
+                self._fallbacks = handlers
+                self._fallbacks_version = version
+            return list(self._fallbacks)
+
+    def candidates(self) -> List:
+        """按优先级排列的请求处理器"""
+        handlers = [self.primary] if self.primary.valid else []
+        if self.fallback:
+            handlers.extend(self._fallback_handlers())
+        return handlers
+
+    def _first_token_timeout(self, attempt: _Attempt) -> Optional[float]:
+        return self.first_token_timeouts.get(attempt.handler.provider, self.first_token_timeout)
+
+    # ---------------- 流式响应 ----------------
+    def stream_response_with_history(self, messages, callback, error_callback=None, cancel_check=None,
+                                     failover_callback=None):
+        """
+        与 AIRequestHandler.stream_response_with_history 接口一致
+        :param failover_callback: 请求被转发到其他 provider 时以其名称（provider/model）调用
+        """
+        handlers = self.candidates()
+        if not handlers:
+            if error_callback:
+                error_callback("当前没有可用的 LLM 配置")
+            return
+
+        events = queue.Queue()
+        attempts: List[_Attempt] = []
+        winner: Optional[_Attempt] = None
+        errors = []
+
+        def start_next() -> bool:
+            if len(attempts) >= len(handlers):
+                return False
+            attempt = _Attempt(len(attempts), handlers[len(attempts)], time.monotonic())
+            attempts.append(attempt)
+            threading.Thread(target=self._run_attempt, args=(attempt, messages, events),
+                             daemon=True).start()
+            if attempt.index > 0 and failover_callback:
+                failover_callback(attempt.label)
+            return True
+
+        def active() -> List[_Attempt]:
+            return [a for a in attempts if not a.failed]
+
+        def timed_out(a: _Attempt, now: float) -> bool:
+            timeout = self._first_token_timeout(a)
+            return timeout is not None and now - a.started_at >= timeout
+
+        def cancel_others(keep: Optional[_Attempt]):
+            for a in attempts:
+                if a is not keep:
+                    a.cancelled.set()
+
+        start_next()
+        try:
+            while True:
+                if cancel_check and cancel_check():
+                    cancel_others(None)
+                    return
+
+                now = time.monotonic()
+                wait = 0.2
+                # 只有还有后备可切换时才对首个 token 计时，否则交给请求本身的超时
+                can_switch = len(attempts) < len(handlers)
+                if winner is None:
+                    # 第一个 token 的超时与对冲时间点
+                    if can_switch:
+                        for a in active():
+                            timeout = self._first_token_timeout(a)
+                            if timeout is not None:
+                                wait = min(wait, a.started_at + timeout - now)
+                    if self.hedge_after is not None and len(active()) == 1:
+                        wait = min(wait, attempts[-1].started_at + self.hedge_after - now)
+
+                try:
+                    kind, attempt, payload = events.get(timeout=max(wait, 0))
+                except queue.Empty:
+                    if winner is not None:
+                        continue
+                    now = time.monotonic()
+                    for a in active() if can_switch else []:
+                        if timed_out(a, now):
+                            a.failed = True
+                            a.cancelled.set()
+                            errors.append(f"{a.label}: 等待响应超时")
+                            print(f"LLM请求超时，切换provider: {a.label}")
+                    live = active()
+                    if not live:
+                        if not start_next():
+                            break
+                    elif (self.hedge_after is not None and len(live) == 1
+                          and now - attempts[-1].started_at >= self.hedge_after):
+                        if start_next():
+                            print(f"LLM请求较慢，发起对冲请求: {attempts[-1].label}")
+                    continue
+
+                if kind == _TOKEN:
+                    if attempt.failed:
+                        continue
+                    if winner is None:
+                        winner = attempt
+                        cancel_others(winner)
+                    if attempt is winner:
+                        callback(payload)
+                elif kind == _DONE:
+                    if winner is None and not attempt.failed:
+                        # 没有任何输出就正常结束，视为空回答
+                        winner = attempt
+                        cancel_others(winner)
+                    if attempt is winner:
+                        return
+                elif kind == _ERROR:
+                    if attempt is winner:
+                        # 已经开始输出，不再切换
+                        if error_callback:
+                            error_callback(payload)
+                        return
+                    if attempt.failed or winner is not None:
+                        continue
+                    attempt.failed = True
+                    errors.append(f"{attempt.label}: {payload}")
+                    if not self.fallback:
+                        break
+                    print(f"LLM请求失败，切换provider: {attempt.label}: {payload}")
+                    if not active() and not start_next():
+                        break
+        finally:
+            cancel_others(winner)
+
+        if error_callback:
+            error_callback("；".join(errors) if errors else "请求失败")
+
+    @staticmethod
+    def _run_attempt(attempt: _Attempt, messages, events: queue.Queue):
+        """在工作线程中执行一次流式请求，把结果转成事件"""
+        def on_token(text):
+            if not attempt.cancelled.is_set():
+                events.put((_TOKEN, attempt, text))
+
+        def on_error(err):
+            events.put((_ERROR, attempt, err))
+
+        try:
+            attempt.handler.stream_response_with_history(
+                messages,
+                callback=on_token,
+                error_callback=on_error,
+                cancel_check=attempt.cancelled.is_set
+            )
+        except Exception as e:
+            events.put((_ERROR, attempt, str(e)))
+        events.put((_DONE, attempt, None))
+
+    # ---------------- 单次响应 ----------------
+    def get_response_with_history(self, messages):
+        """与 AIRequestHandler.get_response_with_history 接口一致，失败时返回错误文本"""
+        parts = []
+        errors = []
+        self.stream_response_with_history(messages, parts.append, errors.append)
+        if errors and not parts:
+            return f"错误: {errors[-1]}"
+        return "".join(parts)
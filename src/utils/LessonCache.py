@@ -0,0 +1,227 @@
+"""
+课程内容缓存
+把 study.md 预先拆分为小节、代码块和目录，以文件内容哈希为键缓存在内存和磁盘上，
+再次打开同一课程时直接使用拆分好的结构，长课程可以按小节逐步渲染
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+
+# 缓存格式版本，拆分规则变化时递增，旧缓存自动失效
+CACHE_VERSION = 1
+
+# 磁盘缓存的总大小上限，超出时删除最久未使用的缓存文件
+MAX_CACHE_BYTES = 32 * 1024 * 1024
+
+# 作为拆分点的标题级别（# 到 ###）
+SPLIT_LEVEL = 3
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})\s*([\w+-]*)")
+
+
+def parse_lesson(text: str) -> Dict:
+    """
+    拆分 Markdown 文本
+    :return: {
+        "sections": [{"title", "level", "markdown"}],   # 按 SPLIT_LEVEL 及以上标题拆分
+        "toc": [{"title", "level", "section"}],         # 所有标题及所在小节序号
+        "code_blocks": [{"lang", "code", "section"}],
+    }
+    """
+    sections: List[Dict] = []
+    toc: List[Dict] = []
+    code_blocks: List[Dict] = []
+
+    current = {"title": "", "level": 0, "lines": []}
+    fence = None
+    fence_lang = ""
+    code_lines: List[str] = []
+
+    def flush():
+        if current["lines"] or current["title"]:
+            sections.append({
+                "title": current["title"],
+                "level": current["level"],
+                "markdown": "\n".join(current["lines"]).strip("\n"),
+            })
+
+    for line in text.splitlines():
+        if fence is None:
+            fence_match = _FENCE_RE.match(line)
+            if fence_match:
+                fence = fence_match.group(1)
+                fence_lang = fence_match.group(2)
+                code_lines = []
+                current["lines"].append(line)
+                continue
+
+            heading = _HEADING_RE.match(line)
+            if heading:
+                level = len(heading.group(1))
+                title = heading.group(2)
+                if level <= SPLIT_LEVEL:
+                    flush()
+                    current = {"title": title, "level": level, "lines": []}
+                toc.append({"title": title, "level": level, "section": len(sections)})
+        else:
+            if line.strip().startswith(fence):
+                code_blocks.append({"lang": fence_lang, "code": "\n".join(code_lines),
+                                    "section": len(sections)})
+                fence = None
+            else:
+                code_lines.append(line)
+        current["lines"].append(line)
+
+    flush()
+    if not sections:
+        sections.append({"title": "", "level": 0, "markdown": ""})
+    return {"sections": sections, "toc": toc, "code_blocks": code_blocks}
+
+
+class LessonCache:
+    """按内容哈希缓存拆分结果"""
+
+    def __init__(self, cache_dir: str = "lesson_cache", max_bytes: int = MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 路径 -> (修改时间, 大小, 哈希)，文件未变化时无需重新计算哈希
+        self._stats: Dict[str, tuple] = {}
+        # 哈希 -> 拆分结果
+        self._lessons: Dict[str, Dict] = {}
+        # 路径 -> (修改时间, 大小, 内容)，用于配置和示例代码等小文件
+        self._files: Dict[str, tuple] = {}
+
+    def _file_hash(self, path: str) -> Optional[str]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._stats.get(path)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                return cached[2]
+
+        with open(path, "rb") as f:
+            digest = hashlib.md5(f.read()).hexdigest()
+        with self._lock:
+            self._stats[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def _cache_file(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.v{CACHE_VERSION}.json")
+
+    def get(self, path: str) -> Optional[Dict]:
+        """
+        获取课程的拆分结果，文件不存在时返回None
+        依次查找内存缓存、磁盘缓存，都没有时解析并写入缓存
+        """
+        digest = self._file_hash(path)
+        if digest is None:
+            return None
+
+        with self._lock:
+            lesson = self._lessons.get(digest)
+        if lesson is not None:
+            return lesson
+
+        cache_file = self._cache_file(digest)
+        lesson = None
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    lesson = json.load(f)
+                # 更新修改时间，清理时按最近使用排序
+                os.utime(cache_file)
+            except Exception:
+                lesson = None
+
+        if lesson is None:
+            with open(path, "r", encoding="utf-8") as f:
+                lesson = parse_lesson(f.read())
+            self._save(cache_file, lesson)
+
+        with self._lock:
+            self._lessons[digest] = lesson
+        return lesson
+
+    def _load_file(self, path: str, loader: Callable[[str], Any]) -> Any:
+        """读取小文件并按修改时间和大小缓存，文件不存在时抛出 FileNotFoundError"""
+        st = os.stat(path)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                return cached[2]
+        value = loader(path)
+        with self._lock:
+            self._files[path] = (st.st_mtime_ns, st.st_size, value)
+        return value
+
+    def get_config(self, path: str) -> Dict:
+        """读取课程的 config.yaml"""
+        def load(p):
+            with open(p, encoding="utf-8") as f:
+                return yaml.load(f, Loader=yaml.SafeLoader)
+        return self._load_file(path, load)
+
+    def get_text(self, path: str) -> str:
+        """读取课程的文本文件（如示例代码 code.py）"""
+        def load(p):
+            with open(p, "r", encoding="utf-8") as f:
+                return f.read()
+        return self._load_file(path, load)
+
+    def _save(self, cache_file: str, lesson: Dict):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(lesson, f, ensure_ascii=False)
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            print(f"保存课程缓存失败: {e}")
+            return
+        self._prune()
+
+    def _prune(self):
+        """删除旧版本的缓存文件，总大小超过 max_bytes 时按最久未使用删除"""
+        suffix = f".v{CACHE_VERSION}.json"
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if not name.endswith(suffix):
+                    # 旧版本缓存或残留的临时文件
+                    if name.endswith(".json"):
+                        os.remove(path)
+                    continue
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+lesson_cache = LessonCache()
@@ -0,0 +1,106 @@
+"""
+相邻课程预取
+打开某一小节后，在后台线程中预先加载上一节和下一节的配置、课程内容、示例代码和聊天记录第一页，
+在章节中前后切换时无需再等待磁盘读取和解析
+"""
+
+import os
+import threading
+from typing import List, Optional
+
+from src.str.APP_CONFIG import ai_handler
+from src.utils.CN2AN_Utils import extract_number
+from src.utils.LessonCache import lesson_cache
+
+
+def _natural_key(text: str):
+    """与首页一致的自然排序：优先按数字，其次按文本"""
+    return [extract_number(text), text]
+
+
+def _sorted_dirs(path: str) -> List[str]:
+    try:
+        names = [n for n in os.listdir(path) if os.path.isdir(os.path.join(path, n))]
+    except OSError:
+        return []
+    return sorted(names, key=_natural_key)
+
+
+def neighbor_sections(study_dir: str) -> List[str]:
+    """
+    当前小节的上一节和下一节（跨章节时取上一章最后一节、下一章第一节）
+    返回的路径与首页用 os.path.join 拼出的写法一致，可直接作为学习页面的 chat_id；
+    只在比较时规范化，不改变路径的写法
+    :return: 相邻小节目录列表，下一节在前
+    """
+    chapter_dir = os.path.dirname(study_dir.rstrip(os.sep + (os.altsep or "")))
+    root_dir = os.path.dirname(chapter_dir)
+
+    # 按首页的顺序把所有小节排成一列
+    ordered = []
+    for chapter in _sorted_dirs(root_dir):
+        chapter_path = os.path.join(root_dir, chapter)
+        for section in _sorted_dirs(chapter_path):
+            ordered.append(os.path.join(chapter_path, section))
+
+    try:
+        index = [os.path.normpath(p) for p in ordered].index(os.path.normpath(study_dir))
+    except ValueError:
+        return []
+    neighbors = []
+    if index + 1 < len(ordered):
+        neighbors.append(ordered[index + 1])
+    if index > 0:
+        neighbors.append(ordered[index - 1])
+    return neighbors
+
+
+class LessonPrefetcher:
+    """在单个后台线程中预取课程，新的请求会替换尚未开始的旧请求"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Optional[tuple] = None
+        self._running = False
+
+    def prefetch_around(self, study_dir: str, history_limit: int = 20):
+        """预取 study_dir 前后相邻小节"""
+        with self._lock:
+            self._pending = (study_dir, history_limit)
+            if self._running:
+                return
+            self._running = True
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                job = self._pending
+                self._pending = None
+                if job is None:
+                    self._running = False
+                    return
+            study_dir, history_limit = job
+            for neighbor in neighbor_sections(study_dir):
+                try:
+                    self.prefetch_section(neighbor, history_limit)
+                except Exception as e:
+                    print(f"预取课程失败 {neighbor}: {e}")
+
+    @staticmethod
+    def prefetch_section(study_dir: str, history_limit: int = 20):
+        """加载一个小节的配置、课程内容、示例代码和聊天记录"""
+        config_path = os.path.join(study_dir, "config.yaml")
+        if not os.path.exists(config_path):
+            return
+        config = lesson_cache.get_config(config_path) or {}
+        lesson_cache.get(os.path.join(study_dir, "study.md"))
+        code_path = os.path.join(study_dir, "code.py")
+        if config.get("codeExample") and os.path.exists(code_path):
+            lesson_cache.get_text(code_path)
+
+        # 聊天记录以小节目录作为 chat_id，与 study_page 中的写法一致
+        ai_handler.prefetch_history(study_dir, limit=history_limit)
+
+
+lesson_prefetcher = LessonPrefetcher()
@@ -0,0 +1,135 @@
+"""
+探测结果缓存
+每个键有独立的过期时间；过期后先返回旧值，同时在后台刷新（stale-while-revalidate）；
+同一个键同时只会有一次加载在进行，并发调用者共享同一次结果（single-flight）
+用于缓存 nvidia-smi、子进程探测等耗时操作的结果
+"""
+
+import time
+import threading
+from typing import Any, Callable, Dict, Optional
+
+_MISSING = object()
+
+
+class _Flight:
+    """一次进行中的加载；等待者从这里取结果，即使加载期间键被失效"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _MISSING
+
+
+class _Entry:
+    """单个键的缓存状态"""
+
+    def __init__(self, loader: Callable[[], Any], ttl: float, default: Any):
+        self.loader = loader
+        self.ttl = ttl
+        self.default = default
+        self.value = _MISSING
+        self.loaded_at = 0.0
+        # 失效次数，失效前开始的加载不写回缓存，只交给已在等待的调用者
+        self.generation = 0
+        # 正在进行的加载，None 表示空闲
+        self.inflight: Optional[_Flight] = None
+
+
+class ProbeCache:
+    """按键注册加载函数的缓存"""
+
+    def __init__(self, default_ttl: float = 30):
+        self.default_ttl = default_ttl
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def register(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None,
+                 default: Any = None):
+        """
+        注册一个键
+        :param loader: 加载函数，无参数，返回要缓存的值
+        :param ttl: 过期秒数，默认使用 default_ttl
+        :param default: 尚无任何结果且不等待时返回的值
+        """
+        with self._lock:
+            self._entries[key] = _Entry(loader, self.default_ttl if ttl is None else ttl, default)
+
+    def get(self, key: str, wait: bool = True) -> Any:
+        """
+        获取缓存值
+        - 未过期：直接返回
+        - 已过期：返回旧值并在后台刷新
+        - 从未加载：wait=True 时阻塞直到加载完成（并发调用共享同一次加载），
+          wait=False 时在后台开始加载并立即返回默认值
+        """
+        with self._lock:
+            entry = self._entries[key]
+            has_value = entry.value is not _MISSING
+            fresh = has_value and (time.monotonic() - entry.loaded_at) < entry.ttl
+            if fresh:
+                return entry.value
+
+            flight = entry.inflight
+            owner = flight is None
+            if owner:
+                flight = _Flight()
+                entry.inflight = flight
+            generation = entry.generation
+
+        if has_value or not wait:
+            if owner:
+                threading.Thread(target=self._load, args=(key, entry, flight, generation),
+                                 daemon=True).start()
+            return entry.value if has_value else entry.default
+
+        if owner:
+            self._load(key, entry, flight, generation)
+        else:
+            flight.done.wait()
+        return entry.default if flight.value is _MISSING else flight.value
+
+    def _load(self, key: str, entry: _Entry, flight: _Flight, generation: int):
+        """执行加载函数并写回结果，失败时保留旧值；加载期间键被失效时结果只交给本次的等待者"""
+        try:
+            value = entry.loader()
+        except Exception as e:
+            print(f"加载缓存 {key} 失败: {e}")
+            value = _MISSING
+        with self._lock:
+            if generation == entry.generation:
+                if value is not _MISSING:
+                    entry.value = value
+                    entry.loaded_at = time.monotonic()
+                elif entry.value is _MISSING:
+                    # 首次加载失败时缓存默认值，避免每次调用都阻塞重试
+                    entry.value = entry.default
+                    entry.loaded_at = time.monotonic()
+            if entry.inflight is flight:
+                entry.inflight = None
+        flight.value = value
+        flight.done.set()
+
+    def is_ready(self, *keys: str) -> bool:
+        """指定的键是否都已有值（可能已过期），不指定时检查全部"""
+        with self._lock:
+            entries = [self._entries[k] for k in keys] if keys else self._entries.values()
+            return all(entry.value is not _MISSING for entry in entries)
+
+    def prefetch(self, *keys: str):
+        """在后台加载尚无值或已过期的键"""
+        for key in keys or list(self._entries):
+            self.get(key, wait=False)
+
+    def invalidate(self, key: Optional[str] = None):
+        """
+        清除指定键的缓存，不指定时清除全部
+        正在进行的加载照常完成并把结果交给已在等待的调用者，但不写回缓存；
+        之后的调用会重新开始加载
+        """
+        with self._lock:
+            entries = [self._entries[key]] if key is not None else list(self._entries.values())
+            for entry in entries:
+                entry.generation += 1
+                entry.value = _MISSING
+                entry.loaded_at = 0.0
+                entry.inflight = None
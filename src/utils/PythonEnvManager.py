@@ -6,12 +6,81 @@ Python环境管理器
 """
 
 import os
+import re
 import sys
+import json
 import subprocess
 import shutil
 import platform
+import threading
+from importlib import metadata as importlib_metadata
 from pathlib import Path
 
+# 需求字符串开头的包名部分
+_REQUIREMENT_NAME_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+
+# 探测结果行的前缀，避免被第三方库的输出干扰
+_PROBE_MARKER = "__AITHON_PROBE__"
+
+# 收集 site-packages 目录的脚本片段，只用到标准库
+_SITE_PATHS_SNIPPET = r"""
+paths = set()
+for key in ("purelib", "platlib"):
+    try:
+        paths.add(sysconfig.get_paths()[key])
+    except Exception:
+        pass
+try:
+    paths.update(site.getsitepackages())
+except Exception:
+    pass
+try:
+    paths.add(site.getusersitepackages())
+except Exception:
+    pass
+"""
+
+# 轻量查询脚本：只输出 site-packages 目录，不导入任何第三方库
+_SITE_PACKAGES_SCRIPT = r"""
+import json, site, sysconfig
+""" + _SITE_PATHS_SNIPPET + r"""
+print("__AITHON_PROBE__" + json.dumps(sorted(p for p in paths if p)))
+"""
+
+# 单次探测脚本：在目标解释器中一次性收集所有环境信息并输出JSON
+_PROBE_SCRIPT = r"""
+import json, site, sys, sysconfig
+info = {
+    "python_version": "Python " + sys.version.split()[0],
+    "site_packages": [],
+    "torch_installed": False,
+    "torch_version": None,
+    "cuda_available": False,
+    "cuda_version": None,
+    "gpu_count": 0,
+}
+""" + _SITE_PATHS_SNIPPET + r"""
+info["site_packages"] = sorted(p for p in paths if p)
+try:
+    import importlib.util
+    if importlib.util.find_spec("torch") is not None:
+        info["torch_installed"] = True
+        try:
+            import torch
+            info["torch_version"] = torch.__version__
+            info["cuda_available"] = bool(torch.cuda.is_available())
+            if info["cuda_available"]:
+                info["cuda_version"] = torch.version.cuda
+                info["gpu_count"] = torch.cuda.device_count()
+        except Exception as e:
+            from importlib import metadata
+            info["torch_version"] = metadata.version("torch")
+            info["torch_error"] = str(e)
+except Exception as e:
+    info["torch_error"] = str(e)
+print("__AITHON_PROBE__" + json.dumps(info))
+"""
+
 class PythonEnvManager:
     def __init__(self, app_root_dir=None):
         """
@@ -29,6 +98,19 @@ class PythonEnvManager:
         self.python_dir = self.app_root / "python_env"
         self.python_exe = None
         self.pip_exe = None
+
+        # 环境探测缓存
+        self.probe_cache_file = self.python_dir / ".env_probe_cache.json"
+        self._probe_lock = threading.Lock()
+        self._probe_result = None
+        self._probe_signature = None
+
+        # 已安装包索引
+        self._index_lock = threading.Lock()
+        self._package_index = None
+        self._package_index_signature = None
+        self._site_packages = None
+        self._site_packages_key = None
         
         # 初始化Python环境
         self._init_python_env()
@@ -176,23 +258,7 @@ class PythonEnvManager:
         Returns:
             bool: 安装是否成功
         """
-        try:
-            args = ["install", package_name]
-            if index_url:
-                args.extend(["--index-url", index_url])
-            
-            result = self.run_pip_command(args)
-            
-            if result.returncode == 0:
-                print(f"✅ {package_name} 安装成功")
-                return True
-            else:
-                print(f"❌ {package_name} 安装失败: {result.stderr}")
-                return False
-                
-        except Exception as e:
-            print(f"❌ 安装 {package_name} 时出错: {e}")
-            return False
+        return self.install_packages([package_name], index_url=index_url, skip_installed=False)
     
     def uninstall_package(self, package_name):
         """
@@ -204,20 +270,7 @@ class PythonEnvManager:
         Returns:
             bool: 卸载是否成功
         """
-        try:
-            args = ["uninstall", package_name, "-y"]
-            result = self.run_pip_command(args)
-            
-            if result.returncode == 0:
-                print(f"✅ {package_name} 卸载成功")
-                return True
-            else:
-                print(f"❌ {package_name} 卸载失败: {result.stderr}")
-                return False
-                
-        except Exception as e:
-            print(f"❌ 卸载 {package_name} 时出错: {e}")
-            return False
+        return self.uninstall_packages([package_name])
     
     def check_package_installed(self, package_name):
         """
@@ -229,11 +282,7 @@ class PythonEnvManager:
         Returns:
             bool: 是否已安装
         """
-        try:
-            result = self.run_pip_command(["show", package_name])
-            return result.returncode == 0
-        except:
-            return False
+        return self.check_packages_installed([package_name])[package_name]
     
     def get_package_version(self, package_name):
         """
@@ -245,69 +294,406 @@ class PythonEnvManager:
         Returns:
             str: 版本号，如果未安装返回None
         """
+        return self.get_package_versions([package_name])[package_name]
+
+    # ---------- 批量包操作 ----------
+    @staticmethod
+    def normalize_package_name(package_name):
+        """按 PEP 503 规范化包名，如 Flet_WebView -> flet-webview"""
+        return re.sub(r"[-_.]+", "-", package_name).lower()
+
+    @staticmethod
+    def _requirement_name(requirement):
+        """从需求字符串（如 requests>=2.0、flet[all]==0.28.3）中取出包名"""
+        match = _REQUIREMENT_NAME_RE.match(requirement.strip())
+        return match.group(0) if match else requirement.strip()
+
+    def get_installed_packages(self, refresh=False):
+        """
+        获取目标解释器已安装的包索引
+        直接通过 importlib.metadata 读取 site-packages 中的 *.dist-info 元数据，不启动pip；
+        site-packages 修改时间变化时自动重建
+
+        Args:
+            refresh: 是否强制重建
+
+        Returns:
+            dict: {规范化包名: 版本号}
+        """
+        site_packages = self.get_site_packages()
+        signature = self._site_packages_signature(site_packages)
+
+        with self._index_lock:
+            if not refresh and self._package_index is not None and self._package_index_signature == signature:
+                return self._package_index
+
+            index = {}
+            existing = [p for p in site_packages if os.path.isdir(p)]
+            for dist in importlib_metadata.distributions(path=existing):
+                try:
+                    name = dist.metadata["Name"]
+                except Exception:
+                    name = None
+                if name:
+                    index.setdefault(self.normalize_package_name(name), dist.version)
+
+            self._package_index = index
+            self._package_index_signature = signature
+            return index
+
+    def get_site_packages(self):
+        """
+        获取目标解释器的 site-packages 目录
+        安装或卸载包不会改变这些目录，结果按解释器缓存；
+        已有完整探测结果时直接复用，否则只启动一次不导入第三方库的轻量查询
+
+        Returns:
+            list: site-packages 目录，解释器不存在时为空
+        """
+        if not self.python_exe:
+            return []
+
+        key = self._probe_cache_key()
+        with self._index_lock:
+            if self._site_packages is not None and self._site_packages_key == key:
+                return self._site_packages
+
+        probe = self._probe_result or self._load_probe_cache()
+        if probe and probe.get("site_packages"):
+            site_packages = probe["site_packages"]
+        else:
+            site_packages = self._run_marked_script(_SITE_PACKAGES_SCRIPT)
+
+        with self._index_lock:
+            self._site_packages = site_packages
+            self._site_packages_key = key
+        return site_packages
+
+    def invalidate_package_index(self):
+        """清除已安装包索引（安装或卸载后调用）"""
+        with self._index_lock:
+            self._package_index = None
+            self._package_index_signature = None
+
+    def check_packages_installed(self, package_names):
+        """
+        批量检查包是否已安装
+
+        Args:
+            package_names: 包名列表
+
+        Returns:
+            dict: {包名: 是否已安装}
+        """
+        versions = self.get_package_versions(package_names)
+        return {name: version is not None for name, version in versions.items()}
+
+    def get_package_versions(self, package_names):
+        """
+        批量获取包版本
+
+        Args:
+            package_names: 包名列表
+
+        Returns:
+            dict: {包名: 版本号，未安装为None}
+        """
+        try:
+            index = self.get_installed_packages()
+        except Exception as e:
+            print(f"读取已安装包索引失败，改用pip查询: {e}")
+            return self._pip_show_versions(package_names)
+        return {
+            name: index.get(self.normalize_package_name(self._requirement_name(name)))
+            for name in package_names
+        }
+
+    def _pip_show_versions(self, package_names):
+        """索引不可用时，用一次 pip show 查询多个包"""
+        versions = {name: None for name in package_names}
+        if not package_names:
+            return versions
+        try:
+            result = self.run_pip_command(["show"] + [self._requirement_name(n) for n in package_names])
+            found = {}
+            current = None
+            for line in result.stdout.split('\n'):
+                if line.startswith('Name:'):
+                    current = self.normalize_package_name(line.split(':', 1)[1].strip())
+                elif line.startswith('Version:') and current:
+                    found[current] = line.split(':', 1)[1].strip()
+            for name in package_names:
+                versions[name] = found.get(self.normalize_package_name(self._requirement_name(name)))
+        except Exception:
+            pass
+        return versions
+
+    def install_packages(self, package_names, index_url=None, upgrade=False, skip_installed=True):
+        """
+        一次pip调用安装多个包
+
+        Args:
+            package_names: 包名或需求字符串列表
+            index_url: 索引URL
+            upgrade: 是否升级已安装的包
+            skip_installed: 跳过已安装且未指定版本的包
+
+        Returns:
+            bool: 安装是否成功
+        """
+        targets = list(package_names)
+        if skip_installed and not upgrade:
+            installed = self.check_packages_installed(
+                [n for n in targets if self._requirement_name(n) == n.strip()]
+            )
+            targets = [n for n in targets if not installed.get(n)]
+        if not targets:
+            return True
+
+        names = " ".join(targets)
+        try:
+            args = ["install"] + targets
+            if upgrade:
+                args.append("--upgrade")
+            if index_url:
+                args.extend(["--index-url", index_url])
+            
+            result = self.run_pip_command(args)
+            self.invalidate_package_index()
+            
+            if result.returncode == 0:
+                print(f"✅ {names} 安装成功")
+                return True
+            else:
+                print(f"❌ {names} 安装失败: {result.stderr}")
+                return False
+                
+        except Exception as e:
+            print(f"❌ 安装 {names} 时出错: {e}")
+            return False
+
+    def uninstall_packages(self, package_names):
+        """
+        一次pip调用卸载多个包，未安装的包直接跳过
+
+        Args:
+            package_names: 包名列表
+
+        Returns:
+            bool: 卸载是否成功
+        """
+        installed = self.check_packages_installed(package_names)
+        targets = [n for n in package_names if installed.get(n)]
+        if not targets:
+            return True
+
+        names = " ".join(targets)
         try:
-            result = self.run_pip_command(["show", package_name])
+            result = self.run_pip_command(["uninstall", "-y"] + targets)
+            self.invalidate_package_index()
+            
             if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if line.startswith('Version:'):
-                        return line.split(':', 1)[1].strip()
+                print(f"✅ {names} 卸载成功")
+                return True
+            else:
+                print(f"❌ {names} 卸载失败: {result.stderr}")
+                return False
+                
+        except Exception as e:
+            print(f"❌ 卸载 {names} 时出错: {e}")
+            return False
+
+    def ensure_packages(self, package_names, index_url=None):
+        """
+        确保课程需要的包都已安装，只安装缺少的部分
+
+        Args:
+            package_names: 包名列表
+            index_url: 索引URL
+
+        Returns:
+            bool: 是否全部可用
+        """
+        return self.install_packages(package_names, index_url=index_url)
+
+    # ---------- 环境探测 ----------
+    def _site_packages_signature(self, paths):
+        """site-packages 目录的修改时间，安装或卸载包后会变化"""
+        signature = {}
+        for path in paths:
+            try:
+                signature[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                signature[path] = None
+        return signature
+
+    def _probe_cache_key(self):
+        """缓存键：解释器路径和解释器文件的修改时间"""
+        try:
+            exe_mtime = os.stat(self.python_exe).st_mtime_ns
+        except (OSError, TypeError):
+            exe_mtime = None
+        return {"python_executable": str(self.python_exe), "python_mtime": exe_mtime}
+
+    def _load_probe_cache(self):
+        """读取磁盘缓存，解释器或 site-packages 有变化时返回None"""
+        if not self.probe_cache_file.exists():
             return None
-        except:
+        try:
+            with open(self.probe_cache_file, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except Exception:
             return None
-    
-    def get_environment_info(self):
+
+        if cached.get("key") != self._probe_cache_key():
+            return None
+        probe = cached.get("probe") or {}
+        signature = self._site_packages_signature(probe.get("site_packages", []))
+        if cached.get("site_packages_mtime") != signature:
+            return None
+        return probe
+
+    def _save_probe_cache(self, probe):
+        cached = {
+            "key": self._probe_cache_key(),
+            "site_packages_mtime": self._site_packages_signature(probe.get("site_packages", [])),
+            "probe": probe
+        }
+        tmp_file = self.probe_cache_file.with_suffix(".tmp")
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(cached, f, ensure_ascii=False)
+            os.replace(tmp_file, self.probe_cache_file)
+        except Exception as e:
+            print(f"保存环境探测缓存失败: {e}")
+
+    def _run_probe(self):
+        """启动一次解释器，执行探测脚本并解析JSON结果"""
+        return self._run_marked_script(_PROBE_SCRIPT)
+
+    def _run_marked_script(self, script):
+        """在目标解释器中执行脚本，解析带标记前缀的JSON输出"""
+        result = self.run_python_command(["-c", script])
+        for line in reversed(result.stdout.splitlines()):
+            if line.startswith(_PROBE_MARKER):
+                return json.loads(line[len(_PROBE_MARKER):])
+        raise RuntimeError(f"环境探测失败: {result.stderr.strip()[-500:]}")
+
+    def probe_environment(self, use_cache=True):
         """
-        获取环境信息
-        
+        探测Python环境（Python版本、site-packages、torch、CUDA）
+        结果缓存在内存和磁盘中，同一时间只会有一个探测进程在运行
+
+        Args:
+            use_cache: 是否使用缓存
+
         Returns:
-            dict: 环境信息
+            dict: 探测结果，解释器不存在时返回None
         """
+        if not self.python_exe:
+            return None
+
+        with self._probe_lock:
+            if use_cache:
+                if self._probe_result is not None:
+                    signature = self._site_packages_signature(self._probe_result.get("site_packages", []))
+                    if signature == self._probe_signature:
+                        return self._probe_result
+                cached = self._load_probe_cache()
+                if cached is not None:
+                    self._set_probe_result(cached)
+                    return cached
+
+            probe = self._run_probe()
+            self._set_probe_result(probe)
+            self._save_probe_cache(probe)
+            return probe
+
+    def _set_probe_result(self, probe):
+        self._probe_result = probe
+        self._probe_signature = self._site_packages_signature(probe.get("site_packages", []))
+
+    def invalidate_environment_cache(self):
+        """清除环境探测缓存（安装或卸载包后调用）"""
+        with self._probe_lock:
+            self._probe_result = None
+            self._probe_signature = None
+            try:
+                self.probe_cache_file.unlink()
+            except OSError:
+                pass
+
+    def get_cached_environment_info(self):
+        """
+        只读取缓存的环境信息，不启动子进程
+
+        Returns:
+            dict: 环境信息，没有可用缓存时返回None
+        """
+        probe = self._probe_result
+        if probe is None:
+            probe = self._load_probe_cache()
+            if probe is None:
+                return None
+        return self._build_environment_info(probe)
+
+    def get_environment_info_async(self, callback=None):
+        """
+        在后台线程中获取环境信息，不阻塞调用方（如设置页面）
+
+        Args:
+            callback: 获取完成后的回调，参数为环境信息dict
+        """
+        def worker():
+            info = self.get_environment_info()
+            if callback:
+                try:
+                    callback(info)
+                except Exception as e:
+                    print(f"环境信息回调出错: {e}")
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return thread
+
+    def _build_environment_info(self, probe):
         info = {
             'python_executable': self.python_exe,
             'pip_executable': self.pip_exe,
             'python_version': None,
             'torch_installed': False,
             'torch_version': None,
-            'cuda_available': False
+            'cuda_available': False,
+            'torch_cuda_version': None,
+            'gpu_count': 0
         }
-        
+        if probe:
+            info['python_version'] = probe.get('python_version')
+            info['torch_installed'] = probe.get('torch_installed', False)
+            info['torch_version'] = probe.get('torch_version')
+            info['cuda_available'] = probe.get('cuda_available', False)
+            info['torch_cuda_version'] = probe.get('cuda_version')
+            info['gpu_count'] = probe.get('gpu_count', 0)
+        return info
+
+    def get_environment_info(self, use_cache=True):
+        """
+        获取环境信息
+        只启动一次解释器完成全部检测，结果按解释器路径和 site-packages 修改时间缓存
+
+        Args:
+            use_cache: 是否使用缓存
+
+        Returns:
+            dict: 环境信息
+        """
+        probe = None
         if self.python_exe:
             try:
-                # 获取Python版本
-                result = self.run_python_command(["--version"])
-                if result.returncode == 0:
-                    info['python_version'] = result.stdout.strip()
-                
-                # 检查torch
-                if self.check_package_installed('torch'):
-                    info['torch_installed'] = True
-                    
-                    # 获取完整的torch版本信息（包括CUDA版本）
-                    try:
-                        result = self.run_python_command([
-                            "-c", "import torch; print(torch.__version__)"
-                        ])
-                        if result.returncode == 0:
-                            info['torch_version'] = result.stdout.strip()
-                        else:
-                            info['torch_version'] = self.get_package_version('torch')
-                    except:
-                        info['torch_version'] = self.get_package_version('torch')
-                    
-                    # 检查CUDA可用性
-                    try:
-                        result = self.run_python_command([
-                            "-c", "import torch; print(torch.cuda.is_available())"
-                        ])
-                        if result.returncode == 0:
-                            info['cuda_available'] = result.stdout.strip() == "True"
-                    except:
-                        pass
-                        
+                probe = self.probe_environment(use_cache=use_cache)
             except Exception as e:
                 print(f"获取环境信息时出错: {e}")
-        
-        return info
+        return self._build_environment_info(probe)
 
 # 全局Python环境管理器实例
 python_env_manager = PythonEnvManager()
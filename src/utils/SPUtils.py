@@ -3,7 +3,14 @@ import json
 import csv
 import pickle
 import sqlite3
-from typing import Any, List, Dict
+import threading
+from typing import Any, List, Dict, Iterable, Iterator, Sequence, Optional
+
+from src.utils.SnapshotUtils import Snapshot, write_snapshot, open_snapshot
+
+# 每个线程按数据库路径缓存一个连接（sqlite3 连接默认不能跨线程使用）
+_local = threading.local()
+
 
 class SPUtils:
     """数据存取工具类"""
@@ -21,23 +28,69 @@ class SPUtils:
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
 
-    # ---------- CSV ----------
+    # ---------- JSON Lines ----------
+    @staticmethod
+    def save_jsonl(data: Iterable[Any], path: str, append: bool = False) -> int:
+        """
+        逐条写入 JSON Lines 文件，每行一个 JSON 对象
+        data 可以是生成器，内存占用与数据量无关
+        :return: 写入的行数
+        """
+        count = 0
+        with open(path, "a" if append else "w", encoding="utf-8") as f:
+            for item in data:
+                f.write(json.dumps(item, ensure_ascii=False))
+                f.write("\n")
+                count += 1
+        return count
+
     @staticmethod
-    def save_csv(data: List[Dict[str, Any]], path: str):
-        if not data:
+    def iter_jsonl(path: str) -> Iterator[Any]:
+        """逐行读取 JSON Lines 文件，跳过空行"""
+        if not os.path.exists(path):
             return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    # ---------- CSV ----------
+    @staticmethod
+    def save_csv(data: Iterable[Dict[str, Any]], path: str, fieldnames: Sequence[str] = None) -> int:
+        """
+        逐行写入 CSV，data 可以是列表或生成器
+        :param fieldnames: 列名，默认取第一行的键
+        :return: 写入的行数
+        """
+        rows = iter(data)
+        if fieldnames is None:
+            first = next(rows, None)
+            if first is None:
+                return 0
+            fieldnames = list(first.keys())
+            rows = _chain_first(first, rows)
+
+        count = 0
         with open(path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=data[0].keys())
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
             writer.writeheader()
-            writer.writerows(data)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        return count
 
     @staticmethod
     def load_csv(path: str) -> List[Dict[str, Any]]:
+        return list(SPUtils.iter_csv(path))
+
+    @staticmethod
+    def iter_csv(path: str) -> Iterator[Dict[str, Any]]:
+        """逐行读取 CSV，每行产出一个字典"""
         if not os.path.exists(path):
-            return []
-        with open(path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            return list(reader)
+            return
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
 
     # ---------- Pickle ----------
     @staticmethod
@@ -52,35 +105,113 @@ class SPUtils:
         with open(path, "rb") as f:
             return pickle.load(f)
 
+    # ---------- Snapshot ----------
+    @staticmethod
+    def save_snapshot(data: Dict[str, Any], path: str) -> int:
+        """保存为二进制快照，读取时按键懒加载，见 SnapshotUtils"""
+        return write_snapshot(path, data)
+
+    @staticmethod
+    def load_snapshot(path: str) -> Optional[Snapshot]:
+        """以 mmap 方式打开快照，只解码访问到的记录；用完需 close()"""
+        return open_snapshot(path)
+
     # ---------- SQLite ----------
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        """获取当前线程缓存的连接，不存在则创建"""
+        conns = getattr(_local, "conns", None)
+        if conns is None:
+            conns = _local.conns = {}
+        key = os.path.abspath(path)
+        conn = conns.get(key)
+        if conn is None:
+            conn = sqlite3.connect(path)
+            conn.row_factory = sqlite3.Row
+            conns[key] = conn
+        return conn
+
+    @staticmethod
+    def close_sqlite(path: str = None):
+        """关闭当前线程缓存的连接，不指定路径时关闭全部"""
+        conns = getattr(_local, "conns", {})
+        keys = [os.path.abspath(path)] if path else list(conns)
+        for key in keys:
+            conn = conns.pop(key, None)
+            if conn is not None:
+                conn.close()
+
     @staticmethod
     def init_sqlite(path: str, table: str, schema: str):
         """
         初始化数据库
         schema 示例: "id INTEGER PRIMARY KEY, name TEXT, age INTEGER"
         """
-        conn = sqlite3.connect(path)
-        c = conn.cursor()
-        c.execute(f"CREATE TABLE IF NOT EXISTS {table} ({schema})")
-        conn.commit()
-        conn.close()
+        conn = SPUtils._connect(path)
+        with conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({schema})")
 
     @staticmethod
     def insert_sqlite(path: str, table: str, data: Dict[str, Any]):
-        conn = sqlite3.connect(path)
-        c = conn.cursor()
+        conn = SPUtils._connect(path)
         keys = ",".join(data.keys())
         placeholders = ",".join("?" * len(data))
-        c.execute(f"INSERT INTO {table} ({keys}) VALUES ({placeholders})", tuple(data.values()))
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute(f"INSERT INTO {table} ({keys}) VALUES ({placeholders})", tuple(data.values()))
 
     @staticmethod
-    def query_sqlite(path: str, table: str, where: str = "") -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(path)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
+    def insert_many_sqlite(path: str, table: str, rows: Iterable[Dict[str, Any]],
+                           columns: Sequence[str] = None) -> int:
+        """
+        批量插入，所有行在同一个事务中通过 executemany 写入
+        rows 可以是生成器，不会一次性载入内存
+        :param columns: 列名，默认取第一行的键
+        :return: 插入的行数
+        """
+        rows = iter(rows)
+        if columns is None:
+            first = next(rows, None)
+            if first is None:
+                return 0
+            columns = list(first.keys())
+            rows = _chain_first(first, rows)
+
+        conn = SPUtils._connect(path)
+        keys = ",".join(columns)
+        placeholders = ",".join("?" * len(columns))
+        with conn:
+            cursor = conn.executemany(
+                f"INSERT INTO {table} ({keys}) VALUES ({placeholders})",
+                (tuple(row[c] for c in columns) for row in rows)
+            )
+        return cursor.rowcount
+
+    @staticmethod
+    def query_sqlite(path: str, table: str, where: str = "", params: Sequence = ()) -> List[Dict[str, Any]]:
+        return list(SPUtils.iter_query_sqlite(path, table, where, params))
+
+    @staticmethod
+    def iter_query_sqlite(path: str, table: str, where: str = "", params: Sequence = (),
+                          batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        流式查询，每次从数据库取 batch_size 行，逐行产出
+        适合导出大表，内存占用与表大小无关
+        """
+        conn = SPUtils._connect(path)
         sql = f"SELECT * FROM {table} {('WHERE ' + where) if where else ''}"
-        rows = c.execute(sql).fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        cursor = conn.execute(sql, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+
+
+def _chain_first(first: Any, rest: Iterator) -> Iterator:
+    """把已取出的第一个元素放回迭代器前面"""
+    yield first
+    yield from rest
@@ -0,0 +1,181 @@
+"""
+二进制快照格式
+把 {键: 值} 写入单个文件，打开时通过 mmap 映射，只解码实际访问到的记录，
+适合课程目录、搜索索引、统计结果等以读为主的缓存，打开耗时与文件大小无关
+
+文件布局（小端序）:
+    文件头  magic(4) 版本(2) 保留(2) 记录数(4) 索引偏移(8)
+    值区    每条记录的 pickle 数据依次排列
+    键区    所有键的 UTF-8 编码依次排列
+    索引    每条记录一个定长条目 (键偏移 8, 键长度 4, 值偏移 8, 值长度 4)，按键排序，
+            查找时直接在 mmap 上二分
+"""
+
+import os
+import mmap
+import pickle
+import struct
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+MAGIC = b"ASNP"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIQ")
+_ENTRY = struct.Struct("<QIQI")
+
+
+class SnapshotError(Exception):
+    """快照文件格式错误"""
+
+
+def write_snapshot(path: str, items: Union[Dict[str, Any], Iterable[Tuple[str, Any]]]) -> int:
+    """
+    写入快照，先写临时文件再原子替换
+    items 可以是字典或 (键, 值) 的可迭代对象；值逐条序列化写入，内存中只保留索引
+    :return: 记录数
+    """
+    if isinstance(items, dict):
+        items = items.items()
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    entries = []
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+            offset = _HEADER.size
+            for key, value in items:
+                data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(data)
+                entries.append((str(key).encode("utf-8"), offset, len(data)))
+                offset += len(data)
+
+            entries.sort(key=lambda e: e[0])
+            for i in range(1, len(entries)):
+                if entries[i][0] == entries[i - 1][0]:
+                    raise ValueError(f"快照中存在重复的键: {entries[i][0].decode('utf-8')}")
+
+            key_offsets = []
+            for key_bytes, _, _ in entries:
+                f.write(key_bytes)
+                key_offsets.append(offset)
+                offset += len(key_bytes)
+
+            index_offset = offset
+            for (key_bytes, value_offset, value_len), key_offset in zip(entries, key_offsets):
+                f.write(_ENTRY.pack(key_offset, len(key_bytes), value_offset, value_len))
+
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, VERSION, 0, len(entries), index_offset))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(entries)
+
+
+class Snapshot:
+    """只读快照，按需解码记录"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise SnapshotError(f"快照文件为空: {path}")
+
+        if len(self._mm) < _HEADER.size:
+            self.close()
+            raise SnapshotError(f"快照文件不完整: {path}")
+        magic, version, _, count, index_offset = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise SnapshotError(f"不是快照文件: {path}")
+        if version != VERSION:
+            self.close()
+            raise SnapshotError(f"不支持的快照版本: {version}")
+        if index_offset + count * _ENTRY.size > len(self._mm):
+            self.close()
+            raise SnapshotError(f"快照索引不完整: {path}")
+        self._count = count
+        self._index_offset = index_offset
+
+    # ---------- 索引 ----------
+    def _entry(self, i: int) -> Tuple[int, int, int, int]:
+        return _ENTRY.unpack_from(self._mm, self._index_offset + i * _ENTRY.size)
+
+    def _key_at(self, i: int) -> bytes:
+        key_offset, key_len, _, _ = self._entry(i)
+        return self._mm[key_offset:key_offset + key_len]
+
+    def _find(self, key: str) -> int:
+        """二分查找键所在的索引位置，不存在返回 -1"""
+        target = key.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key_at(lo) == target:
+            return lo
+        return -1
+
+    def _value_at(self, i: int) -> Any:
+        _, _, value_offset, value_len = self._entry(i)
+        return pickle.loads(self._mm[value_offset:value_offset + value_len])
+
+    # ---------- 读取 ----------
+    def get(self, key: str, default: Any = None) -> Any:
+        i = self._find(key)
+        return default if i < 0 else self._value_at(i)
+
+    def __getitem__(self, key: str) -> Any:
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self._value_at(i)
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key) >= 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def keys(self) -> Iterator[str]:
+        """按排序顺序迭代键，不解码值"""
+        for i in range(self._count):
+            yield self._key_at(i).decode("utf-8")
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for i in range(self._count):
+            yield self._key_at(i).decode("utf-8"), self._value_at(i)
+
+    def __iter__(self) -> Iterator[str]:
+        return self.keys()
+
+    # ---------- 生命周期 ----------
+    def close(self):
+        mm = getattr(self, "_mm", None)
+        if mm is not None:
+            mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_snapshot(path: str) -> Optional[Snapshot]:
+    """打开快照，文件不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    return Snapshot(path)
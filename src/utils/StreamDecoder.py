@@ -0,0 +1,191 @@
+"""
+流式响应解码
+按大块（默认 64KB）读取网络数据，在缓冲区中切分事件，不再逐行调用 iter_lines：
+- SSEDecoder：Server-Sent Events（DeepSeek / OpenAI 兼容接口），支持多行 data 字段，
+  使用增量 UTF-8 解码器，多字节中文跨块时不会乱码
+- NDJSONDecoder：每行一个 JSON 对象（Ollama）
+两种解码器既可以同步迭代，也可以 async for 异步迭代
+"""
+
+import json
+import codecs
+import asyncio
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from typing import Any, AsyncIterator, Iterable, Iterator, List
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# 一个 SSE 事件；event 未指定时为 "message"
+SSEEvent = namedtuple("SSEEvent", ["event", "data", "id"])
+
+
+def iter_response_chunks(response, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    读取 requests 流式响应的原始数据，有多少读多少，不等待凑满 chunk_size
+    分块传输时每个 HTTP 块到达即产出；否则使用 read1 读取已到达的数据
+    """
+    raw = getattr(response, "raw", None)
+    if raw is not None and getattr(raw, "chunked", False) and hasattr(raw, "read_chunked"):
+        yield from raw.read_chunked(chunk_size, decode_content=True)
+    elif raw is not None and hasattr(raw, "read1"):
+        while True:
+            data = raw.read1(chunk_size)
+            if not data:
+                break
+            yield data
+    else:
+        yield from response.iter_content(chunk_size=chunk_size)
+
+
+class StreamDecoder(ABC):
+    """解码器基类：子类实现 feed 和 close"""
+
+    def __init__(self, source: Any = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        :param source: requests 响应对象、字节块的可迭代对象或异步可迭代对象；
+                       只调用 feed 时可以为 None
+        """
+        self.source = source
+        self.chunk_size = chunk_size
+
+    @abstractmethod
+    def feed(self, data: bytes) -> List[Any]:
+        """输入一块数据，返回其中已完整的事件"""
+
+    @abstractmethod
+    def close(self) -> List[Any]:
+        """数据结束，返回缓冲区中剩余的事件"""
+
+    def _chunks(self) -> Iterable[bytes]:
+        if hasattr(self.source, "raw") or hasattr(self.source, "iter_content"):
+            return iter_response_chunks(self.source, self.chunk_size)
+        return self.source
+
+    def __iter__(self) -> Iterator[Any]:
+        for data in self._chunks():
+            yield from self.feed(data)
+        yield from self.close()
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._aiter()
+
+    async def _aiter(self):
+        if hasattr(self.source, "__aiter__"):
+            async for data in self.source:
+                for item in self.feed(data):
+                    yield item
+        else:
+            # 同步数据源的阻塞读取放到线程中，不阻塞事件循环
+            chunks = iter(self._chunks())
+            while True:
+                data = await asyncio.to_thread(next, chunks, None)
+                if data is None:
+                    break
+                for item in self.feed(data):
+                    yield item
+        for item in self.close():
+            yield item
+
+
+class SSEDecoder(StreamDecoder):
+    """Server-Sent Events 解码器，迭代产出 SSEEvent"""
+
+    def __init__(self, source: Any = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(source, chunk_size)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buffer = ""
+        self._pending_cr = False
+        self._reset_event()
+
+    def _reset_event(self):
+        self._event = ""
+        self._data: List[str] = []
+        self._id = None
+
+    def feed(self, data: bytes) -> List[SSEEvent]:
+        text = self._decoder.decode(data)
+        return self._feed_text(text)
+
+    def _feed_text(self, text: str) -> List[SSEEvent]:
+        if self._pending_cr:
+            text = "\r" + text
+            self._pending_cr = False
+        # 末尾的 \r 可能和下一块开头的 \n 组成一个换行，先保留
+        if text.endswith("\r"):
+            text = text[:-1]
+            self._pending_cr = True
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+        self._buffer += text
+        if "\n" not in self._buffer:
+            return []
+        lines = self._buffer.split("\n")
+        self._buffer = lines.pop()
+
+        events = []
+        for line in lines:
+            event = self._process_line(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _process_line(self, line: str):
+        """处理一行，遇到空行时返回完整的事件"""
+        if not line:
+            if not self._data:
+                self._reset_event()
+                return None
+            event = SSEEvent(self._event or "message", "\n".join(self._data), self._id)
+            self._reset_event()
+            return event
+        if line.startswith(":"):
+            # 注释行，常用作心跳
+            return None
+
+        field, sep, value = line.partition(":")
+        if sep and value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            self._data.append(value)
+        elif field == "event":
+            self._event = value
+        elif field == "id":
+            self._id = value
+        return None
+
+    def close(self) -> List[SSEEvent]:
+        events = self._feed_text(self._decoder.decode(b"", final=True))
+        if self._pending_cr:
+            self._pending_cr = False
+            events.extend(self._feed_text("\n"))
+        # 服务器可能在最后一个事件后没有发送空行
+        for line in (self._buffer, ""):
+            event = self._process_line(line)
+            if event is not None:
+                events.append(event)
+        self._buffer = ""
+        return events
+
+
+class NDJSONDecoder(StreamDecoder):
+    """NDJSON 解码器，迭代产出解析后的对象"""
+
+    def __init__(self, source: Any = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(source, chunk_size)
+        self._buffer = b""
+
+    def feed(self, data: bytes) -> List[Any]:
+        # 按字节切分：换行符 0x0A 不会出现在多字节 UTF-8 字符中间，
+        # 完整的一行再交给 json 解码，跨块的中文不会被截断
+        self._buffer += data
+        if b"\n" not in data:
+            return []
+        lines = self._buffer.split(b"\n")
+        self._buffer = lines.pop()
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def close(self) -> List[Any]:
+        line, self._buffer = self._buffer, b""
+        return [json.loads(line)] if line.strip() else []
@@ -0,0 +1,272 @@
+"""
+边下载边解压的 zip 更新包处理
+先通过 Range 请求获取文件尾部的中央目录，得到每个条目在压缩包中的位置；
+随后顺序下载正文，某个条目的数据全部到达后立即交给线程池解压到暂存目录，
+下载和解压重叠进行，总耗时接近 max(下载, 解压)
+"""
+
+import os
+import json
+import shutil
+import struct
+import zipfile
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+# 尾部首次读取的大小：EOCD 最大 22 + 65535 字节注释
+TAIL_SIZE = 64 * 1024 + 22
+
+_EOCD_SIG = b"PK\x05\x06"
+_ZIP64_LOCATOR_SIG = b"PK\x06\x07"
+_ZIP64_EOCD_SIG = b"PK\x06\x06"
+
+# 替换应用文件时的日志与旧文件备份目录，均位于目标目录下
+SWAP_JOURNAL = "update_swap.json"
+SWAP_BACKUP_DIR = "update_backup"
+
+
+class RangeNotSupported(Exception):
+    """服务器不支持 Range 请求，无法流式解压"""
+
+
+class StreamingZipExtractor:
+    """流式 zip 解压器"""
+
+    def __init__(self, url: str, staging_dir: str, archive_path: str = "app_update.zip",
+                 workers: Optional[int] = None, timeout: int = 30):
+        self.url = url
+        self.staging_dir = Path(staging_dir)
+        self.archive_path = Path(archive_path)
+        self.workers = workers or min(8, (os.cpu_count() or 1) + 1)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # ---------- 中央目录 ----------
+    def _get_range(self, start: int, end: Optional[int] = None) -> Tuple[bytes, int, int]:
+        """
+        获取指定字节范围，end 为 None 时 start 视为尾部长度
+        :return: (数据, 起始偏移, 文件总大小)
+        """
+        range_header = f"bytes=-{start}" if end is None else f"bytes={start}-{end}"
+        response = requests.get(self.url, headers={"Range": range_header}, timeout=self.timeout)
+        response.raise_for_status()
+        content_range = response.headers.get("content-range", "")
+        if response.status_code != 206 or not content_range.startswith("bytes "):
+            raise RangeNotSupported(f"服务器未返回分段内容: {response.status_code}")
+        span, total = content_range[len("bytes "):].split("/")
+        first = int(span.split("-")[0])
+        return response.content, first, int(total)
+
+    @staticmethod
+    def _locate_central_directory(tail: bytes, tail_start: int) -> Tuple[int, int]:
+        """
+        从尾部数据中解析中央目录的位置
+        :return: (中央目录起始偏移, 需要预先获取的起始偏移)
+        """
+        pos = tail.rfind(_EOCD_SIG)
+        if pos < 0:
+            raise zipfile.BadZipFile("未找到 zip 结束标记")
+        cd_size, cd_offset = struct.unpack("<II", tail[pos + 12:pos + 20])
+        need_start = cd_offset
+
+        if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF:
+            # ZIP64：通过定位器找到 ZIP64 结束记录
+            loc = pos - 20
+            if loc < 0 or tail[loc:loc + 4] != _ZIP64_LOCATOR_SIG:
+                raise zipfile.BadZipFile("ZIP64 定位器缺失")
+            (zip64_eocd_offset,) = struct.unpack("<Q", tail[loc + 8:loc + 16])
+            rel = zip64_eocd_offset - tail_start
+            if rel < 0 or tail[rel:rel + 4] != _ZIP64_EOCD_SIG:
+                raise zipfile.BadZipFile("ZIP64 结束记录不在尾部数据中")
+            cd_size, cd_offset = struct.unpack("<QQ", tail[rel + 40:rel + 56])
+            need_start = min(cd_offset, zip64_eocd_offset)
+
+        return cd_offset, need_start
+
+    def _prepare_archive(self) -> Tuple[List[zipfile.ZipInfo], List[int], int, int]:
+        """
+        预分配本地压缩包文件并写入中央目录，解析出所有条目
+        :return: (按位置排序的条目列表, 对应的数据结束偏移, 中央目录起始偏移, 文件总大小)
+        """
+        tail, tail_start, total = self._get_range(TAIL_SIZE)
+        cd_offset, need_start = self._locate_central_directory(tail, tail_start)
+        if need_start < tail_start:
+            head, _, _ = self._get_range(need_start, tail_start - 1)
+            tail = head + tail
+            tail_start = need_start
+
+        with open(self.archive_path, "wb") as f:
+            f.truncate(total)
+            f.seek(tail_start)
+            f.write(tail)
+
+        with zipfile.ZipFile(self.archive_path) as zf:
+            infos = zf.infolist()
+
+        # 条目数据的结束位置取下一个条目的本地头偏移，最后一个条目取中央目录起点
+        ordered = sorted(infos, key=lambda i: i.header_offset)
+        ends = [info.header_offset for info in ordered[1:]] + [cd_offset]
+        return ordered, ends, cd_offset, total
+
+    # ---------- 解压 ----------
+    def _extract_entry(self, info: zipfile.ZipInfo):
+        """在工作线程中解压单个条目，每个线程持有独立的文件句柄"""
+        zf = getattr(self._local, "zf", None)
+        if zf is None:
+            zf = zipfile.ZipFile(self.archive_path)
+            self._local.zf = zf
+            with self._handles_lock:
+                self._handles.append(zf)
+        zf.extract(info, self.staging_dir)
+
+    def run(self, progress_callback: Optional[Callable] = None) -> Path:
+        """
+        下载并解压到暂存目录
+        :return: 暂存目录
+        """
+        if self.staging_dir.exists():
+            shutil.rmtree(self.staging_dir)
+        self.staging_dir.mkdir(parents=True)
+
+        ordered, ends, cd_offset, total = self._prepare_archive()
+        self._handles = []
+        self._handles_lock = threading.Lock()
+        futures = []
+        next_index = 0
+        downloaded = 0
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                # 中央目录已经获取，只需下载其之前的正文
+                if cd_offset > 0:
+                    headers = {"Range": f"bytes=0-{cd_offset - 1}"}
+                    with requests.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+                        response.raise_for_status()
+                        if response.status_code != 206:
+                            raise RangeNotSupported("正文下载未返回分段内容")
+                        with open(self.archive_path, "r+b") as f:
+                            for chunk in response.iter_content(chunk_size=256 * 1024):
+                                if not chunk:
+                                    continue
+                                f.write(chunk)
+                                downloaded += len(chunk)
+                                f.flush()
+
+                                # 数据已完整到达的条目立即提交解压
+                                while next_index < len(ordered) and ends[next_index] <= downloaded:
+                                    futures.append(pool.submit(self._extract_entry, ordered[next_index]))
+                                    next_index += 1
+
+                                if progress_callback and total > 0:
+                                    done = downloaded + (total - cd_offset)
+                                    progress_callback("app", done / total * 100, done, total)
+
+                if downloaded < cd_offset:
+                    raise IOError(f"下载不完整: {downloaded}/{cd_offset}")
+
+                while next_index < len(ordered):
+                    futures.append(pool.submit(self._extract_entry, ordered[next_index]))
+                    next_index += 1
+
+                for future in futures:
+                    future.result()
+        finally:
+            for zf in self._handles:
+                zf.close()
+
+        return self.staging_dir
+
+
+def _write_journal(journal: Path, data: dict):
+    """原子写入替换日志，保证日志本身不会只写了一半"""
+    tmp_file = journal.with_name(journal.name + ".tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, journal)
+
+
+def _rollback_swap(target: Path, entries: List[dict]):
+    """
+    按日志把目标目录恢复到替换前的状态，可以重复执行
+    已备份的旧文件移回原位，替换前不存在的新文件直接删除
+    """
+    backup = target / SWAP_BACKUP_DIR
+    for entry in reversed(entries):
+        dest = target / entry["path"]
+        saved = backup / entry["path"]
+        if saved.exists():
+            os.replace(saved, dest)
+        elif not entry["existed"] and dest.exists():
+            dest.unlink()
+
+
+def recover_interrupted_swap(target_dir: str) -> bool:
+    """
+    启动时检查上次替换是否被中断，存在日志则回滚到替换前的文件
+    :return: 是否执行了回滚
+    """
+    target = Path(target_dir)
+    journal = target / SWAP_JOURNAL
+    if not journal.exists():
+        return False
+    try:
+        with open(journal, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        _rollback_swap(target, data.get("entries", []))
+    except (OSError, ValueError) as e:
+        print(f"回滚未完成的更新失败: {e}")
+        return False
+    journal.unlink()
+    shutil.rmtree(target / SWAP_BACKUP_DIR, ignore_errors=True)
+    if data.get("staging"):
+        shutil.rmtree(data["staging"], ignore_errors=True)
+    print("检测到未完成的应用更新，已回滚到更新前的文件")
+    return True
+
+
+def swap_in_staging(staging_dir: str, target_dir: str):
+    """
+    用暂存目录中的文件替换目标目录中的对应文件
+    替换前先写入文件清单日志，旧文件移到备份目录而不是直接覆盖；
+    中途出错立即回滚，进程被中断则在下次启动时由 recover_interrupted_swap 回滚，
+    全部成功后才删除日志和备份，应用目录不会停留在新旧文件混合的状态
+    """
+    staging = Path(staging_dir)
+    target = Path(target_dir)
+    backup = target / SWAP_BACKUP_DIR
+    journal = target / SWAP_JOURNAL
+    recover_interrupted_swap(target_dir)
+
+    entries = []
+    for root, dirs, files in os.walk(staging):
+        rel_root = Path(root).relative_to(staging)
+        for name in files:
+            rel_path = (rel_root / name).as_posix()
+            entries.append({"path": rel_path, "existed": (target / rel_path).exists()})
+
+    if backup.exists():
+        shutil.rmtree(backup)
+    _write_journal(journal, {"staging": str(staging), "entries": entries})
+    try:
+        for entry in entries:
+            dest = target / entry["path"]
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if entry["existed"]:
+                saved = backup / entry["path"]
+                saved.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(dest, saved)
+            os.replace(staging / entry["path"], dest)
+    except Exception:
+        _rollback_swap(target, entries)
+        journal.unlink()
+        shutil.rmtree(backup, ignore_errors=True)
+        raise
+
+    journal.unlink()
+    shutil.rmtree(backup, ignore_errors=True)
+    shutil.rmtree(staging, ignore_errors=True)
@@ -5,23 +5,28 @@
 检测CUDA版本、GPU信息等
 """
 
+import re
 import subprocess
 import shutil
 import platform
 import sys
-import time
 from src.utils.PythonEnvManager import python_env_manager
+from src.utils.ProbeCache import ProbeCache
 
-# 缓存系统信息，避免重复检测
-_system_info_cache = {}
-_cache_timestamp = 0
-_cache_duration = 30  # 缓存30秒
+# 各项检测结果独立缓存；硬件信息很少变化，缓存时间更长
+_probe_cache = ProbeCache(default_ttl=30)
 
 def clear_system_info_cache():
     """清除系统信息缓存，强制重新检测"""
-    global _system_info_cache, _cache_timestamp
-    _system_info_cache.clear()
-    _cache_timestamp = 0
+    _probe_cache.invalidate()
+
+def prefetch_system_info():
+    """在后台预先检测，打开系统信息时直接使用缓存"""
+    _probe_cache.prefetch()
+
+def is_system_info_ready():
+    """是否所有检测项都已有结果"""
+    return _probe_cache.is_ready()
 
 def run_cmd(cmd):
     """运行命令并返回结果"""
@@ -37,15 +42,8 @@ def run_cmd(cmd):
     except Exception as e:
         return ""
 
-def detect_cuda_version():
+def _probe_cuda_version():
     """检测CUDA版本"""
-    global _system_info_cache, _cache_timestamp
-    
-    # 检查缓存
-    current_time = time.time()
-    if 'cuda_version' in _system_info_cache and (current_time - _cache_timestamp) < _cache_duration:
-        return _system_info_cache['cuda_version']
-    
     nvidia_smi = shutil.which("nvidia-smi")
     if nvidia_smi:
         # 首先尝试获取版本信息
@@ -59,14 +57,9 @@ def detect_cuda_version():
                     if len(parts) > 1:
                         version_part = parts[1].strip()
                         # 提取数字部分
-                        import re
                         version_match = re.search(r'(\d+\.\d+)', version_part)
                         if version_match:
-                            cuda_version = version_match.group(1)
-                            # 缓存结果
-                            _system_info_cache['cuda_version'] = cuda_version
-                            _cache_timestamp = current_time
-                            return cuda_version
+                            return version_match.group(1)
         
         # 如果版本信息获取失败，尝试查询GPU信息
         try:
@@ -75,33 +68,16 @@ def detect_cuda_version():
                 # 取第一行的版本号
                 first_line = gpu_output.strip().split('\n')[0]
                 if first_line and first_line != "Not Supported":
-                    cuda_version = first_line.strip()
-                    # 缓存结果
-                    _system_info_cache['cuda_version'] = cuda_version
-                    _cache_timestamp = current_time
-                    return cuda_version
+                    return first_line.strip()
         except:
             pass
     
-    # 缓存None结果
-    _system_info_cache['cuda_version'] = None
-    _cache_timestamp = current_time
     return None
 
-def get_gpu_info():
+def _probe_gpu_info():
     """获取GPU信息"""
-    global _system_info_cache, _cache_timestamp
-    
-    # 检查缓存
-    current_time = time.time()
-    if 'gpu_info' in _system_info_cache and (current_time - _cache_timestamp) < _cache_duration:
-        return _system_info_cache['gpu_info']
-    
     nvidia_smi = shutil.which("nvidia-smi")
     if not nvidia_smi:
-        # 缓存None结果
-        _system_info_cache['gpu_info'] = None
-        _cache_timestamp = current_time
         return None
     
     try:
@@ -115,92 +91,80 @@ def get_gpu_info():
                     gpu_name = parts[0].strip()
                     memory_mb = int(parts[1].strip())
                     memory_gb = memory_mb / 1024
-                    gpu_info = {
+                    return {
                         'name': gpu_name,
                         'memory_gb': memory_gb
                     }
-                    # 缓存结果
-                    _system_info_cache['gpu_info'] = gpu_info
-                    _cache_timestamp = current_time
-                    return gpu_info
     except:
         pass
     
-    # 缓存None结果
-    _system_info_cache['gpu_info'] = None
-    _cache_timestamp = current_time
     return None
 
-def get_torch_info():
+def _probe_torch_info():
     """获取PyTorch信息"""
-    global _system_info_cache, _cache_timestamp
-    
-    # 检查缓存
-    current_time = time.time()
-    if 'torch_info' in _system_info_cache and (current_time - _cache_timestamp) < _cache_duration:
-        return _system_info_cache['torch_info']
-    
     try:
-        # 使用Python环境管理器获取torch信息
+        # 环境管理器的单次探测已包含torch和CUDA信息，无需再启动解释器
         env_info = python_env_manager.get_environment_info()
         
         if env_info['torch_installed']:
-            # 使用Python环境管理器运行torch检查
-            result = python_env_manager.run_python_command([
-                "-c", "import torch; print(f'version:{torch.__version__}'); print(f'cuda_available:{torch.cuda.is_available()}'); print(f'cuda_version:{torch.version.cuda if torch.cuda.is_available() else \"N/A\"}'); print(f'gpu_count:{torch.cuda.device_count() if torch.cuda.is_available() else 0}')"
-            ])
-            
-            if result.returncode == 0:
-                lines = result.stdout.strip().split('\n')
-                info = {}
-                for line in lines:
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        if key == 'version':
-                            info['version'] = value
-                        elif key == 'cuda_available':
-                            info['cuda_available'] = value == 'True'
-                        elif key == 'cuda_version':
-                            info['cuda_version'] = value if value != 'N/A' else None
-                        elif key == 'gpu_count':
-                            info['gpu_count'] = int(value)
-                
-                # 缓存结果
-                _system_info_cache['torch_info'] = info
-                _cache_timestamp = current_time
+            info = {
+                'version': env_info['torch_version'],
+                'cuda_available': env_info['cuda_available'],
+                'cuda_version': env_info.get('torch_cuda_version'),
+                'gpu_count': env_info.get('gpu_count', 0)
+            }
+            if info['version']:
                 return info
         
-        # 缓存None结果
-        _system_info_cache['torch_info'] = None
-        _cache_timestamp = current_time
         return None
     except Exception as e:
         print(f"获取torch信息时出错: {e}")
-        # 缓存None结果
-        _system_info_cache['torch_info'] = None
-        _cache_timestamp = current_time
         return None
 
-def get_system_info():
-    """获取完整的系统信息"""
-    # 获取Python环境信息
+def _probe_python_env():
+    """获取Python解释器信息"""
     env_info = python_env_manager.get_environment_info()
-    
-    # 获取虚拟环境信息
-    virtual_env_info = get_virtual_env_info()
+    return {
+        'python_version': env_info.get('python_version', sys.version.split()[0]),
+        'python_executable': env_info.get('python_executable', sys.executable),
+    }
+
+def detect_cuda_version(wait=True):
+    """检测CUDA版本"""
+    return _probe_cache.get('cuda_version', wait)
+
+def get_gpu_info(wait=True):
+    """获取GPU信息"""
+    return _probe_cache.get('gpu_info', wait)
+
+def get_torch_info(wait=True):
+    """获取PyTorch信息"""
+    return _probe_cache.get('torch_info', wait)
+
+def get_virtual_env_info(wait=True):
+    """获取虚拟环境信息"""
+    return _probe_cache.get('virtual_env', wait)
+
+def get_system_info(wait=True):
+    """
+    获取完整的系统信息
+    已有结果时立即返回，过期的项在后台刷新；
+    wait=False 时尚未检测完成的项返回默认值
+    """
+    python_env = _probe_cache.get('python_env', wait)
     
     info = {
         'system': platform.system(),
-        'python_version': env_info.get('python_version', sys.version.split()[0]),
-        'python_executable': env_info.get('python_executable', sys.executable),
-        'virtual_env': virtual_env_info,
-        'cuda_version': detect_cuda_version(),
-        'gpu_info': get_gpu_info(),
-        'torch_info': get_torch_info()
+        'python_version': python_env['python_version'],
+        'python_executable': python_env['python_executable'],
+        'virtual_env': get_virtual_env_info(wait),
+        'cuda_version': detect_cuda_version(wait),
+        'gpu_info': get_gpu_info(wait),
+        'torch_info': get_torch_info(wait)
     }
     return info
 
-def get_virtual_env_info():
+def _probe_virtual_env():
     """获取虚拟环境信息"""
     try:
         from pathlib import Path
@@ -253,9 +217,10 @@ def get_virtual_env_info():
             'error': str(e)
         }
 
-def format_system_info():
+def format_system_info(info=None):
     """格式化系统信息为可读文本"""
-    info = get_system_info()
+    if info is None:
+        info = get_system_info()
     
     lines = []
     lines.append("=== 系统信息 ===")
@@ -312,3 +277,19 @@ def format_system_info():
         lines.append("PyTorch: 未安装")
     
     return "\n".join(lines)
+
+
+_probe_cache.register('python_env', _probe_python_env, ttl=30, default={
+    'python_version': sys.version.split()[0],
+    'python_executable': sys.executable,
+})
+_probe_cache.register('virtual_env', _probe_virtual_env, ttl=60, default={
+    'exists': False,
+    'path': None,
+    'python_exe': None,
+    'pip_exe': None,
+    'packages': []
+})
+_probe_cache.register('cuda_version', _probe_cuda_version, ttl=300)
+_probe_cache.register('gpu_info', _probe_gpu_info, ttl=300)
+_probe_cache.register('torch_info', _probe_torch_info, ttl=30)
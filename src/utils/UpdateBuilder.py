@@ -1,26 +1,167 @@
 """
 增量更新构建工具
 用于生成 update.json 文件，支持文件分块、哈希计算、版本管理
+分块方式支持固定大小分块 (fixed) 和内容定义分块 (cdc)
+打包方式支持完整复制 (copy) 和内容寻址对象存储 (store)
 """
 
 import os
 import json
 import hashlib
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
+try:
+    from src.utils.ChunkStore import ChunkStore, link_or_copy
+    from src.utils.ContentChunker import (
+        DEFAULT_AVG_SIZE, DEFAULT_MAX_FILE_SIZE, DEFAULT_MAX_SIZE, DEFAULT_MIN_SIZE,
+        chunk_params, hash_file_cdc, use_cdc
+    )
+except ImportError:
+    # 作为独立脚本运行（python3 src/utils/UpdateBuilder.py ...）时没有 src 包，从同目录导入
+    from ChunkStore import ChunkStore, link_or_copy
+    from ContentChunker import (
+        DEFAULT_AVG_SIZE, DEFAULT_MAX_FILE_SIZE, DEFAULT_MAX_SIZE, DEFAULT_MIN_SIZE,
+        chunk_params, hash_file_cdc, use_cdc
+    )
+
+# 单次读取的缓冲区大小 (1MB)，整体哈希和分块哈希共用同一次读取
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+def hash_file_single_pass(file_path: str, chunk_size: int) -> Tuple[str, List[str]]:
+    """
+    一次读取同时计算整体MD5和分块MD5
+    小于等于 chunk_size 的文件不返回分块哈希
+    放在模块级别，便于在进程池中调用
+    """
+    file_md5 = hashlib.md5()
+    chunk_hashes = []
+    chunk_md5 = hashlib.md5()
+    chunk_filled = 0
+    total = 0
+
+    with open(file_path, "rb") as f:
+        while True:
+            buf = f.read(READ_BUFFER_SIZE)
+            if not buf:
+                break
+            file_md5.update(buf)
+            total += len(buf)
+
+            view = memoryview(buf)
+            while view:
+                take = min(len(view), chunk_size - chunk_filled)
+                chunk_md5.update(view[:take])
+                chunk_filled += take
+                view = view[take:]
+                if chunk_filled == chunk_size:
+                    chunk_hashes.append(chunk_md5.hexdigest())
+                    chunk_md5 = hashlib.md5()
+                    chunk_filled = 0
+
+    if chunk_filled:
+        chunk_hashes.append(chunk_md5.hexdigest())
+    if total <= chunk_size:
+        chunk_hashes = []
+    return file_md5.hexdigest(), chunk_hashes
+
+
+class HashCache:
+    """
+    文件哈希缓存
+    以 (相对路径, 文件大小, 修改时间) 为键，未变化的文件在多次构建之间不再重新计算哈希
+    分块方式 (chunking) 也参与比较，切换分块参数后会重新计算
+    """
+
+    def __init__(self, cache_file: Path):
+        self.cache_file = Path(cache_file)
+        self.entries = self._load()
+        self.dirty = False
+
+    def _load(self) -> Dict:
+        if self.cache_file.exists():
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"加载哈希缓存失败，将重新计算: {e}")
+        return {}
+
+    def get(self, rel_path: str, size: int, mtime_ns: int, chunking: str) -> Optional[Dict]:
+        entry = self.entries.get(rel_path)
+        if (entry and entry.get("size") == size and entry.get("mtime_ns") == mtime_ns
+                and entry.get("chunking") == chunking):
+            return entry
+        return None
+
+    def put(self, rel_path: str, size: int, mtime_ns: int, chunking: str,
+            file_hash: str, chunk_hashes: List):
+        self.entries[rel_path] = {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "chunking": chunking,
+            "hash": file_hash,
+            "chunks": chunk_hashes
+        }
+        self.dirty = True
+
+    def prune(self, live_paths):
+        """移除已不存在的文件记录"""
+        stale = [p for p in self.entries if p not in live_paths]
+        for p in stale:
+            del self.entries[p]
+        if stale:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_file = self.cache_file.with_suffix(".tmp")
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+            self.dirty = False
+        except Exception as e:
+            print(f"保存哈希缓存失败: {e}")
+
 class UpdateBuilder:
     """增量更新构建器"""
     
-    def __init__(self, app_dir: str, output_dir: str = "updates"):
+    def __init__(self, app_dir: str, output_dir: str = "updates",
+                 workers: Optional[int] = None, use_cache: bool = True,
+                 chunking: str = "fixed", cdc_min_size: int = DEFAULT_MIN_SIZE,
+                 cdc_avg_size: int = DEFAULT_AVG_SIZE, cdc_max_size: int = DEFAULT_MAX_SIZE,
+                 cdc_max_file_size: Optional[int] = DEFAULT_MAX_FILE_SIZE):
         self.app_dir = Path(app_dir)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         
         # 大文件分块大小 (50MB)
         self.chunk_size = 50 * 1024 * 1024
+
+        # 分块方式：fixed 固定大小分块，cdc 内容定义分块
+        if chunking not in ("fixed", "cdc"):
+            raise ValueError(f"不支持的分块方式: {chunking}")
+        self.chunking = chunking
+        # cdc 模式下超过 cdc_max_file_size 的文件仍使用固定大小分块；安装了 numpy 时默认不限
+        self.cdc_params = chunk_params(cdc_min_size, cdc_avg_size, cdc_max_size, cdc_max_file_size)
+        if chunking == "cdc" and cdc_max_file_size is not None:
+            print(f"注意：超过 {cdc_max_file_size} 字节的文件将使用固定大小分块，"
+                  f"安装 numpy 后模型等大文件也能按内容分块")
+
+        # 内容定义分块的分块存储，跨文件、跨版本去重
+        self.chunk_store = ChunkStore(self.output_dir / "chunks") if chunking == "cdc" else None
+
+        # 哈希计算的进程数，None 表示使用CPU核数
+        self.workers = workers or os.cpu_count() or 1
+
+        # 持久化哈希缓存，未变化的文件不重复计算
+        self.hash_cache = HashCache(self.output_dir / ".hash_cache.json") if use_cache else None
         
         # 忽略的文件和目录
         self.ignore_patterns = {
@@ -47,6 +188,86 @@ class UpdateBuilder:
             print(f"计算文件哈希失败 {file_path}: {e}")
             return ""
     
+    def calculate_hashes(self, file_path: Path) -> Tuple[str, List[str]]:
+        """一次读取计算整体哈希和分块哈希，返回 (文件哈希, 分块哈希列表)"""
+        try:
+            return hash_file_single_pass(str(file_path), self.chunk_size)
+        except Exception as e:
+            print(f"计算文件哈希失败 {file_path}: {e}")
+            return "", []
+
+    def _chunking_key(self) -> str:
+        """当前分块方式的标识，用作哈希缓存的一部分"""
+        if self.chunking == "cdc":
+            p = self.cdc_params
+            return f"cdc:{p['min']}:{p['avg']}:{p['max']}:{p['max_file']}"
+        return f"fixed:{self.chunk_size}"
+
+    def _hash_job(self, file_path: Path, size: int):
+        """返回计算单个文件哈希的函数和参数"""
+        if self.chunking == "cdc" and use_cdc(size, self.cdc_params):
+            p = self.cdc_params
+            return hash_file_cdc, (str(file_path), p["min"], p["avg"], p["max"])
+        return hash_file_single_pass, (str(file_path), self.chunk_size)
+
+    def hash_files(self, entries: List[Tuple[str, Path, os.stat_result]]) -> Dict[str, Tuple[str, List]]:
+        """
+        批量计算文件哈希，优先命中缓存，其余文件分发到进程池
+        :param entries: [(相对路径, 文件路径, stat结果)]
+        :return: {相对路径: (文件哈希, 分块列表)}，cdc 模式下分块列表为 [[哈希, 长度], ...]
+        """
+        chunking_key = self._chunking_key()
+        results = {}
+        pending = []
+        for rel_path, file_path, st in entries:
+            cached = None
+            if self.hash_cache is not None:
+                cached = self.hash_cache.get(rel_path, st.st_size, st.st_mtime_ns, chunking_key)
+            if cached:
+                results[rel_path] = (cached["hash"], cached["chunks"])
+            else:
+                pending.append((rel_path, file_path, st))
+
+        if pending:
+            print(f"需要计算哈希的文件: {len(pending)}，缓存命中: {len(results)}")
+
+        computed = {}
+        if len(pending) > 1 and self.workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                    futures = {}
+                    for rel_path, file_path, st in pending:
+                        func, args = self._hash_job(file_path, st.st_size)
+                        futures[rel_path] = pool.submit(func, *args)
+                    for rel_path, future in futures.items():
+                        try:
+                            computed[rel_path] = future.result()
+                        except Exception as e:
+                            print(f"计算文件哈希失败 {rel_path}: {e}")
+                            computed[rel_path] = ("", [])
+            except Exception as e:
+                # 进程池不可用时（如受限环境）退回串行计算
+                print(f"进程池不可用，改为串行计算: {e}")
+                computed = {}
+
+        for rel_path, file_path, st in pending:
+            if rel_path not in computed:
+                try:
+                    func, args = self._hash_job(file_path, st.st_size)
+                    computed[rel_path] = func(*args)
+                except Exception as e:
+                    print(f"计算文件哈希失败 {file_path}: {e}")
+                    computed[rel_path] = ("", [])
+
+        for rel_path, file_path, st in pending:
+            file_hash, chunk_hashes = computed[rel_path]
+            if file_hash and self.hash_cache is not None:
+                self.hash_cache.put(rel_path, st.st_size, st.st_mtime_ns, chunking_key,
+                                    file_hash, chunk_hashes)
+            results[rel_path] = (file_hash, chunk_hashes)
+
+        return results
+
     def calculate_chunk_hashes(self, file_path: Path) -> List[str]:
         """计算大文件的分块哈希值"""
         chunk_hashes = []
@@ -82,6 +303,8 @@ class UpdateBuilder:
             print(f"应用目录不存在: {self.app_dir}")
             return files_info
         
+        # 先收集文件列表，再统一计算哈希
+        entries = []
         for root, dirs, files in os.walk(self.app_dir):
             # 过滤忽略的目录
             dirs[:] = [d for d in dirs if not self.should_ignore_file(Path(root) / d)]
@@ -97,31 +320,80 @@ class UpdateBuilder:
                     # 计算相对路径
                     rel_path = file_path.relative_to(self.app_dir)
                     rel_path_str = str(rel_path).replace("\\", "/")
-                    
-                    # 获取文件信息
-                    file_size = file_path.stat().st_size
-                    file_hash = self.calculate_file_hash(file_path)
-                    
-                    file_info = {
-                        "path": rel_path_str,
-                        "hash": file_hash,
-                        "size": file_size,
-                        "modified": datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
-                    }
-                    
-                    # 如果是大文件，计算分块哈希
-                    if file_size > self.chunk_size:
-                        chunk_hashes = self.calculate_chunk_hashes(file_path)
-                        if chunk_hashes:
-                            file_info["chunks"] = chunk_hashes
-                            file_info["chunk_size"] = self.chunk_size
-                    
-                    files_info.append(file_info)
-                    
+                    entries.append((rel_path_str, file_path, file_path.stat()))
                 except Exception as e:
                     print(f"处理文件失败 {file_path}: {e}")
         
+        hashes = self.hash_files(entries)
+        
+        for rel_path_str, file_path, st in entries:
+            file_hash, chunk_hashes = hashes[rel_path_str]
+            file_info = {
+                "path": rel_path_str,
+                "hash": file_hash,
+                "size": st.st_size,
+                "modified": datetime.fromtimestamp(st.st_mtime).isoformat()
+            }
+            
+            self._attach_chunks(file_info, chunk_hashes)
+            files_info.append(file_info)
+        
+        if self.hash_cache is not None:
+            self.hash_cache.prune({rel_path for rel_path, _, _ in entries} | self._cached_model_keys())
+            self.hash_cache.save()
+        
         return files_info
+
+    def _attach_chunks(self, file_info: Dict, chunk_hashes: List):
+        """把分块信息写入文件描述"""
+        if self.chunking == "cdc" and use_cdc(file_info["size"], self.cdc_params):
+            # 只有一个分块时与整体哈希等价，不再单独记录
+            if len(chunk_hashes) > 1:
+                file_info["chunking"] = "cdc"
+                file_info["chunk_params"] = dict(self.cdc_params)
+                file_info["chunks"] = [h for h, _ in chunk_hashes]
+                file_info["chunk_sizes"] = [n for _, n in chunk_hashes]
+        elif file_info["size"] > self.chunk_size and chunk_hashes:
+            # 如果是大文件，记录分块哈希
+            file_info["chunks"] = chunk_hashes
+            file_info["chunk_size"] = self.chunk_size
+
+    def export_chunks(self, files_info: List[Dict], base_dir: Optional[Path] = None) -> int:
+        """
+        把 cdc 分块写入分块存储，已存在的分块直接跳过
+        按清单记录的长度切分，不需要再次计算滚动哈希
+        :return: 新写入的分块数
+        """
+        if self.chunk_store is None:
+            return 0
+        base_dir = Path(base_dir) if base_dir else self.app_dir
+
+        written = 0
+        for file_info in files_info:
+            if file_info.get("chunking") != "cdc":
+                continue
+            if not self.chunk_store.missing(file_info["chunks"]):
+                continue
+            file_path = base_dir / file_info.get("path", file_info.get("filename", ""))
+            try:
+                with open(file_path, "rb") as f:
+                    for chunk_hash, length in zip(file_info["chunks"], file_info["chunk_sizes"]):
+                        data = f.read(length)
+                        if self.chunk_store.has(chunk_hash):
+                            continue
+                        if hashlib.md5(data).hexdigest() != chunk_hash:
+                            raise ValueError("文件在构建过程中被修改")
+                        self.chunk_store.put(data, chunk_hash)
+                        written += 1
+            except Exception as e:
+                print(f"导出分块失败 {file_path}: {e}")
+        return written
+
+    def _cached_model_keys(self):
+        """模型文件也存放在哈希缓存中，清理时保留"""
+        if self.hash_cache is None:
+            return set()
+        return {key for key in self.hash_cache.entries if key.startswith("models:")}
     
     def generate_update_json(self, version: str, changelog: str = "", 
                            previous_version: Optional[str] = None) -> Dict:
@@ -174,29 +446,70 @@ class UpdateBuilder:
             if path not in current_files:
                 deleted_files.append({"path": path})
         
+        # 旧版本已有的分块（跨文件去重），客户端可从本地旧文件中复用
+        known_chunks = set()
+        for f in previous_info["files"]:
+            known_chunks.update(f.get("chunks", []))
+        transfer_size = 0
+        for f in changed_files + new_files:
+            transfer_size += self._transfer_size(f, known_chunks)
+            known_chunks.update(f.get("chunks", []))
+        
         incremental_info = {
             "version": current_info["version"],
             "previous_version": previous_info["version"],
             "build_time": current_info["build_time"],
             "changelog": current_info["changelog"],
             "update_type": "incremental",
+            "package_mode": current_info.get("package_mode", "copy"),
             "changed_files": changed_files,
             "new_files": new_files,
             "deleted_files": deleted_files,
             "total_changes": len(changed_files) + len(new_files) + len(deleted_files),
-            "total_size": sum(f["size"] for f in changed_files + new_files)
+            "total_size": sum(f["size"] for f in changed_files + new_files),
+            "transfer_size": transfer_size
         }
         
         return incremental_info
+
+    @staticmethod
+    def _transfer_size(file_info: Dict, known_chunks: set) -> int:
+        """估算文件实际需要下载的字节数"""
+        chunks = file_info.get("chunks")
+        if not chunks:
+            return file_info["size"]
+        if file_info.get("chunking") == "cdc":
+            sizes = file_info["chunk_sizes"]
+        else:
+            chunk_size = file_info["chunk_size"]
+            sizes = [chunk_size] * (len(chunks) - 1) + [file_info["size"] - chunk_size * (len(chunks) - 1)]
+        size = 0
+        seen = set()
+        for chunk_hash, length in zip(chunks, sizes):
+            if chunk_hash not in known_chunks and chunk_hash not in seen:
+                size += length
+                seen.add(chunk_hash)
+        return size
     
     def create_update_package(self, version: str, changelog: str = "",
                             previous_version: Optional[str] = None,
-                            create_incremental: bool = True) -> Tuple[Path, Path]:
-        """创建完整的更新包"""
+                            create_incremental: bool = True,
+                            package_mode: str = "copy",
+                            link_mode: str = "auto") -> Tuple[Path, Path]:
+        """
+        创建完整的更新包
+        :param package_mode: copy 复制整个应用目录到 app_<version>；
+                             store 写入内容寻址对象存储 objects/，并生成版本清单
+        :param link_mode: store 模式下对象入库方式，auto / reflink / hardlink / copy
+        """
+        if package_mode not in ("copy", "store"):
+            raise ValueError(f"不支持的打包方式: {package_mode}")
         print(f"开始构建版本 {version} 的更新包...")
         
         # 生成当前版本信息
         current_info = self.generate_update_json(version, changelog, previous_version)
+        # 客户端据此决定从 app_<version>/ 还是 objects/ 下载文件
+        current_info["package_mode"] = package_mode
         current_json_path = self.save_update_json(current_info)
         
         # 如果是增量更新，尝试与之前版本比较
@@ -217,6 +530,15 @@ class UpdateBuilder:
                 except Exception as e:
                     print(f"生成增量更新信息失败: {e}")
         
+        # 内容定义分块模式下导出分块，客户端按分块增量下载
+        if self.chunk_store is not None:
+            written = self.export_chunks(current_info["files"])
+            print(f"新增分块: {written}，分块存储: {self.chunk_store.root}")
+        
+        if package_mode == "store":
+            self.write_object_store(version, current_info["files"], link_mode)
+            return current_json_path, incremental_json_path
+        
         # 复制应用文件到输出目录
         app_output_dir = self.output_dir / f"app_{version}"
         if app_output_dir.exists():
@@ -228,6 +550,60 @@ class UpdateBuilder:
         
         return current_json_path, incremental_json_path
     
+    def write_object_store(self, version: str, files_info: List[Dict], link_mode: str = "auto") -> Path:
+        """
+        把应用文件写入内容寻址对象存储 objects/<前两位>/<哈希>
+        已存在的对象直接跳过，新对象优先用 reflink 入库，
+        构建新版本只需要新增对象的空间和时间
+        :return: 版本清单路径 app_<version>.manifest.json
+        """
+        object_store = ChunkStore(self.output_dir / "objects")
+        stats = {}
+        for file_info in files_info:
+            if not file_info["hash"]:
+                continue
+            try:
+                method = object_store.put_file(self.app_dir / file_info["path"], file_info["hash"], link_mode)
+                stats[method] = stats.get(method, 0) + 1
+            except Exception as e:
+                print(f"写入对象失败 {file_info['path']}: {e}")
+                raise
+
+        manifest = {
+            "version": version,
+            "object_dir": "objects",
+            "files": {
+                f["path"]: {"hash": f["hash"], "size": f["size"]}
+                for f in files_info if f["hash"]
+            }
+        }
+        manifest_path = self.output_dir / f"app_{version}.manifest.json"
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+        print(f"对象存储: {object_store.root}，入库统计: {stats}")
+        print(f"版本清单已保存到: {manifest_path}")
+        return manifest_path
+
+    def checkout_version(self, version: str, target_dir: str, link_mode: str = "auto") -> Path:
+        """
+        按版本清单从对象存储还原出完整的应用目录
+        :return: 还原后的目录
+        """
+        manifest_path = self.output_dir / f"app_{version}.manifest.json"
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        object_store = ChunkStore(self.output_dir / manifest.get("object_dir", "objects"))
+        target = Path(target_dir)
+        for rel_path, info in manifest["files"].items():
+            dest = target / rel_path
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if dest.exists():
+                dest.unlink()
+            link_or_copy(str(object_store.path_for(info["hash"])), str(dest), link_mode)
+        return target
+
     def generate_model_update_info(self, models_dir: str = "models") -> Dict:
         """生成模型更新信息"""
         models_path = Path(models_dir)
@@ -235,31 +611,31 @@ class UpdateBuilder:
             return {"models": []}
         
         models_info = []
+        entries = []
         for model_file in models_path.glob("*.gguf"):
             try:
-                file_size = model_file.stat().st_size
-                file_hash = self.calculate_file_hash(model_file)
-                
-                model_info = {
-                    "name": model_file.stem,
-                    "filename": model_file.name,
-                    "size": file_size,
-                    "hash": file_hash,
-                    "modified": datetime.fromtimestamp(model_file.stat().st_mtime).isoformat()
-                }
-                
-                # 大模型文件分块
-                if file_size > self.chunk_size:
-                    chunk_hashes = self.calculate_chunk_hashes(model_file)
-                    if chunk_hashes:
-                        model_info["chunks"] = chunk_hashes
-                        model_info["chunk_size"] = self.chunk_size
-                
-                models_info.append(model_info)
-                
+                # 缓存键加前缀，避免与应用文件的相对路径冲突
+                entries.append((f"models:{model_file.resolve()}", model_file, model_file.stat()))
             except Exception as e:
                 print(f"处理模型文件失败 {model_file}: {e}")
         
+        hashes = self.hash_files(entries)
+        if self.hash_cache is not None:
+            self.hash_cache.save()
+        
+        for key, model_file, st in entries:
+            file_hash, chunk_hashes = hashes[key]
+            model_info = {
+                "name": model_file.stem,
+                "filename": model_file.name,
+                "size": st.st_size,
+                "hash": file_hash,
+                "modified": datetime.fromtimestamp(st.st_mtime).isoformat()
+            }
+            
+            self._attach_chunks(model_info, chunk_hashes)
+            models_info.append(model_info)
+        
         return {
             "models": models_info,
             "total_models": len(models_info),
@@ -277,18 +653,37 @@ def main():
     parser.add_argument("--previous", help="之前版本号")
     parser.add_argument("--output", default="updates", help="输出目录")
     parser.add_argument("--no-incremental", action="store_true", help="不生成增量更新")
+    parser.add_argument("--workers", type=int, default=None, help="计算哈希的进程数，默认使用CPU核数")
+    parser.add_argument("--no-cache", action="store_true", help="不使用哈希缓存，强制重新计算")
+    parser.add_argument("--chunking", choices=["fixed", "cdc"], default="fixed",
+                        help="分块方式：fixed 固定大小，cdc 内容定义分块")
+    parser.add_argument("--cdc-min", type=int, default=DEFAULT_MIN_SIZE, help="cdc 最小分块字节数")
+    parser.add_argument("--cdc-avg", type=int, default=DEFAULT_AVG_SIZE, help="cdc 平均分块字节数")
+    parser.add_argument("--cdc-max", type=int, default=DEFAULT_MAX_SIZE, help="cdc 最大分块字节数")
+    parser.add_argument("--cdc-max-file", type=int, default=DEFAULT_MAX_FILE_SIZE,
+                        help="超过该字节数的文件改用固定大小分块，安装了 numpy 时默认不限")
+    parser.add_argument("--package-mode", choices=["copy", "store"], default="copy",
+                        help="打包方式：copy 复制整个目录，store 写入内容寻址对象存储")
+    parser.add_argument("--link-mode", choices=["auto", "reflink", "hardlink", "copy"], default="auto",
+                        help="store 模式下对象入库与检出方式，auto 为 reflink 后回退复制；"
+                             "hardlink 让对象与应用文件共用数据，仅用于只读目录")
     
     args = parser.parse_args()
     
     # 创建构建器
-    builder = UpdateBuilder(args.app_dir, args.output)
+    builder = UpdateBuilder(args.app_dir, args.output, workers=args.workers,
+                            use_cache=not args.no_cache, chunking=args.chunking,
+                            cdc_min_size=args.cdc_min, cdc_avg_size=args.cdc_avg,
+                            cdc_max_size=args.cdc_max, cdc_max_file_size=args.cdc_max_file)
     
     # 构建更新包
     current_json, incremental_json = builder.create_update_package(
         version=args.version,
         changelog=args.changelog,
         previous_version=args.previous,
-        create_incremental=not args.no_incremental
+        create_incremental=not args.no_incremental,
+        package_mode=args.package_mode,
+        link_mode=args.link_mode
     )
     
     print(f"\n✅ 更新包构建完成!")
@@ -298,6 +693,7 @@ def main():
     
     # 生成模型更新信息
     models_info = builder.generate_model_update_info()
+    builder.export_chunks(models_info["models"], Path("models"))
     models_json_path = builder.output_dir / f"models_{args.version}.json"
     with open(models_json_path, "w", encoding="utf-8") as f:
         json.dump(models_info, f, indent=2, ensure_ascii=False)
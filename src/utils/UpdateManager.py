@@ -1,18 +1,24 @@
 """
 应用和模型更新管理器
-支持增量更新、断点续传、国内CDN加速
+支持增量更新、分块增量下载、断点续传、国内CDN加速
 """
 
 import os
 import json
+import shutil
 import zipfile
 import hashlib
 import requests
 import threading
 from pathlib import Path
 from typing import Dict, Optional, Callable
+from urllib.parse import quote
 from tqdm import tqdm
 
+from src.utils.ChunkStore import ChunkStore
+from src.utils.ContentChunker import index_local_chunks
+from src.utils.StreamingUnzip import RangeNotSupported, StreamingZipExtractor, swap_in_staging
+
 class UpdateManager:
     """更新管理器"""
     
@@ -23,6 +29,18 @@ class UpdateManager:
         self.download_progress = {}
         self.models_dir = Path("models")
         self.models_dir.mkdir(exist_ok=True)
+        # 已下载分块的本地缓存，跨文件、跨版本复用
+        self.chunk_cache_dir = Path("update_chunks")
+        self._chunk_store = None
+        # 更新包解压的暂存目录，全部解压成功后才替换到应用目录
+        self.staging_dir = Path("update_staging")
+
+    @property
+    def chunk_store(self) -> ChunkStore:
+        """本地分块缓存（首次使用时创建目录）"""
+        if self._chunk_store is None:
+            self._chunk_store = ChunkStore(self.chunk_cache_dir)
+        return self._chunk_store
     
     def _load_config(self) -> Dict:
         """加载更新配置"""
@@ -33,6 +51,8 @@ class UpdateManager:
             "update_check_interval": 3600,  # 1小时检查一次
             "auto_download": False,
             "backup_before_update": True,
+            # 本地分块缓存的大小上限（MB），更新完成后清理最久未使用的分块
+            "chunk_cache_max_mb": 1024,
             "mirror_urls": [
                 "https://mirror1.example.com/",
                 "https://mirror2.example.com/"
@@ -120,10 +140,24 @@ class UpdateManager:
                            error_callback: Optional[Callable] = None) -> bool:
         """下载应用更新"""
         def download_thread():
+            # 优先边下载边解压，服务器不支持 Range 等情况下退回先下载后解压
+            temp_file = "app_update.zip"
+            try:
+                extractor = StreamingZipExtractor(update_url, str(self.staging_dir), archive_path=temp_file)
+                extractor.run(progress_callback)
+                swap_in_staging(str(self.staging_dir), "./")
+                print("应用更新完成")
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+                if progress_callback:
+                    progress_callback("app", 100, 0, 0)
+                return
+            except Exception as e:
+                print(f"流式更新不可用，改为完整下载: {e}")
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+
             try:
-                # 创建临时文件
-                temp_file = "app_update.zip"
-                
                 # 开始下载
                 response = requests.get(update_url, stream=True)
                 response.raise_for_status()
@@ -174,13 +208,199 @@ class UpdateManager:
         """应用应用更新"""
         try:
             with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-                # 解压到当前目录，覆盖现有文件
-                zip_ref.extractall("./")
+                # 先解压到暂存目录，成功后再替换到当前目录
+                if self.staging_dir.exists():
+                    shutil.rmtree(self.staging_dir)
+                zip_ref.extractall(self.staging_dir)
+            swap_in_staging(str(self.staging_dir), "./")
             print("应用更新完成")
         except Exception as e:
             print(f"应用更新失败: {str(e)}")
             raise
     
+    def apply_incremental_update(self, update_info: Dict, base_url: str, target_dir: str = "./",
+                                 progress_callback: Optional[Callable] = None) -> bool:
+        """
+        按 UpdateBuilder 生成的 update/incremental JSON 更新文件
+        带分块信息的文件只下载本地没有的分块，其余文件整体下载
+        :param update_info: 完整或增量更新信息
+        :param base_url: 更新包发布地址（对应 UpdateBuilder 的输出目录）
+        """
+        base_url = base_url.rstrip("/")
+        target = Path(target_dir)
+        version = update_info["version"]
+        if update_info.get("update_type") == "incremental":
+            files = update_info.get("changed_files", []) + update_info.get("new_files", [])
+        else:
+            files = update_info.get("files", [])
+
+        try:
+            for i, file_info in enumerate(files):
+                local_path = target / file_info["path"]
+                if update_info.get("package_mode") == "store":
+                    file_url = f"{base_url}/objects/{ChunkStore.relative_url(file_info['hash'])}"
+                else:
+                    file_url = f"{base_url}/app_{version}/{quote(file_info['path'])}"
+
+                if local_path.exists() and self.verify_file_integrity(str(local_path), file_info["hash"]):
+                    continue
+
+                if file_info.get("chunks"):
+                    ok = self.update_file_by_chunks(file_info, local_path, base_url, file_url)
+                else:
+                    ok = self._download_whole_file(file_url, local_path, file_info["hash"])
+                if not ok:
+                    print(f"更新文件失败: {file_info['path']}")
+                    return False
+
+                if progress_callback:
+                    progress_callback("app", (i + 1) / len(files) * 100, i + 1, len(files))
+
+            for file_info in update_info.get("deleted_files", []):
+                local_path = target / file_info["path"]
+                if local_path.exists():
+                    local_path.unlink()
+
+            if self._chunk_store is not None:
+                max_bytes = int(self.update_config.get("chunk_cache_max_mb", 1024)) * 1024 * 1024
+                self.chunk_store.prune(max_bytes)
+            print("增量更新完成")
+            return True
+        except Exception as e:
+            print(f"增量更新失败: {e}")
+            return False
+
+    def update_file_by_chunks(self, file_info: Dict, local_path: Path, base_url: str,
+                              file_url: Optional[str] = None) -> bool:
+        """
+        分块更新单个文件
+        分块来源依次为：本地分块缓存、本地旧文件中相同的分块、远程下载
+        cdc 分块从 <base_url>/chunks/ 下载，固定分块通过 Range 请求从完整文件中下载
+        """
+        local_path = Path(local_path)
+        chunks = file_info["chunks"]
+        is_cdc = file_info.get("chunking") == "cdc"
+        if is_cdc:
+            sizes = file_info["chunk_sizes"]
+        else:
+            chunk_size = file_info["chunk_size"]
+            sizes = [chunk_size] * (len(chunks) - 1) + [file_info["size"] - chunk_size * (len(chunks) - 1)]
+
+        # 扫描本地旧文件中可复用的分块
+        local_index = {}
+        if local_path.exists():
+            try:
+                if is_cdc:
+                    local_index = index_local_chunks(str(local_path), file_info["chunk_params"])
+                else:
+                    local_index = self._index_fixed_chunks(local_path, file_info["chunk_size"])
+            except Exception as e:
+                print(f"扫描本地文件分块失败，将全部下载: {e}")
+
+        temp_path = local_path.with_name(local_path.name + ".part")
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        reused = downloaded = 0
+        try:
+            old_file = open(local_path, "rb") if local_index else None
+            try:
+                with open(temp_path, "wb") as out:
+                    offset = 0
+                    for chunk_hash, length in zip(chunks, sizes):
+                        data = self.chunk_store.get(chunk_hash, verify=True)
+                        if data is None and chunk_hash in local_index:
+                            old_offset, old_length = local_index[chunk_hash]
+                            old_file.seek(old_offset)
+                            data = old_file.read(old_length)
+                            if hashlib.md5(data).hexdigest() != chunk_hash:
+                                data = None
+                            else:
+                                reused += 1
+                        if data is None:
+                            if is_cdc:
+                                url = f"{base_url.rstrip('/')}/chunks/{ChunkStore.relative_url(chunk_hash)}"
+                                response = requests.get(url, timeout=30)
+                                response.raise_for_status()
+                                data = response.content
+                            else:
+                                data = self._download_range(file_url, offset, length)
+                            if hashlib.md5(data).hexdigest() != chunk_hash:
+                                raise ValueError(f"分块校验失败: {chunk_hash}")
+                            if is_cdc:
+                                self.chunk_store.put(data, chunk_hash)
+                            downloaded += 1
+                        out.write(data)
+                        offset += length
+            finally:
+                if old_file:
+                    old_file.close()
+
+            if not self.verify_file_integrity(str(temp_path), file_info["hash"]):
+                raise ValueError("文件整体校验失败")
+            os.replace(temp_path, local_path)
+            print(f"分块更新 {local_path}: 复用 {reused} 块，下载 {downloaded} 块，共 {len(chunks)} 块")
+            return True
+        except RangeNotSupported as e:
+            print(f"服务器不支持分段下载，改为整体下载 {local_path}: {e}")
+            if temp_path.exists():
+                temp_path.unlink()
+            return self._download_whole_file(file_url, local_path, file_info["hash"])
+        except Exception as e:
+            print(f"分块更新失败 {local_path}: {e}")
+            if temp_path.exists():
+                temp_path.unlink()
+            return False
+
+    @staticmethod
+    def _download_range(url: str, offset: int, length: int) -> bytes:
+        """
+        通过 Range 请求下载文件中的一段
+        服务器忽略 Range、返回 200 和完整文件时不读取正文，抛出 RangeNotSupported
+        """
+        headers = {"Range": f"bytes={offset}-{offset + length - 1}"}
+        with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            content_range = response.headers.get("content-range", "")
+            if response.status_code != 206 or not content_range.startswith(f"bytes {offset}-"):
+                raise RangeNotSupported(f"服务器未返回请求的分段: {response.status_code} {content_range}")
+            data = response.content
+        if len(data) != length:
+            raise ValueError(f"分段长度不符: 期望 {length}，实际 {len(data)}")
+        return data
+
+    def _index_fixed_chunks(self, file_path: Path, chunk_size: int) -> Dict:
+        """按固定大小切分本地文件，返回 {分块哈希: (偏移量, 长度)}"""
+        index = {}
+        offset = 0
+        with open(file_path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                index.setdefault(hashlib.md5(chunk).hexdigest(), (offset, len(chunk)))
+                offset += len(chunk)
+        return index
+
+    def _download_whole_file(self, url: str, local_path: Path, expected_hash: str) -> bool:
+        """整体下载文件，校验后替换本地文件"""
+        temp_path = local_path.with_name(local_path.name + ".part")
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with requests.get(url, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                with open(temp_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        if chunk:
+                            f.write(chunk)
+            if not self.verify_file_integrity(str(temp_path), expected_hash):
+                raise ValueError("文件校验失败")
+            os.replace(temp_path, local_path)
+            return True
+        except Exception as e:
+            print(f"下载文件失败 {url}: {e}")
+            if temp_path.exists():
+                temp_path.unlink()
+            return False
+
     def _compare_versions(self, version1: str, version2: str) -> int:
         """比较版本号，返回1表示version1>version2，-1表示version1<version2，0表示相等"""
         def version_tuple(v):